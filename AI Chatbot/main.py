@@ -32,7 +32,9 @@ class ChatBotAssistant:
         self.intents_path = intents_path
         self.documents = []
         self.vocabulary = []
+        self.word_index = {}
         self.intents = []
+        self.intent_ids = {}
         self.intents_responses = {}
         self.functional_mappings = functional_mappings
         self.X = None
@@ -45,11 +47,17 @@ class ChatBotAssistant:
         words = [lemmatizer.lemmatize(word.lower()) for word in words]
         return words
 
+    def word_columns(self, words):
+        # Columns of the known words, skipping words outside the vocabulary
+        return [self.word_index[word] for word in words if word in self.word_index]
+
     def bag_of_words(self, words):
-        return [1 if word in words else 0 for word in self.vocabulary]
+        bag = torch.zeros(len(self.vocabulary), dtype=torch.float32)
+        bag[self.word_columns(words)] = 1.0
+        return bag
 
     def intents_index(self, intent):
-        return self.intents.index(intent)
+        return self.intent_ids[intent]
 
     def parse_intents(self):
         if os.path.exists(self.intents_path):
@@ -58,7 +66,8 @@ class ChatBotAssistant:
 
             vocabulary = []
             for intent in intents_data['intents']:
-                if intent['tag'] not in self.intents:
+                if intent['tag'] not in self.intent_ids:
+                    self.intent_ids[intent['tag']] = len(self.intents)
                     self.intents.append(intent['tag'])
                     self.intents_responses[intent['tag']] = intent['responses']
                 for pattern in intent['patterns']:
@@ -66,20 +75,22 @@ class ChatBotAssistant:
                     vocabulary.extend(pattern_words)
                     self.documents.append((pattern_words, intent['tag']))
             self.vocabulary = sorted(set(vocabulary))
+            self.word_index = {word: column for column, word in enumerate(self.vocabulary)}
 
     def prepare_data(self):
-        bags = []
-        indices = []
-        for words, intent in self.documents:
-            bag = self.bag_of_words(words)
-            intent_index = self.intents_index(intent)
-            bags.append(bag)
-            indices.append(intent_index)
-        self.X = np.array(bags)
-        self.y = np.array(indices)
+        # (row, column) of every word in every document, set in one scatter
+        rows = []
+        columns = []
+        for row, (words, _) in enumerate(self.documents):
+            word_columns = self.word_columns(words)
+            rows.extend([row] * len(word_columns))
+            columns.extend(word_columns)
+        self.X = np.zeros((len(self.documents), len(self.vocabulary)), dtype=np.float32)
+        self.X[rows, columns] = 1.0
+        self.y = np.array([self.intents_index(intent) for _, intent in self.documents])
 
     def train_model(self, batch_size, lr, epochs):
-        X_tensor = torch.tensor(self.X, dtype=torch.float32)
+        X_tensor = torch.from_numpy(self.X)
         y_tensor = torch.tensor(self.y, dtype=torch.long)
         dataset = TensorDataset(X_tensor, y_tensor)
         loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
@@ -112,8 +123,7 @@ class ChatBotAssistant:
 
     def process_message(self, input_message):
         words = self.tokenizer_and_lemmatize(input_message)
-        bag = self.bag_of_words(words)
-        bag_tensor = torch.tensor([bag], dtype=torch.float32)
+        bag_tensor = self.bag_of_words(words).unsqueeze(0)
         with torch.no_grad():
             predictions = self.model(bag_tensor)
         predicted_class_index = torch.argmax(predictions, dim=1).item()
@@ -1,8 +1,9 @@
-import { useState } from "react";
+import { useState, useEffect } from "react";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
 import { Button } from "@/components/ui/button";
 import { AlertTriangle, CheckCircle, Clock, X } from "lucide-react";
+import { mlService, type Alert } from "@/services/mlService";
 
 const AlertsDashboard = () => {
   const [alerts, setAlerts] = useState([
@@ -19,6 +20,24 @@ const AlertsDashboard = () => {
     // ... more alerts
   ]);
 
+  // Live alerts pushed by the backend, keyed by id so updates replace older states
+  const [liveAlerts, setLiveAlerts] = useState<Record<string, Alert>>({});
+
+  useEffect(() => {
+    return mlService.subscribeAlerts((updates) => {
+      setLiveAlerts((prev) => {
+        const next = { ...prev };
+        updates.forEach((alert) => { next[alert.id] = alert; });
+        return next;
+      });
+    });
+  }, []);
+
+  // Newest first; an alert's lastSeen moves forward as its bucket keeps counting
+  const pushedAlerts = Object.values(liveAlerts)
+    .sort((a, b) => b.lastSeen.localeCompare(a.lastSeen))
+    .slice(0, 50);
+
   // ... rest of the component logic
 
   return (
@@ -37,6 +56,33 @@ const AlertsDashboard = () => {
           </CardDescription>
         </CardHeader>
         <CardContent>
+          <div className="space-y-3 max-h-96 overflow-y-auto">
+            {pushedAlerts.map((alert) => (
+              <div key={alert.id} className="flex items-center justify-between p-3 bg-slate-700/30 rounded-lg">
+                <div className="flex items-center space-x-3">
+                  <AlertTriangle className="h-4 w-4 text-red-400" />
+                  <div>
+                    <div className="text-sm text-white">{alert.sourceIp}</div>
+                    <div className="text-xs text-slate-400">
+                      {alert.ports.length} port(s), {alert.destIps.length} host(s) since{" "}
+                      {new Date(alert.firstSeen).toLocaleTimeString()}
+                    </div>
+                  </div>
+                </div>
+                <div className="flex items-center space-x-2">
+                  <Badge variant="destructive">{alert.modelId}</Badge>
+                  <Badge variant="secondary">{alert.count} verdicts</Badge>
+                  <Badge variant="outline">{Math.round(alert.maxConfidence * 100)}% max</Badge>
+                </div>
+              </div>
+            ))}
+            {pushedAlerts.length === 0 && (
+              <div className="text-center text-slate-400 py-8">
+                <Clock className="h-8 w-8 mx-auto mb-2 opacity-50" />
+                <p>No live alerts yet</p>
+              </div>
+            )}
+          </div>
           {/* Alert items with management buttons */}
         </CardContent>
       </Card>
@@ -0,0 +1,244 @@
+"""Alert aggregation for the CyberGuard ML API
+
+Positive verdicts are folded into one alert per (source IP, model, time
+bucket), so a flood from one source shows up as a single alert with a count
+instead of thousands of rows. Buckets stay in memory for `retention` seconds.
+When a bucket ends it is sealed: its alerts are appended to a JSON-lines log,
+and that log backs the paged history query. Subscribers (the SSE and
+WebSocket feeds) receive every new or updated alert as it happens.
+"""
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+MAX_DETAILS = 16  # Distinct destination IPs / ports listed per alert
+MAX_BUCKET_ALERTS = 10_000  # Distinct (source IP, model) alerts per bucket; verdicts past it are only counted
+
+
+def iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts).isoformat()
+
+
+def line_bucket_time(line: bytes) -> float:
+    """bucketTime of one log line, without decoding the rest of it"""
+    start = line.index(b'"bucketTime": ') + 14
+    return float(line[start:line.index(b",", start)])
+
+
+class AlertStore:
+    """In-memory time series of aggregated alerts with an append-only log behind it"""
+
+    def __init__(self, bucket_seconds: float = 60.0, retention: float = 3600.0, log_path: str = None,
+                 queue_size: int = 1000, max_bucket_alerts: int = MAX_BUCKET_ALERTS):
+        self.bucket_seconds = bucket_seconds
+        self.retention = retention
+        self.log_path = log_path
+        self.queue_size = queue_size
+        self.max_bucket_alerts = max_bucket_alerts
+        self.buckets = OrderedDict()  # bucket start -> {(source_ip, model_id): alert}, oldest first
+        # bucket start -> {model_id: verdicts dropped because the bucket was full}; spoofed
+        # source IPs can't grow a bucket without bound, but they still show up in the totals
+        self.overflow = {}
+        self.sealed_through = float("-inf")  # Start of the newest bucket already in the log
+        self.subscribers = {}  # asyncio.Queue -> the event loop that owns it
+        self.lock = threading.Lock()
+        # Sparse index of the log: byte offset of the first line of each bucket
+        self.index_times, self.index_offsets = [], []
+        self.indexed_size = 0
+        self.index_lock = threading.Lock()
+
+    def record(self, model_id: str, rows, now: float = None) -> list:
+        """Fold (source_ip, dest_ip, port, confidence) rows into the current bucket.
+
+        Returns copies of the alerts that changed, which are also pushed to subscribers.
+        """
+        with self.lock:
+            now = time.time() if now is None else now
+            start = now - now % self.bucket_seconds
+            self._roll(start)
+            bucket = self.buckets.setdefault(start, {})
+            changed = {}
+            for source_ip, dest_ip, port, confidence in rows:
+                key = (source_ip, model_id)
+                alert = bucket.get(key)
+                if alert is None:
+                    if len(bucket) >= self.max_bucket_alerts:
+                        dropped = self.overflow.setdefault(start, {})
+                        dropped[model_id] = dropped.get(model_id, 0) + 1
+                        continue
+                    alert = bucket[key] = {
+                        "id": f"{model_id}:{source_ip}:{int(start)}",
+                        "modelId": model_id,
+                        "sourceIp": source_ip,
+                        "bucketTime": start,
+                        "bucketStart": iso(start),
+                        "bucketSeconds": self.bucket_seconds,
+                        "firstSeen": iso(now),
+                        "lastSeen": iso(now),
+                        "count": 0,
+                        "maxConfidence": 0.0,
+                        "destIps": [],
+                        "ports": [],
+                    }
+                alert["count"] += 1
+                alert["lastSeen"] = iso(now)
+                alert["maxConfidence"] = max(alert["maxConfidence"], float(confidence))
+                if dest_ip not in alert["destIps"] and len(alert["destIps"]) < MAX_DETAILS:
+                    alert["destIps"].append(dest_ip)
+                if port not in alert["ports"] and len(alert["ports"]) < MAX_DETAILS:
+                    alert["ports"].append(port)
+                changed[key] = alert
+            events = [dict(alert, destIps=list(alert["destIps"]), ports=list(alert["ports"])) for alert in changed.values()]
+        self._publish(events)
+        return events
+
+    def seal(self, now: float = None):
+        """Seal every bucket that has ended; called periodically so idle buckets reach the log too"""
+        with self.lock:
+            now = time.time() if now is None else now
+            self._roll(now - now % self.bucket_seconds)
+
+    def _roll(self, current: float):
+        ended = [start for start in self.buckets if self.sealed_through < start < current]
+        if ended:
+            self._append([alert for start in ended for alert in self.buckets[start].values()])
+            self.sealed_through = ended[-1]
+        while self.buckets and next(iter(self.buckets)) < current - self.retention:
+            start, _ = self.buckets.popitem(last=False)
+            self.overflow.pop(start, None)
+
+    def _append(self, alerts: list):
+        if not self.log_path or not alerts:
+            return
+        data = "".join(json.dumps(alert) + "\n" for alert in alerts).encode()
+        # One O_APPEND write per seal keeps lines whole when several workers share the log
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def active(self, model_id: str = None, since: float = None) -> list:
+        """Alerts still held in memory, newest bucket first"""
+        with self.lock:
+            return [
+                dict(alert, destIps=list(alert["destIps"]), ports=list(alert["ports"]))
+                for start in reversed(self.buckets)
+                if since is None or start + self.bucket_seconds > since
+                for alert in self.buckets[start].values()
+                if model_id is None or alert["modelId"] == model_id
+            ]
+
+    def timeline(self, model_id: str = None) -> list:
+        """Per-bucket totals over the retention window: distinct alerting sources and positive verdicts.
+
+        dropped counts the verdicts left out of alerts (and of verdicts) because the bucket was full.
+        """
+        with self.lock:
+            series = []
+            for start, bucket in self.buckets.items():
+                alerts = [alert for alert in bucket.values() if model_id is None or alert["modelId"] == model_id]
+                dropped = self.overflow.get(start, {})
+                series.append({
+                    "bucketStart": iso(start),
+                    "alerts": len(alerts),
+                    "verdicts": sum(alert["count"] for alert in alerts),
+                    "dropped": sum(dropped.values()) if model_id is None else dropped.get(model_id, 0),
+                })
+            return series
+
+    def history(self, since: float = None, until: float = None, model_id: str = None, source_ip: str = None,
+                cursor: int = None, limit: int = 100):
+        """One page of sealed alerts from the log, oldest first.
+
+        Returns (alerts, next_cursor). next_cursor is the byte offset at which
+        the following page starts, or None once the log is exhausted. Raises
+        ValueError for a cursor that is not the start of a line in the log.
+        """
+        if not self.log_path or not os.path.exists(self.log_path):
+            return [], None
+        if cursor is None:
+            cursor = self._seek(since) if since is not None else 0
+
+        alerts = []
+        offset = cursor
+        with open(self.log_path, "rb") as f:
+            if not 0 <= cursor <= os.fstat(f.fileno()).st_size:
+                raise ValueError("cursor is outside the alert log")
+            if cursor > 0:
+                f.seek(cursor - 1)
+                if f.read(1) != b"\n":
+                    raise ValueError("cursor is not the start of an alert")
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # A write still in flight
+                if len(alerts) == limit:
+                    return alerts, offset
+                offset += len(line)
+                bucket_time = line_bucket_time(line)
+                if until is not None and bucket_time >= until + self.bucket_seconds:
+                    return alerts, None  # Past the window, allowing for workers sealing a bucket late
+                if since is not None and bucket_time + self.bucket_seconds <= since:
+                    continue
+                if until is not None and bucket_time >= until:
+                    continue
+                alert = json.loads(line)
+                if model_id is not None and alert["modelId"] != model_id:
+                    continue
+                if source_ip is not None and alert["sourceIp"] != source_ip:
+                    continue
+                alerts.append(alert)
+        return alerts, None
+
+    def _seek(self, since: float) -> int:
+        """Byte offset to start scanning from for alerts at or after `since`"""
+        with self.index_lock:
+            with open(self.log_path, "rb") as f:
+                f.seek(self.indexed_size)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    bucket_time = line_bucket_time(line)
+                    if not self.index_times or bucket_time > self.index_times[-1]:
+                        self.index_times.append(bucket_time)
+                        self.index_offsets.append(self.indexed_size)
+                    self.indexed_size += len(line)
+            # Alerts overlapping `since` start up to a bucket before it, and
+            # workers seal on their own clocks, so allow one bucket more
+            i = bisect.bisect_left(self.index_times, since - 2 * self.bucket_seconds)
+            return self.index_offsets[i] if i < len(self.index_offsets) else self.indexed_size
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue of alert events for one feed connection; call from the connection's event loop"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self.lock:
+            self.subscribers.pop(queue, None)
+
+    def _publish(self, events: list):
+        if not events:
+            return
+        with self.lock:
+            subscribers = list(self.subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, events)
+            except RuntimeError:
+                self.unsubscribe(queue)  # Its event loop has shut down
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, events: list):
+        for event in events:
+            if queue.full():
+                queue.get_nowait()  # A slow dashboard loses its oldest updates instead of growing the queue
+            queue.put_nowait(event)
@@ -0,0 +1,714 @@
+"""Throughput benchmarks for the CyberGuard ML API
+
+Run from this directory, e.g.:
+    python benchmark.py batch
+    python benchmark.py batch --model ddos-detector --sizes 1 100 10000
+    python benchmark.py coldstart
+    python benchmark.py train-latency --samples 100000
+    python benchmark.py stream --records 50000 --rate 5000
+    python benchmark.py flows --packets 2000000 --sources 300000
+    python benchmark.py compiled
+    python benchmark.py cache --distinct 500
+    python benchmark.py replay --packets 1000000
+    python benchmark.py workers --workers 1 2 4 8
+    python benchmark.py portscan --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+import main
+from replay import peak_rss_mb
+
+
+def generate_records(size: int, seed: int = 0):
+    """Random NetworkData records shaped like the dashboard's simulated traffic"""
+    rng = random.Random(seed)
+    protocols = ["TCP", "UDP", "ICMP"]
+    common_ports = [80, 443, 22, 21, 25, 53, 3389, 8080]
+    flags = ["SYN", "ACK", "FIN", "RST", "PSH", "URG"]
+    timestamp = datetime.now().isoformat()
+    return [
+        main.NetworkData(
+            timestamp=timestamp,
+            sourceIp=f"{rng.randint(1, 254)}.168.1.{rng.randint(1, 254)}",
+            destIp=f"10.0.0.{rng.randint(1, 254)}",
+            port=rng.choice(common_ports) if rng.random() > 0.3 else rng.randint(1, 65535),
+            protocol=rng.choice(protocols),
+            packetSize=rng.randint(64, 1564),
+            flags=[flag for flag in flags if rng.random() > 0.7],
+        )
+        for _ in range(size)
+    ]
+
+
+def records_per_second(func, records, repeat: int = 3) -> float:
+    """Best-of-N throughput of func(records)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(records)
+        best = min(best, time.perf_counter() - start)
+    return len(records) / best
+
+
+def bench_batch(args):
+    """Per-record predict() loop vs. the vectorized /api/batch-predict path"""
+    model_ids = [args.model] if args.model else list(main.models)
+    print(f"{'model':<20} {'batch':>8} {'loop rec/s':>12} {'batch rec/s':>12} {'speedup':>8}")
+    for model_id in model_ids:
+        for size in args.sizes:
+            records = generate_records(size)
+            # The per-record loop is slow enough that large sizes are sampled
+            loop_records = records[:args.loop_limit]
+            loop_rate = records_per_second(
+                lambda batch: [main.predict(model_id, data) for data in batch], loop_records, repeat=1
+            )
+            request = main.BatchPredictionRequest(data=records)
+            batch_rate = records_per_second(
+                lambda _: main.batch_predict(model_id, request), records, repeat=args.repeat
+            )
+            print(f"{model_id:<20} {size:>8} {loop_rate:>12.0f} {batch_rate:>12.0f} {batch_rate / loop_rate:>7.1f}x")
+
+
+def time_import(model_dir: str, retrain: bool = False) -> float:
+    """Wall time of a fresh interpreter importing main and loading its models from model_dir"""
+    env = dict(os.environ, CYBERGUARD_MODEL_DIR=model_dir, CYBERGUARD_RETRAIN="1" if retrain else "0")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main; main.load_models()"], env=env, check=True,
+                   cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True)
+    return time.perf_counter() - start
+
+
+def bench_coldstart(args):
+    """Startup time when training every model vs. loading persisted artifacts"""
+    with tempfile.TemporaryDirectory() as model_dir:
+        train_times = [time_import(model_dir, retrain=True) for _ in range(args.repeat)]
+        load_times = [time_import(model_dir) for _ in range(args.repeat)]
+    print(f"train at startup: {min(train_times):.2f}s")
+    print(f"load artifacts:   {min(load_times):.2f}s")
+
+
+def latency_percentiles(latencies):
+    ms = np.array(latencies) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def sample_predict_latency(model_id, records, until):
+    """Time single-record predict() calls until until() returns True"""
+    latencies = []
+    i = 0
+    while not until():
+        start = time.perf_counter()
+        main.predict(model_id, records[i % len(records)])
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    return latencies
+
+
+def bench_train_latency(args):
+    """Single-record predict latency before and during a background retrain"""
+    records = generate_records(1000)
+    deadline = time.perf_counter() + args.baseline_seconds
+    idle = sample_predict_latency(args.model, records, lambda: time.perf_counter() > deadline)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        main.MODEL_DIR = model_dir  # Keep benchmark artifacts out of the real registry
+        response = main.train_model(args.model, main.TrainingRequest(data=generate_records(args.samples, seed=1)))
+        job = main.training_jobs[response["jobId"]]
+        busy = sample_predict_latency(args.model, records, lambda: job["status"] not in main.ACTIVE_JOB_STATES)
+
+    print(f"job {job['id']}: {job['status']} in {job['trainTime'] or 0:.1f}s fit, {args.samples} samples")
+    for label, latencies in (("idle", idle), ("during retrain", busy)):
+        p50, p99 = latency_percentiles(latencies)
+        print(f"{label:<16} n={len(latencies):<7} p50={p50:.3f}ms p99={p99:.3f}ms")
+
+
+@contextmanager
+def local_server(port: int, workers: int = 1):
+    """Run the API under uvicorn in a subprocess for the duration of the block"""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+         "--workers", str(workers)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    try:
+        for _ in range(600):
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1)
+                break
+            except OSError:
+                time.sleep(0.1)
+        yield f"ws://127.0.0.1:{port}", server.pid
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def drive_stream(url: str, payload, rate: float, chunk: int):
+    """Push records over one WebSocket at a target rate and time each verdict"""
+    import websockets
+
+    sent_at = [0.0] * len(payload)
+    latencies = []
+
+    async with websockets.connect(url, max_size=None) as ws:
+        async def sender():
+            interval = chunk / rate if rate else 0.0
+            next_send = time.perf_counter()
+            for start in range(0, len(payload), chunk):
+                batch = payload[start:start + chunk]
+                now = time.perf_counter()
+                sent_at[start:start + len(batch)] = [now] * len(batch)
+                await ws.send(json.dumps(batch))
+                if interval:
+                    next_send += interval
+                    await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+        async def receiver():
+            while len(latencies) < len(payload):
+                verdicts = json.loads(await ws.recv())
+                now = time.perf_counter()
+                latencies.extend(now - sent_at[v["seq"]] for v in verdicts)
+
+        start = time.perf_counter()
+        await asyncio.gather(sender(), receiver())
+        elapsed = time.perf_counter() - start
+
+    return latencies, elapsed
+
+
+def bench_stream(args):
+    """Load-generate the /api/stream WebSocket endpoint and report latency and throughput"""
+    payload = [record.model_dump() for record in generate_records(args.records)]
+    query = f"?max_batch={args.max_batch}&max_latency_ms={args.max_latency_ms}"
+
+    def run(base_url):
+        url = f"{base_url}/api/stream/{args.model}{query}"
+        return asyncio.run(drive_stream(url, payload, args.rate, args.chunk))
+
+    if args.url:
+        latencies, elapsed = run(args.url)
+    else:
+        with local_server(args.port) as (base_url, _):
+            latencies, elapsed = run(base_url)
+
+    p50, p99 = latency_percentiles(latencies)
+    print(f"{len(latencies)} records in {elapsed:.2f}s -> {len(latencies) / elapsed:.0f} rec/s")
+    print(f"latency p50={p50:.1f}ms p99={p99:.1f}ms (max_batch={args.max_batch}, max_latency={args.max_latency_ms}ms)")
+
+
+def bench_flows(args):
+    """Flow engine throughput and memory ceiling with more active flows than table rows"""
+    from flows import FlowFeatureEngine
+
+    rng = np.random.default_rng(0)
+    engine = FlowFeatureEngine(max_flows=args.max_flows)
+    source_pool = [f"{a}.{b}.{c}.{d}" for a, b, c, d in rng.integers(1, 255, size=(args.sources, 4))]
+    dest_pool = [f"10.0.{c}.{d}" for c, d in rng.integers(1, 255, size=(1024, 2))]
+
+    baseline_rss = peak_rss_mb()
+    start_time = 1_700_000_000.0
+    elapsed = 0.0
+    for offset in range(0, args.packets, args.chunk):
+        n = min(args.chunk, args.packets - offset)
+        sources = [source_pool[i] for i in rng.integers(0, args.sources, n)]
+        dests = [dest_pool[i] for i in rng.integers(0, len(dest_pool), n)]
+        ports = rng.integers(1, 65536, n)
+        sizes = rng.integers(64, 1500, n)
+        syn = rng.random(n) < 0.3
+        # Simulated clock advancing at args.rate packets/sec
+        times = start_time + (offset + np.arange(n)) / args.rate
+
+        tick = time.perf_counter()
+        engine.observe(sources, dests, ports, sizes, syn, times)
+        elapsed += time.perf_counter() - tick
+
+    growth = peak_rss_mb() - baseline_rss
+    print(f"{args.packets} packets over {args.sources} sources: {args.packets / elapsed:.0f} packets/s")
+    print(f"active flows: {len(engine.sources)} sources + {len(engine.pairs)} pairs (cap {args.max_flows} each)")
+    print(f"counter arrays: {engine.nbytes / 2**20:.1f} MiB, peak RSS growth: {growth:.1f} MiB (ceiling {args.max_mb} MiB)")
+    if len(engine.sources) > args.max_flows or len(engine.pairs) > args.max_flows or growth > args.max_mb:
+        sys.exit("FAIL: flow engine exceeded its memory bounds")
+    print("OK: flow state stayed within bounds")
+
+
+def bench_compiled(args):
+    """Compare compiled backend latency with sklearn's (test_compiled.py checks they agree)"""
+    from compiled import compile_model
+
+    X_val, _ = main.get_validation_data()
+    single, batch = X_val[:1], X_val[:64]
+
+    for model_id, info in main.models.items():
+        model = info["model"]
+        compiled = compile_model(model)
+        if compiled is None:
+            print(f"{model_id:<20} no compiled backend for {type(model).__name__}")
+            continue
+
+        timings = {}
+        for name, estimator in (("sklearn", model), ("compiled", compiled)):
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                estimator.predict_proba(single)
+                latencies.append(time.perf_counter() - start)
+            batch_rate = records_per_second(estimator.predict_proba, batch, repeat=20)
+            timings[name] = (np.median(latencies) * 1e6, batch_rate)
+
+        print(f"{model_id:<20} single-row {timings['sklearn'][0]:.0f}us -> {timings['compiled'][0]:.0f}us, "
+              f"64-row batch {timings['sklearn'][1]:.0f} -> {timings['compiled'][1]:.0f} rec/s")
+
+
+def bench_cache(args):
+    """Repetitive traffic through predict/batch-predict with the verdict cache off and on"""
+    from flows import FlowFeatureEngine
+
+    rng = random.Random(1)
+    pool = generate_records(args.distinct, seed=1)
+    records = [rng.choice(pool) for _ in range(args.records)]
+    chunks = [main.BatchPredictionRequest(data=records[i:i + args.chunk]) for i in range(0, len(records), args.chunk)]
+    max_entries = main.verdict_cache.max_entries
+
+    print(f"{'model':<20} {'cache':>6} {'single us':>10} {'batch rec/s':>12} {'hit rate':>9} {'agree':>7}")
+    for model_id in [args.model] if args.model else list(main.models):
+        reference = None
+        for enabled in (False, True):
+            main.verdict_cache.max_entries = max_entries if enabled else 0
+            main.verdict_cache.invalidate(model_id, main.models[model_id]["version"])
+            main.flow_engine = FlowFeatureEngine()
+            hits, misses = main.verdict_cache.summary(model_id)["hits"], main.verdict_cache.summary(model_id)["misses"]
+
+            start = time.perf_counter()
+            verdicts = [r.prediction for chunk in chunks for r in main.batch_predict(model_id, chunk)]
+            batch_rate = len(records) / (time.perf_counter() - start)
+            latencies = []
+            for data in records[:args.single]:
+                start = time.perf_counter()
+                main.predict(model_id, data)
+                latencies.append(time.perf_counter() - start)
+
+            summary = main.verdict_cache.summary(model_id)
+            lookups = summary["hits"] - hits + summary["misses"] - misses
+            hit_rate = (summary["hits"] - hits) / lookups if lookups else 0.0
+            reference = reference or verdicts
+            agree = np.mean(np.array(verdicts) == np.array(reference))
+            print(f"{model_id:<20} {'on' if enabled else 'off':>6} {np.median(latencies) * 1e6:>10.0f} "
+                  f"{batch_rate:>12.0f} {hit_rate:>9.1%} {agree:>7.1%}")
+    main.verdict_cache.max_entries = max_entries
+
+
+SYNTHETIC_PACKET = np.dtype([
+    ("ts_sec", "<u4"), ("ts_usec", "<u4"), ("captured", "<u4"), ("size", "<u4"),
+    ("macs", "V12"), ("ethertype", ">u2"),
+    ("version_ihl", "u1"), ("tos", "u1"), ("total_length", ">u2"), ("id", ">u2"), ("fragment", ">u2"),
+    ("ttl", "u1"), ("protocol", "u1"), ("checksum", ">u2"), ("source", ">u4"), ("dest", ">u4"),
+    ("source_port", ">u2"), ("dest_port", ">u2"), ("seq", ">u4"), ("ack", ">u4"),
+    ("data_offset", "u1"), ("tcp_flags", "u1"), ("window", ">u2"), ("tcp_checksum", ">u2"), ("urgent", ">u2"),
+])
+
+
+def write_synthetic_pcap(path: str, packets: int, seed: int = 0) -> dict:
+    """Ethernet capture of TCP/UDP/ICMP packets (plus some ARP); returns the ground-truth columns"""
+    rng = np.random.default_rng(seed)
+    records = np.zeros(packets, dtype=SYNTHETIC_PACKET)
+    times = 1_700_000_000.0 + np.sort(rng.random(packets)) * packets / 50_000
+    records["ts_sec"] = times
+    records["ts_usec"] = np.round((times - records["ts_sec"]) * 1e6)
+    records["captured"] = SYNTHETIC_PACKET.itemsize - 16  # 54-byte snaplen: headers only
+    records["size"] = rng.integers(64, 1515, packets)
+    records["ethertype"] = np.where(rng.random(packets) < 0.01, 0x0806, 0x0800)
+    records["version_ihl"] = 0x45
+    records["ttl"] = 64
+    records["protocol"] = rng.choice([6, 17, 1], packets, p=[0.6, 0.3, 0.1])
+    records["source"] = rng.integers(1 << 24, 224 << 24, packets)
+    records["dest"] = rng.integers(1 << 24, 224 << 24, packets)
+    records["source_port"] = rng.integers(1024, 65536, packets)
+    records["dest_port"] = rng.integers(0, 65536, packets)
+    records["data_offset"] = 0x50
+    records["tcp_flags"] = rng.integers(0, 64, packets)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        records.tofile(f)
+
+    ipv4 = records["ethertype"] == 0x0800
+    tcp, udp = records["protocol"] == 6, records["protocol"] == 17
+    return {
+        "ipv4": np.flatnonzero(ipv4),
+        "ports": np.where(tcp | udp, records["dest_port"], 0)[ipv4],
+        "tcp_flags": np.where(tcp, records["tcp_flags"], 0)[ipv4],
+        "sizes": records["size"][ipv4],
+        "sources": records["source"][ipv4],
+    }
+
+
+def bench_replay(args):
+    """Replay tool: decode correctness on a synthetic pcap, flow-log parity, then sustained packets/sec"""
+    import replay
+    from flows import FlowFeatureEngine
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        pcap_path = os.path.join(tmp, "synthetic.pcap")
+        truth = write_synthetic_pcap(pcap_path, args.packets)
+
+        # Decoded headers must match what was written
+        positions, ports, flag_masks, sizes, sources = [], [], [], [], []
+        for _, chunk_positions, columns in replay.read_pcap(pcap_path, args.chunk):
+            positions.append(chunk_positions)
+            ports.append(columns["ports"])
+            flag_masks.append(columns["flag_masks"])
+            sizes.append(columns["packet_sizes"])
+            sources.extend(columns["source_keys"])
+        decoded = (
+            np.array_equal(np.concatenate(positions), truth["ipv4"])
+            and np.array_equal(np.concatenate(ports), truth["ports"])
+            and np.array_equal(np.concatenate(flag_masks), replay.TCP_FLAG_MASKS[truth["tcp_flags"]])
+            and np.array_equal(np.concatenate(sizes), truth["sizes"])
+            and np.array_equal(np.array(sources, dtype=np.uint32), truth["sources"])
+        )
+        failed |= not decoded
+        print(f"pcap decode matches ground truth: {decoded}")
+
+        # A flow log must featurize exactly like the API's NetworkData path
+        records = generate_records(2000, seed=3)
+        log_path = os.path.join(tmp, "flows.ndjson")
+        with open(log_path, "w") as f:
+            for record in records:
+                f.write(record.model_dump_json() + "\n")
+        X_api, _ = main.extract_features_batch(records, flows=FlowFeatureEngine(), record_times=True)
+        _, _, columns = next(replay.read_flow_log(log_path, len(records), rate=1.0))
+        X_log = main.fill_features(np.empty_like(X_api), flows=FlowFeatureEngine(), **columns)
+        parity = np.array_equal(X_api, X_log)
+        failed |= not parity
+        print(f"flow-log features match the API path: {parity}")
+
+        stats = replay.replay(pcap_path, None if args.discard else os.path.join(tmp, "verdicts.csv"), args.chunk, args.models)
+        timings = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stats["timings"].items())
+        print(f"{stats['packets']} packets in {stats['seconds']:.2f}s: {stats['packetsPerSecond']:.0f} packets/s ({timings})")
+        print(f"peak RSS {stats['peakRssMb']:.0f} MiB (+{stats['peakRssGrowthMb']:.0f} MiB during replay)")
+
+    if failed:
+        sys.exit("FAIL: replay decoded packets incorrectly")
+
+
+def worker_pids(pid: int) -> list:
+    """uvicorn worker processes under a server pid (the server itself when it runs one worker)"""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return [pid]
+    workers = []
+    for child in children:
+        with open(f"/proc/{child}/cmdline", "rb") as f:
+            if b"spawn_main" in f.read():
+                workers.append(child)
+    return workers or [pid]
+
+
+def process_memory_mb(pid: int) -> dict:
+    """RSS, proportional set size and private memory of a process (Linux smaps_rollup)"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if rest.strip().endswith("kB"):
+                fields[name] = int(rest.split()[0]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def http_json(url: str, payload=None, method: str = None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+def bench_workers(args):
+    """Per-worker memory and batch-predict throughput as uvicorn workers are added, plus cross-worker reload"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    if sys.platform != "linux":
+        sys.exit("workers benchmark reads /proc and needs Linux")
+    payload = {"data": [record.model_dump() for record in generate_records(args.batch)]}
+    os.environ["CYBERGUARD_RELOAD_SECONDS"] = "1"
+    print(f"{os.cpu_count()} CPU(s); {args.batch}-record batches to {args.model}")
+    print(f"{'workers':>7} {'clients':>7} {'rec/s':>9} {'RSS MiB':>8} {'PSS MiB':>8} {'private MiB':>11}")
+
+    for workers in args.workers:
+        with local_server(args.port, workers) as (base_url, pid):
+            url = base_url.replace("ws://", "http://")
+            for _ in range(600):  # Every worker has to be up, not just the first
+                if len(worker_pids(pid)) == workers:
+                    break
+                time.sleep(0.1)
+            for _ in range(4 * workers):
+                http_json(f"{url}/api/batch-predict/{args.model}", payload)
+
+            clients = args.clients or 2 * workers
+
+            def client(_):
+                count = 0
+                deadline = time.perf_counter() + args.seconds
+                while time.perf_counter() < deadline:
+                    http_json(f"{url}/api/batch-predict/{args.model}", payload)
+                    count += 1
+                return count
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(clients) as pool:
+                batches = sum(pool.map(client, range(clients)))
+            rate = batches * args.batch / (time.perf_counter() - start)
+
+            memory = [process_memory_mb(worker) for worker in worker_pids(pid)]
+            mean = {key: np.mean([m[key] for m in memory]) for key in memory[0]}
+            print(f"{workers:>7} {clients:>7} {rate:>9.0f} {mean['rss']:>8.0f} {mean['pss']:>8.0f} {mean['private']:>11.0f}")
+
+            if args.check_reload and workers > 1:
+                # Retrain through whichever worker answers, then wait for every worker to serve it
+                records = generate_records(200, seed=9)
+                before = max(m["version"] for m in http_json(f"{url}/api/models") if m["id"] == args.model)
+                http_json(f"{url}/api/train/{args.model}", {
+                    "data": [record.model_dump() for record in records],
+                    "labels": [i % 2 for i in range(len(records))],
+                })
+                versions = set()
+                deadline = time.perf_counter() + 120
+                while time.perf_counter() < deadline:
+                    served = [http_json(f"{url}/api/models") for _ in range(10 * workers)]
+                    versions = {m["version"] for response in served for m in response if m["id"] == args.model}
+                    if len(versions) == 1 and max(versions) > before:
+                        break
+                    time.sleep(0.5)
+                print(f"        reload: all workers serve {args.model} v{max(versions)}"
+                      if len(versions) == 1 and max(versions) > before else f"        reload: workers still disagree on versions {sorted(versions)}")
+
+
+def bench_portscan(args):
+    """Port-scan models: train time, accuracy and predict latency, SVC vs. kernel SGD (fit and streamed partial_fit)"""
+    from sklearn.svm import SVC
+    from estimators import KernelSGDClassifier
+
+    X_test, y_test = main.generate_training_data(20_000, seed=11)
+    single = X_test[:1]
+    print(f"{'rows':>8} {'model':<18} {'train s':>9} {'accuracy':>9} {'single us':>10} {'10k-batch rec/s':>16}")
+    for size in args.sizes:
+        X, y = main.generate_training_data(size)
+
+        def streamed():
+            model = KernelSGDClassifier(random_state=42)
+            for start in range(0, size, args.stream_batch):
+                model.partial_fit(X[start:start + args.stream_batch], y[start:start + args.stream_batch], classes=[0.0, 1.0])
+            return model
+
+        candidates = [
+            ("svc", lambda: SVC(probability=True, random_state=42).fit(X, y)),
+            ("kernel-sgd", lambda: KernelSGDClassifier(random_state=42).fit(X, y)),
+            ("kernel-sgd stream", streamed),
+        ]
+        for name, train in candidates:
+            if name == "svc" and size > args.svc_max_rows:
+                print(f"{size:>8} {name:<18} {'skipped (quadratic; raise --svc-max-rows to run)':>48}")
+                continue
+            start = time.perf_counter()
+            model = train()
+            train_seconds = time.perf_counter() - start
+            accuracy = np.mean(model.predict(X_test) == y_test)
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                model.predict_proba(single)
+                latencies.append(time.perf_counter() - start)
+            batch_rate = records_per_second(model.predict_proba, X_test[:10_000], repeat=3)
+            print(f"{size:>8} {name:<18} {train_seconds:>9.2f} {accuracy:>9.4f} {np.median(latencies) * 1e6:>10.0f} {batch_rate:>16.0f}")
+
+
+def bench_online(args):
+    """Online learning: per-batch update latency and accuracy vs. a full refit, with and without reservoir replay"""
+    from sklearn.base import clone
+    from training import Reservoir, fit_estimator, online_update
+
+    X_seed, y_seed = main.generate_training_data(args.seed_rows)
+    X_stream, y_stream = main.generate_training_data(args.batches * args.batch, seed=7)
+    X_test, y_test = main.generate_training_data(5_000, seed=11)
+    model_ids = args.models or list(main.models)
+    print(f"{'model':<20} {'mode':<14} {'median ms':>10} {'p95 ms':>8} {'accuracy':>9}")
+    for model_id in model_ids:
+        base, _ = fit_estimator(model_id, clone(main.models[model_id]["model"]), X_seed, y_seed)
+
+        def accuracy(model):
+            if model_id == "anomaly-detector":
+                return float("nan")  # Unsupervised, no labels to score against
+            return np.mean(model.predict(X_test) == y_test)
+
+        for mode, replay in (("online", args.replay), ("online/no-rsv", 0)):
+            model = base
+            reservoir = Reservoir(args.reservoir, X_seed.shape[1])
+            reservoir.add(X_seed, y_seed)
+            latencies = []
+            for start in range(0, len(X_stream), args.batch):
+                rows = slice(start, start + args.batch)
+                if replay == 0:
+                    reservoir = Reservoir(args.reservoir, X_seed.shape[1])  # Nothing to replay
+                model, seconds = online_update(model_id, model, X_stream[rows], y_stream[rows], reservoir, replay)
+                latencies.append(seconds)
+            print(f"{model_id:<20} {mode:<14} {np.median(latencies) * 1e3:>10.1f} "
+                  f"{np.percentile(latencies, 95) * 1e3:>8.1f} {accuracy(model):>9.4f}")
+
+        X_all, y_all = np.vstack([X_seed, X_stream]), np.concatenate([y_seed, y_stream])
+        refit, seconds = fit_estimator(model_id, clone(base), X_all, y_all)
+        print(f"{model_id:<20} {'full refit':<14} {seconds * 1e3:>10.1f} {'':>8} {accuracy(refit):>9.4f}")
+
+
+def bench_alerts(args):
+    """Alert store: aggregation throughput and history page latency, seeking by time vs. scanning the log"""
+    from alerts import AlertStore
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = AlertStore(bucket_seconds=60.0, retention=3600.0, log_path=os.path.join(tmp, "alerts.jsonl"))
+        sources = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(args.sources)]
+        start_time = 1_700_000_000.0
+        seconds_per_batch = args.hours * 3600.0 / (args.verdicts // args.batch)
+        elapsed = 0.0
+        for b in range(args.verdicts // args.batch):
+            rows = [(sources[i], "192.168.1.10", 443, 0.9) for i in rng.integers(0, args.sources, args.batch)]
+            started = time.perf_counter()
+            store.record("ddos-detector", rows, now=start_time + b * seconds_per_batch)
+            elapsed += time.perf_counter() - started
+        store.seal(now=start_time + args.hours * 3600.0 + 60.0)
+        log_mb = os.path.getsize(store.log_path) / 2 ** 20
+        print(f"aggregated {args.verdicts} verdicts at {args.verdicts / elapsed:,.0f}/s into "
+              f"{sum(1 for _ in open(store.log_path))} alerts ({log_mb:.1f} MiB log)")
+
+        since = start_time + args.hours * 3600.0 - 600.0  # Last 10 minutes
+        for name in ("seek (builds index)", "seek", "scan"):
+            started = time.perf_counter()
+            if name == "scan":  # What the query costs without the index: filter every line
+                alerts, cursor = store.history(limit=args.limit)
+                while cursor is not None and (not alerts or alerts[-1]["bucketTime"] < since - 60.0):
+                    alerts, cursor = store.history(cursor=cursor, limit=args.limit)
+            else:
+                store.history(since=since, limit=args.limit)
+            print(f"history page (limit {args.limit}, last 10 min) by {name}: {(time.perf_counter() - started) * 1e3:.1f} ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help=bench_batch.__doc__)
+    batch.add_argument("--model", choices=list(main.models), help="Benchmark a single model")
+    batch.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10_000, 100_000])
+    batch.add_argument("--loop-limit", type=int, default=1000, help="Max records timed through the per-record loop")
+    batch.add_argument("--repeat", type=int, default=3)
+    batch.set_defaults(func=bench_batch)
+
+    coldstart = subparsers.add_parser("coldstart", help=bench_coldstart.__doc__)
+    coldstart.add_argument("--repeat", type=int, default=3)
+    coldstart.set_defaults(func=bench_coldstart)
+
+    train_latency = subparsers.add_parser("train-latency", help=bench_train_latency.__doc__)
+    train_latency.add_argument("--model", choices=list(main.models), default="ddos-detector")
+    train_latency.add_argument("--samples", type=int, default=100_000)
+    train_latency.add_argument("--baseline-seconds", type=float, default=5.0)
+    train_latency.set_defaults(func=bench_train_latency)
+
+    stream = subparsers.add_parser("stream", help=bench_stream.__doc__)
+    stream.add_argument("--model", choices=list(main.models), default="ddos-detector")
+    stream.add_argument("--records", type=int, default=50_000)
+    stream.add_argument("--rate", type=float, default=0, help="Target records/sec (0 = as fast as possible)")
+    stream.add_argument("--chunk", type=int, default=100, help="Records per WebSocket message")
+    stream.add_argument("--max-batch", type=int, default=main.STREAM_MAX_BATCH)
+    stream.add_argument("--max-latency-ms", type=float, default=main.STREAM_MAX_LATENCY_MS)
+    stream.add_argument("--url", help="Existing server, e.g. ws://localhost:8000 (default: start one)")
+    stream.add_argument("--port", type=int, default=8765)
+    stream.set_defaults(func=bench_stream)
+
+    flows = subparsers.add_parser("flows", help=bench_flows.__doc__)
+    flows.add_argument("--packets", type=int, default=2_000_000)
+    flows.add_argument("--sources", type=int, default=300_000, help="Distinct source IPs in the traffic")
+    flows.add_argument("--max-flows", type=int, default=131_072, help="Rows per flow table")
+    flows.add_argument("--chunk", type=int, default=10_000, help="Packets per observe() call")
+    flows.add_argument("--rate", type=float, default=50_000, help="Simulated packets/sec for the flow clock")
+    flows.add_argument("--max-mb", type=float, default=512, help="Fail if peak RSS grows by more than this")
+    flows.set_defaults(func=bench_flows)
+
+    compiled = subparsers.add_parser("compiled", help=bench_compiled.__doc__)
+    compiled.add_argument("--repeat", type=int, default=200)
+    compiled.set_defaults(func=bench_compiled)
+
+    cache = subparsers.add_parser("cache", help=bench_cache.__doc__)
+    cache.add_argument("--model", choices=list(main.models))
+    cache.add_argument("--distinct", type=int, default=500, help="Distinct records the traffic is drawn from")
+    cache.add_argument("--records", type=int, default=20_000)
+    cache.add_argument("--chunk", type=int, default=100, help="Records per batch-predict call")
+    cache.add_argument("--single", type=int, default=500, help="Records timed through predict()")
+    cache.set_defaults(func=bench_cache)
+
+    replay = subparsers.add_parser("replay", help=bench_replay.__doc__)
+    replay.add_argument("--packets", type=int, default=1_000_000)
+    replay.add_argument("--chunk", type=int, default=65_536)
+    replay.add_argument("--models", nargs="+", choices=list(main.models), help="Detectors to run (default: all trained)")
+    replay.add_argument("--discard", action="store_true", help="Skip writing the verdict CSV")
+    replay.set_defaults(func=bench_replay)
+
+    workers = subparsers.add_parser("workers", help=bench_workers.__doc__)
+    workers.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    workers.add_argument("--model", choices=list(main.models), default="ddos-detector")
+    workers.add_argument("--batch", type=int, default=100, help="Records per batch-predict request")
+    workers.add_argument("--clients", type=int, default=0, help="Concurrent clients (default: 2 per worker)")
+    workers.add_argument("--seconds", type=float, default=10.0)
+    workers.add_argument("--check-reload", action="store_true", help="Retrain via one worker and wait for all to serve it")
+    workers.add_argument("--port", type=int, default=8766)
+    workers.set_defaults(func=bench_workers)
+
+    portscan = subparsers.add_parser("portscan", help=bench_portscan.__doc__)
+    portscan.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    portscan.add_argument("--svc-max-rows", type=int, default=20_000, help="Largest training set SVC is timed on")
+    portscan.add_argument("--stream-batch", type=int, default=10_000, help="Rows per partial_fit call")
+    portscan.add_argument("--repeat", type=int, default=200)
+    portscan.set_defaults(func=bench_portscan)
+
+    online = subparsers.add_parser("online", help=bench_online.__doc__)
+    online.add_argument("--models", nargs="+", choices=list(main.models))
+    online.add_argument("--seed-rows", type=int, default=2_000, help="Rows the starting model is fitted on")
+    online.add_argument("--batch", type=int, default=200, help="Labelled rows per update")
+    online.add_argument("--batches", type=int, default=50)
+    online.add_argument("--replay", type=int, default=1_000, help="Reservoir rows replayed per update")
+    online.add_argument("--reservoir", type=int, default=10_000)
+    online.set_defaults(func=bench_online)
+
+    alerts = subparsers.add_parser("alerts", help=bench_alerts.__doc__)
+    alerts.add_argument("--verdicts", type=int, default=2_000_000, help="Positive verdicts to aggregate")
+    alerts.add_argument("--batch", type=int, default=1_000)
+    alerts.add_argument("--sources", type=int, default=5_000, help="Distinct source IPs")
+    alerts.add_argument("--hours", type=float, default=1.0, help="Span of time the verdicts are spread over")
+    alerts.add_argument("--limit", type=int, default=100)
+    alerts.set_defaults(func=bench_alerts)
+
+    args = parser.parse_args()
+    main.load_models()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main_cli()
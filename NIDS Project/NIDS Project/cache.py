@@ -0,0 +1,115 @@
+"""Verdict cache for the CyberGuard ML API
+
+Production traffic repeats the same port/protocol/size/flags/subnet mix over
+and over, so verdicts are memoized per model version under a quantized
+feature vector. Each model gets its own bounded LRU with a TTL; a retrain
+swaps in a new version and drops the model's entries wholesale.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class VerdictCache:
+    """Bounded LRU/TTL cache of (prediction, confidence) per quantized feature vector.
+
+    steps[j] is the number of grid cells feature j's [0, 1] range is cut into;
+    rows that round to the same cells share one cached verdict.
+    """
+
+    def __init__(self, steps, max_entries: int = 65_536, ttl: float = 300.0):
+        self.steps = np.asarray(steps, dtype=np.float64)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.partitions = {}  # model_id -> {"version", "entries": OrderedDict, "hits", "misses"}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def keys(self, X: np.ndarray) -> list:
+        """One hashable key per row: the raw bytes of its quantized feature vector"""
+        quantized = np.ascontiguousarray(np.rint(X * self.steps), dtype=np.int32)
+        return quantized.view(np.dtype((np.void, quantized.shape[1] * 4))).ravel().tolist()
+
+    def invalidate(self, model_id: str, version):
+        """Drop a model's entries and accept only verdicts from `version` from now on"""
+        with self.lock:
+            part = self.partitions.get(model_id)
+            if part is None:
+                self.partitions[model_id] = {"version": version, "entries": OrderedDict(), "hits": 0, "misses": 0}
+            else:
+                part.update(version=version, entries=OrderedDict())
+
+    def score(self, model_id: str, version, X: np.ndarray, predict):
+        """(predictions, confidences) for X, calling predict(X_subset) only for
+        rows whose quantized vector is not cached, and once per distinct vector
+        """
+        n = len(X)
+        keys = self.keys(X)
+        predictions = np.empty(n, dtype=np.int64)
+        confidences = np.empty(n, dtype=np.float64)
+        missing = []
+        now = time.monotonic()
+
+        with self.lock:
+            part = self.partitions.get(model_id)
+            if part is None:
+                part = self.partitions[model_id] = {"version": version, "entries": OrderedDict(), "hits": 0, "misses": 0}
+            # A request still holding a replaced model version bypasses the cache
+            entries = part["entries"] if part["version"] == version else {}
+            for row, key in enumerate(keys):
+                entry = entries.get(key)
+                if entry is not None and entry[0] > now:
+                    entries.move_to_end(key)
+                    predictions[row], confidences[row] = entry[1], entry[2]
+                else:
+                    missing.append(row)
+            part["hits"] += n - len(missing)
+            part["misses"] += len(missing)
+
+        if not missing:
+            return predictions, confidences
+
+        # Score each distinct uncached vector once
+        first = {}
+        for row in missing:
+            first.setdefault(keys[row], row)
+        distinct = np.fromiter(first.values(), dtype=np.int64, count=len(first))
+        new_predictions, new_confidences = predict(X[distinct])
+        new_predictions = np.asarray(new_predictions).astype(np.int64)
+        new_confidences = np.asarray(new_confidences, dtype=np.float64)
+
+        position = {key: i for i, key in enumerate(first)}
+        source = np.fromiter((position[keys[row]] for row in missing), dtype=np.int64, count=len(missing))
+        predictions[missing] = new_predictions[source]
+        confidences[missing] = new_confidences[source]
+
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            part = self.partitions[model_id]
+            if part["version"] == version:
+                entries = part["entries"]
+                for key, prediction, confidence in zip(first, new_predictions.tolist(), new_confidences.tolist()):
+                    entries[key] = (expires, prediction, confidence)
+                    entries.move_to_end(key)
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+        return predictions, confidences
+
+    def summary(self, model_id: str) -> dict:
+        with self.lock:
+            part = self.partitions.get(model_id)
+            hits, misses = (part["hits"], part["misses"]) if part else (0, 0)
+            size = len(part["entries"]) if part else 0
+        return {
+            "enabled": self.enabled,
+            "entries": size,
+            "maxEntries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hitRate": hits / (hits + misses) if hits + misses else 0.0,
+        }
@@ -0,0 +1,153 @@
+"""Compiled inference for the CyberGuard ML API
+
+Fitted RandomForest and MLP classifiers are exported to flat NumPy arrays and
+evaluated without sklearn's per-call validation and dispatch overhead.
+Predictions and probabilities are identical to the source estimator's.
+"""
+import numpy as np
+from scipy.special import expit
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.neural_network import MLPClassifier
+
+
+class CompiledForest:
+    """All trees of a fitted RandomForestClassifier in one flat node table.
+
+    Samples descend every tree at once, one level per step. Leaves point to
+    themselves with a +inf threshold, so finished samples just stay put.
+    That wins on small batches; past max_rows sklearn's Cython traversal is
+    faster, so larger batches are handed back to the forest itself.
+    """
+
+    def __init__(self, forest: RandomForestClassifier, max_rows: int = 64, previous: "CompiledForest" = None):
+        self.forest = forest
+        self.max_rows = max_rows
+        # Trees already compiled for previous (an online update shares most of them) are reused
+        known = previous.blocks if previous is not None else {}
+        self.blocks = {estimator: known.get(estimator) or self.compile_tree(estimator.tree_, forest.n_classes_)
+                       for estimator in forest.estimators_}
+        blocks = list(self.blocks.values())
+        sizes = [len(block[0]) for block in blocks]
+        offsets = np.cumsum([0] + sizes)
+
+        self.classes_ = forest.classes_
+        self.n_features_in_ = forest.n_features_in_
+        self.roots = offsets[:-1].astype(np.intp)
+        self.depth = max(estimator.tree_.max_depth for estimator in forest.estimators_)
+        self.feature = np.concatenate([block[0] for block in blocks])
+        self.threshold = np.concatenate([block[1] for block in blocks])
+        self.left = np.concatenate([block[2] + offset for block, offset in zip(blocks, offsets)])
+        self.right = np.concatenate([block[3] + offset for block, offset in zip(blocks, offsets)])
+        self.value = np.concatenate([block[4] for block in blocks])
+
+    @staticmethod
+    def compile_tree(tree, n_classes: int):
+        """(feature, threshold, left, right, value) node arrays of one tree, children indexed from its root"""
+        own = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+        # Same per-node normalization as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :n_classes].astype(np.float64)
+        normalizer = value.sum(axis=1)
+        normalizer[normalizer == 0.0] = 1.0
+        return (
+            np.where(leaf, 0, tree.feature).astype(np.intp),
+            np.where(leaf, np.inf, tree.threshold),
+            np.where(leaf, own, tree.children_left).astype(np.intp),
+            np.where(leaf, own, tree.children_right).astype(np.intp),
+            value / normalizer[:, None],
+        )
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Leaf index of every sample in every tree, shape (n_samples, n_trees)"""
+        # Trees split on float32 inputs, exactly as sklearn validates them
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        if len(X) > self.max_rows:
+            return self.forest.predict_proba(X)
+        # Reducing over the (non-contiguous) tree axis accumulates tree by tree,
+        # matching the forest's sequential `+=`
+        proba = self.value[self.apply(X)].sum(axis=1)
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def softmax(x):
+    x -= x.max(axis=1)[:, None]
+    np.exp(x, out=x)
+    x /= x.sum(axis=1)[:, None]
+    return x
+
+
+HIDDEN_ACTIVATIONS = {
+    "relu": relu,
+    "tanh": lambda x: np.tanh(x, out=x),
+    "logistic": lambda x: expit(x, out=x),
+    "identity": lambda x: x,
+}
+
+
+class CompiledMLP:
+    """A fitted MLPClassifier as plain matmuls, mirroring its forward pass op for op"""
+
+    def __init__(self, mlp: MLPClassifier):
+        self.classes_ = mlp.classes_
+        self.n_features_in_ = mlp.n_features_in_
+        self.coefs = [np.ascontiguousarray(c) for c in mlp.coefs_]
+        self.intercepts = [np.ascontiguousarray(b) for b in mlp.intercepts_]
+        self.hidden = HIDDEN_ACTIVATIONS[mlp.activation]
+        self.output = mlp.out_activation_
+
+    def forward(self, X: np.ndarray) -> np.ndarray:
+        activation = np.asarray(X, dtype=self.coefs[0].dtype)
+        last = len(self.coefs) - 1
+        for i, (coef, intercept) in enumerate(zip(self.coefs, self.intercepts)):
+            activation = activation @ coef
+            activation += intercept
+            if i != last:
+                activation = self.hidden(activation)
+        if self.output == "logistic":
+            return expit(activation, out=activation)
+        if self.output == "softmax":
+            return softmax(activation)
+        return activation
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        y_pred = self.forward(X)
+        if y_pred.shape[1] == 1:
+            y_pred = y_pred.ravel()
+            return np.vstack([1 - y_pred, y_pred]).T
+        return y_pred
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        y_pred = self.forward(X)
+        if y_pred.shape[1] == 1:
+            # LabelBinarizer's binary threshold
+            return self.classes_[(y_pred.ravel() > 0.5).astype(np.intp)]
+        return self.classes_.take(np.argmax(y_pred, axis=1), axis=0)
+
+
+def compile_model(model, previous=None):
+    """Compiled counterpart of a fitted estimator, or None if it has no compiled form.
+
+    previous, the compiled form of an earlier version of the model, lets a
+    forest reuse the trees the two versions share.
+    """
+    if isinstance(model, RandomForestClassifier):
+        return CompiledForest(model, previous=previous if isinstance(previous, CompiledForest) else None)
+    if isinstance(model, MLPClassifier) and model.out_activation_ in ("logistic", "softmax"):
+        return CompiledMLP(model)
+    return None
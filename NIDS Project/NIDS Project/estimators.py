@@ -0,0 +1,113 @@
+"""Custom estimators for the CyberGuard ML API
+
+Kept free of app imports (like training.py) so training worker processes and
+joblib can unpickle them without re-running the API's startup.
+"""
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.utils import check_random_state
+
+
+class KernelSGDClassifier(ClassifierMixin, BaseEstimator):
+    """RBF-kernel classifier that trains in linear time and learns incrementally.
+
+    A Nystroem map over n_components landmark rows (drawn from the first
+    batch) approximates the RBF kernel an SVC would use, and a logistic-loss
+    SGD model is fitted on top with partial_fit, so cost grows linearly with
+    the data instead of quadratically. Probabilities come from
+    Platt scaling (binary problems) fitted on a held-out window of the latest
+    calibration_size rows. partial_fit refits it only once recalibrate_every
+    more rows have been held out, so a stream of small batches does not pay
+    for calibration on every call.
+
+    The defaults match SVC's held-out accuracy on the synthetic training data.
+    Random Fourier features, which need no landmarks, fell 1-2 points short
+    even at 2048 components.
+    """
+
+    def __init__(self, n_components: int = 512, gamma: float = 0.5, alpha: float = 1e-5, max_iter: int = 5,
+                 batch_size: int = 10_000, calibration_fraction: float = 0.1, calibration_size: int = 2_000,
+                 recalibrate_every: int = 500, random_state=None):
+        self.n_components = n_components
+        self.gamma = gamma
+        self.alpha = alpha
+        self.max_iter = max_iter
+        self.batch_size = batch_size
+        self.calibration_fraction = calibration_fraction
+        self.calibration_size = calibration_size
+        self.recalibrate_every = recalibrate_every
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        """Fresh model: max_iter shuffled passes of partial_fit over batch_size chunks"""
+        X, y = np.asarray(X, dtype=np.float64), np.asarray(y)
+        for attr in ("features_", "sgd_", "calibrator_", "holdout_X_", "holdout_y_"):
+            self.__dict__.pop(attr, None)
+        # Seeded once per fit and carried into later partial_fit calls
+        rng = self._rng_ = check_random_state(self.random_state)
+        classes = np.unique(y)
+        # Hold the calibration rows out once, so no epoch ever trains on them
+        held_out = rng.random_sample(len(X)) < self.calibration_fraction
+        self._hold_out(X[held_out], y[held_out])
+        train = np.flatnonzero(~held_out)
+        for _ in range(self.max_iter):
+            order = rng.permutation(train)
+            for start in range(0, len(order), self.batch_size):
+                rows = order[start:start + self.batch_size]
+                self._partial_fit(X[rows], y[rows], classes)
+        self._calibrate()
+        return self
+
+    def partial_fit(self, X, y, classes=None):
+        """Update the model with one streamed batch; a calibration_fraction of it is held out"""
+        X, y = np.asarray(X, dtype=np.float64), np.asarray(y)
+        if not hasattr(self, "_rng_"):
+            self._rng_ = check_random_state(self.random_state)
+        held_out = self._rng_.random_sample(len(X)) < self.calibration_fraction
+        self._hold_out(X[held_out], y[held_out])
+        self._partial_fit(X[~held_out], y[~held_out], classes if classes is not None else np.unique(y))
+        if not hasattr(self, "calibrator_") or self.held_out_since_ >= self.recalibrate_every:
+            self._calibrate()
+        return self
+
+    def _partial_fit(self, X, y, classes):
+        if not hasattr(self, "features_"):
+            self.features_ = Nystroem(gamma=self.gamma, n_components=min(self.n_components, len(X)),
+                                      random_state=self.random_state).fit(X)
+            self.sgd_ = SGDClassifier(loss="log_loss", alpha=self.alpha, average=True, random_state=self.random_state)
+            self.classes_ = np.asarray(classes)
+            self.n_features_in_ = X.shape[1]
+        if len(X):
+            self.sgd_.partial_fit(self.features_.transform(X), y, classes=self.classes_)
+
+    def _hold_out(self, X, y):
+        """Keep calibration rows in a buffer capped at calibration_size (oldest-first replacement)"""
+        if not hasattr(self, "holdout_X_"):
+            self.holdout_X_ = np.empty((0, X.shape[1]))
+            self.holdout_y_ = np.empty(0, dtype=y.dtype)
+        self.held_out_since_ = getattr(self, "held_out_since_", 0) + len(X)
+        self.holdout_X_ = np.concatenate([self.holdout_X_, X])[-self.calibration_size:]
+        self.holdout_y_ = np.concatenate([self.holdout_y_, y])[-self.calibration_size:]
+
+    def _calibrate(self):
+        if not hasattr(self, "sgd_"):
+            return
+        self.held_out_since_ = 0
+        if len(self.classes_) != 2 or len(np.unique(self.holdout_y_)) < 2:
+            self.calibrator_ = None  # Fall back to the SGD model's own logistic output
+            return
+        scores = self.sgd_.decision_function(self.features_.transform(self.holdout_X_))
+        self.calibrator_ = LogisticRegression().fit(scores[:, None], self.holdout_y_)
+
+    def decision_function(self, X):
+        return self.sgd_.decision_function(self.features_.transform(np.asarray(X, dtype=np.float64)))
+
+    def predict_proba(self, X):
+        if getattr(self, "calibrator_", None) is None:
+            return self.sgd_.predict_proba(self.features_.transform(np.asarray(X, dtype=np.float64)))
+        return self.calibrator_.predict_proba(self.decision_function(X)[:, None])
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
@@ -0,0 +1,227 @@
+"""Per-flow sliding-window statistics for the CyberGuard ML API
+
+Packets are aggregated per source IP and per (source, destination) pair in
+fixed-size ring buffers, so rate-based behaviour such as floods and port
+sweeps becomes visible to the per-packet models.
+"""
+import math
+import threading
+import time
+import warnings
+from itertools import repeat
+
+import numpy as np
+
+FLOW_STAT_NAMES = ["PacketRate", "DistinctPorts", "SynRatio", "ByteRate"]
+FLOW_FEATURE_NAMES = [f"src{name}" for name in FLOW_STAT_NAMES] + [f"pair{name}" for name in FLOW_STAT_NAMES]
+
+# Scales that map each statistic onto [0, 1] like the per-packet features
+MAX_PACKET_RATE = 10_000.0      # packets/sec
+MAX_BYTE_RATE = 10_000_000.0    # bytes/sec
+PORT_BITMAP_BITS = 64
+MAX_DISTINCT_PORTS = PORT_BITMAP_BITS * math.log(PORT_BITMAP_BITS)  # Linear counting saturates here
+
+# Default window: WINDOW_BUCKETS slots of BUCKET_SECONDS each
+WINDOW_BUCKETS = 10
+BUCKET_SECONDS = 1.0
+
+
+def parse_timestamps(timestamps):
+    """ISO-8601 strings to epoch seconds, or None if any of them cannot be parsed"""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            parsed = np.array([t[:-1] if t.endswith("Z") else t for t in timestamps], dtype="datetime64[us]")
+    except (ValueError, TypeError, Warning):
+        return None
+    if np.isnat(parsed).any():  # "" and "NaT" parse without complaint
+        return None
+    return parsed.astype(np.int64) / 1e6
+
+
+def port_bits(ports: np.ndarray) -> np.ndarray:
+    """Fibonacci-hash destination ports onto one bit of a 64-bit bitmap"""
+    product = (ports.astype(np.uint64) * np.uint64(2654435761)) & np.uint64(0xFFFFFFFF)
+    return np.left_shift(np.uint64(1), product >> np.uint64(32 - (PORT_BITMAP_BITS.bit_length() - 1)))
+
+
+class FlowTable:
+    """Sliding-window counters for at most max_flows keys.
+
+    Every flow owns one row of ring buffers holding `buckets` slots of
+    `bucket_seconds` each, so memory is fixed at construction. Flows idle for
+    longer than ttl are evicted first; when the table is still full the least
+    recently seen flows make room.
+    """
+
+    def __init__(self, max_flows: int = 131_072, buckets: int = WINDOW_BUCKETS, bucket_seconds: float = BUCKET_SECONDS, ttl: float = 60.0):
+        self.max_flows = max_flows
+        self.buckets = buckets
+        self.bucket_seconds = bucket_seconds
+        self.ttl = ttl
+
+        self.slots = {}
+        self.keys = [None] * max_flows
+        self.free = list(range(max_flows - 1, -1, -1))
+
+        self.packets = np.zeros((max_flows, buckets), dtype=np.uint32)
+        self.bytes = np.zeros((max_flows, buckets), dtype=np.uint64)
+        self.syn = np.zeros((max_flows, buckets), dtype=np.uint32)
+        self.ports = np.zeros((max_flows, buckets), dtype=np.uint64)
+        self.epoch = np.full(max_flows, -1, dtype=np.int64)  # Newest bucket number written per flow
+        self.last_seen = np.full(max_flows, -np.inf)
+        self.touched = np.zeros(max_flows, dtype=np.int64)  # Batch generation that last used each row
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.packets, self.bytes, self.syn, self.ports, self.epoch, self.last_seen, self.touched)
+        return sum(a.nbytes for a in arrays)
+
+    def evict(self, now: float):
+        """Free expired flows, or the least recently seen 1/16 of the table if none have expired"""
+        used = np.fromiter(self.slots.values(), dtype=np.int64, count=len(self.slots))
+        # Rows already handed out to the batch being processed must stay put
+        candidates = used[self.touched[used] != self.generation]
+        expired = candidates[self.last_seen[candidates] < now - self.ttl]
+        if not len(expired):
+            count = min(len(candidates), max(1, self.max_flows // 16))
+            expired = candidates[np.argpartition(self.last_seen[candidates], count - 1)[:count]]
+        for row in expired.tolist():
+            del self.slots[self.keys[row]]
+            self.keys[row] = None
+            self.free.append(row)
+        self.last_seen[expired] = -np.inf
+
+    def rows_for(self, keys, now: float) -> np.ndarray:
+        """Map flow keys to table rows, allocating (and evicting) as needed"""
+        self.generation += 1
+        slots = self.slots
+        # Known flows resolve in one C-level pass; only new keys take the slow path
+        rows = np.fromiter(map(slots.get, keys, repeat(-1)), dtype=np.int64, count=len(keys))
+        self.touched[rows[rows >= 0]] = self.generation
+        for i in np.flatnonzero(rows < 0).tolist():
+            key = keys[i]
+            row = slots.get(key)
+            if row is None:
+                if not self.free:
+                    self.evict(now)
+                row = self.free.pop()
+                slots[key] = row
+                self.keys[row] = key
+                self.epoch[row] = -1
+                self.touched[row] = self.generation
+            rows[i] = row
+        return rows
+
+    def advance(self, rows: np.ndarray, newest: np.ndarray):
+        """Roll each flow's ring buffer forward to bucket number `newest`, zeroing slots that expire"""
+        old = self.epoch[rows]
+        gap = np.minimum(newest - old, self.buckets)
+        slot = np.arange(self.buckets)
+        stale = ((slot[None, :] - (old[:, None] + 1)) % self.buckets) < gap[:, None]
+        if stale.any():
+            for counters in (self.packets, self.bytes, self.syn, self.ports):
+                block = counters[rows]
+                block[stale] = 0
+                counters[rows] = block
+        self.epoch[rows] = np.maximum(old, newest)
+
+    def observe(self, keys, ports: np.ndarray, sizes: np.ndarray, syn: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """Add one batch of packets and return the flow row of each packet.
+
+        A batch may hold at most max_flows // 2 packets so eviction always
+        has rows outside the batch to reclaim.
+        """
+        now = float(times.max())
+        rows = self.rows_for(keys, now)
+        bucket = np.floor(times / self.bucket_seconds).astype(np.int64)
+
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        newest = np.full(len(unique_rows), np.iinfo(np.int64).min)
+        np.maximum.at(newest, inverse, bucket)
+        self.advance(unique_rows, newest)
+
+        # Packets older than their flow's window are too late to count
+        live = bucket > self.epoch[rows] - self.buckets
+        r, pos = rows[live], bucket[live] % self.buckets
+        np.add.at(self.packets, (r, pos), 1)
+        np.add.at(self.bytes, (r, pos), sizes[live].astype(np.uint64))
+        np.add.at(self.syn, (r, pos), syn[live].astype(np.uint32))
+        np.bitwise_or.at(self.ports, (r, pos), port_bits(ports[live]))
+        np.maximum.at(self.last_seen, rows, times)
+        return rows
+
+    def stats(self, rows: np.ndarray, now: float, out: np.ndarray):
+        """Write the normalized window statistics of each row into out (N, 4)"""
+        window = self.buckets * self.bucket_seconds
+        now_bucket = math.floor(now / self.bucket_seconds)
+        epoch = self.epoch[rows]
+        slot = np.arange(self.buckets)
+        # Bucket number currently held by each slot; only the last `buckets` of them are in the window
+        held = epoch[:, None] - ((epoch[:, None] - slot[None, :]) % self.buckets)
+        in_window = held > now_bucket - self.buckets
+
+        packets = np.where(in_window, self.packets[rows], 0).sum(axis=1)
+        byte_count = np.where(in_window, self.bytes[rows], 0).sum(axis=1)
+        syn = np.where(in_window, self.syn[rows], 0).sum(axis=1)
+        bitmap = np.bitwise_or.reduce(np.where(in_window, self.ports[rows], np.uint64(0)), axis=1)
+
+        # Linear counting: distinct ~= -m * ln(empty bits / m)
+        set_bits = np.unpackbits(bitmap.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        empty = PORT_BITMAP_BITS - set_bits
+        with np.errstate(divide="ignore"):
+            distinct = np.where(empty > 0, -PORT_BITMAP_BITS * np.log(empty / PORT_BITMAP_BITS), MAX_DISTINCT_PORTS)
+
+        out[:, 0] = np.minimum(np.log1p(packets / window) / math.log1p(MAX_PACKET_RATE), 1.0)
+        out[:, 1] = np.minimum(distinct / MAX_DISTINCT_PORTS, 1.0)
+        out[:, 2] = syn / np.maximum(packets, 1)
+        out[:, 3] = np.minimum(np.log1p(byte_count / window) / math.log1p(MAX_BYTE_RATE), 1.0)
+
+
+class FlowFeatureEngine:
+    """Stateful flow stage: per-source and per-(source, destination) window statistics"""
+
+    def __init__(self, max_flows: int = 131_072, buckets: int = WINDOW_BUCKETS, bucket_seconds: float = BUCKET_SECONDS, ttl: float = 60.0):
+        self.sources = FlowTable(max_flows, buckets, bucket_seconds, ttl)
+        self.pairs = FlowTable(max_flows, buckets, bucket_seconds, ttl)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sources) + len(self.pairs)
+
+    @property
+    def nbytes(self) -> int:
+        return self.sources.nbytes + self.pairs.nbytes
+
+    def observe(self, source_ips, dest_ips, ports, sizes, syn, times=None, out: np.ndarray = None) -> np.ndarray:
+        """Record a batch of packets and return their (N, 8) flow features.
+
+        Features reflect each flow's state after the whole batch, so packets in
+        the same micro-batch see each other. times defaults to arrival time.
+        """
+        n = len(source_ips)
+        if out is None:
+            out = np.empty((n, len(FLOW_FEATURE_NAMES)))
+        if not n:
+            return out
+
+        ports = np.asarray(ports, dtype=np.int64)
+        sizes = np.maximum(np.asarray(sizes, dtype=np.int64), 0)
+        syn = np.asarray(syn, dtype=bool)
+        times = np.full(n, time.time()) if times is None else np.asarray(times, dtype=np.float64)
+        pairs = list(zip(source_ips, dest_ips))
+
+        chunk = max(1, min(self.sources.max_flows, self.pairs.max_flows) // 2)
+        with self.lock:
+            for start in range(0, n, chunk):
+                part = slice(start, start + chunk)
+                now = float(times[part].max())
+                source_rows = self.sources.observe(source_ips[part], ports[part], sizes[part], syn[part], times[part])
+                pair_rows = self.pairs.observe(pairs[part], ports[part], sizes[part], syn[part], times[part])
+                self.sources.stats(source_rows, now, out[part, 0:4])
+                self.pairs.stats(pair_rows, now, out[part, 4:8])
+        return out
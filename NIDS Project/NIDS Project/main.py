@@ -1,17 +1,44 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any
 import numpy as np
+import sklearn
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier, IsolationForest
 from sklearn.svm import SVC
 from sklearn.neural_network import MLPClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 import joblib
+import asyncio
 import os
+import sys
+import time
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from datetime import datetime
+from functools import lru_cache, partial
 import json
+import multiprocessing
+from itertools import repeat
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, run a single worker
+    fcntl = None
+
+from alerts import AlertStore
+from cache import VerdictCache
+from compiled import compile_model
+from estimators import KernelSGDClassifier
+from flows import BUCKET_SECONDS, FLOW_FEATURE_NAMES, WINDOW_BUCKETS, FlowFeatureEngine, parse_timestamps
+from metrics import ModelMetrics
+from training import Reservoir, can_learn_online, fit_estimator, lower_priority, online_update
 
 app = FastAPI(title="CyberGuard ML API", version="1.0.0")
 
@@ -41,11 +68,38 @@ class PredictionResponse(BaseModel):
     timestamp: str
     features: Dict[str, float]
 
+class ModelVerdict(BaseModel):
+    prediction: int
+    confidence: float
+
+class EnsemblePredictionResponse(BaseModel):
+    prediction: int
+    score: float
+    rule: str
+    timestamp: str
+    models: Dict[str, ModelVerdict]
+    features: Dict[str, float]
+
+class FeedbackRequest(BaseModel):
+    data: List[NetworkData]
+    labels: List[int]
+
 class BatchPredictionRequest(BaseModel):
     data: List[NetworkData]
 
 class TrainingRequest(BaseModel):
     data: List[NetworkData]
+    labels: List[int] = None  # 0 (benign) / 1 (threat) per record; required for supervised online updates
+    incremental: bool = False  # Update the live model online instead of refitting it from scratch
+    force: bool = False  # Swap a refit in even if it validates worse than the live model
+
+# Port-scan model: SVC(probability=True) trains in quadratic time plus 5-fold
+# Platt scaling, so the default is the linear-time kernel-approximation model
+PORT_SCAN_MODELS = {
+    "kernel-sgd": ("Kernel SGD", lambda: KernelSGDClassifier(random_state=42)),
+    "svc": ("SVM", lambda: SVC(probability=True, random_state=42)),
+}
+port_scan_type, port_scan_factory = PORT_SCAN_MODELS[os.environ.get("CYBERGUARD_PORT_SCAN_MODEL", "kernel-sgd")]
 
 # Initialize ML models
 models = {
@@ -55,7 +109,15 @@ models = {
         "model": RandomForestClassifier(n_estimators=100, random_state=42),
         "status": "active",
         "accuracy": 0.985,
-        "trained": False
+        "trained": False,
+        "version": 0,
+        "lastTrained": None,
+        "samples": 0,
+        "trainTime": 0.0,
+        "metrics": None,
+        "backend": "sklearn",
+        "compiled": None,
+        "revision": 0
     },
     "malware-classifier": {
         "name": "Malware Classification",
@@ -63,7 +125,15 @@ models = {
         "model": MLPClassifier(hidden_layer_sizes=(100, 50), random_state=42),
         "status": "active",
         "accuracy": 0.968,
-        "trained": False
+        "trained": False,
+        "version": 0,
+        "lastTrained": None,
+        "samples": 0,
+        "trainTime": 0.0,
+        "metrics": None,
+        "backend": "sklearn",
+        "compiled": None,
+        "revision": 0
     },
     "anomaly-detector": {
         "name": "Anomaly Detection",
@@ -71,51 +141,267 @@ models = {
         "model": IsolationForest(contamination=0.1, random_state=42),
         "status": "active", 
         "accuracy": 0.942,
-        "trained": False
+        "trained": False,
+        "version": 0,
+        "lastTrained": None,
+        "samples": 0,
+        "trainTime": 0.0,
+        "metrics": None,
+        "backend": "sklearn",
+        "compiled": None,
+        "revision": 0
     },
     "port-scan-detector": {
         "name": "Port Scan Detector",
-        "type": "SVM",
-        "model": SVC(probability=True, random_state=42),
+        "type": port_scan_type,
+        "model": port_scan_factory(),
         "status": "active",
         "accuracy": 0.971,
-        "trained": False
+        "trained": False,
+        "version": 0,
+        "lastTrained": None,
+        "samples": 0,
+        "trainTime": 0.0,
+        "metrics": None,
+        "backend": "sklearn",
+        "compiled": None,
+        "revision": 0
     }
 }
 
-def extract_features(network_data: NetworkData) -> np.array:
-    """Extract numerical features from network data"""
-    features = []
+# Feature schema shared by predict, batch-predict and train: 11 per-packet
+# features followed by the sliding-window flow statistics
+PACKET_FEATURE_NAMES = ["port", "protocol", "packetSize", "SYN", "ACK", "FIN", "RST", "PSH", "URG", "srcSubnet", "dstSubnet"]
+FEATURE_NAMES = PACKET_FEATURE_NAMES + FLOW_FEATURE_NAMES
+PROTOCOL_MAP = {"TCP": 1.0, "UDP": 0.5, "ICMP": 0.0}
+ALL_FLAGS = ["SYN", "ACK", "FIN", "RST", "PSH", "URG"]
+FLAG_BITS = {flag: 1 << i for i, flag in enumerate(ALL_FLAGS)}
+FLAG_SHIFTS = np.arange(len(ALL_FLAGS), dtype=np.uint8)
+
+def encode_flags(flags: List[str]) -> int:
+    """Pack a TCP flag list into a bitmask (bit i set for ALL_FLAGS[i])"""
+    mask = 0
+    for flag in flags:
+        mask |= FLAG_BITS.get(flag, 0)
+    return mask
+
+def parse_first_octets(ips: List[str], errors: Dict[int, str]) -> np.ndarray:
+    """Vectorized int(ip.split('.')[0]) over a column of IP strings.
+    
+    Plain 1-3 digit octets are decoded straight from the byte buffer; anything
+    else goes through int() so odd inputs behave exactly as before. Rows that
+    cannot be parsed are reported in errors and left as 0.
+    """
+    n = len(ips)
+    values = np.zeros(n, dtype=np.float64)
+    fast = np.zeros(n, dtype=bool)
+    
+    try:
+        raw = np.array(ips, dtype="S")
+    except UnicodeEncodeError:
+        raw = None
+    
+    if raw is not None and n:
+        buf = raw.view(np.uint8).reshape(n, -1)
+        if buf.shape[1] < 4:
+            buf = np.pad(buf, ((0, 0), (0, 4 - buf.shape[1])))
+        head = buf[:, :4]
+        is_digit = (head >= ord("0")) & (head <= ord("9"))
+        run = np.where(is_digit.all(axis=1), 4, is_digit.argmin(axis=1))
+        end = head[np.arange(n), np.minimum(run, 3)]
+        fast = (run >= 1) & (run <= 3) & ((end == ord(".")) | (end == 0))
+        
+        d = head[:, :3].astype(np.int64) - ord("0")
+        values = np.select(
+            [run == 1, run == 2, run == 3],
+            [d[:, 0], d[:, 0] * 10 + d[:, 1], d[:, 0] * 100 + d[:, 1] * 10 + d[:, 2]],
+        ).astype(np.float64)
+    
+    for i in np.flatnonzero(~fast):
+        try:
+            values[i] = int(ips[i].split('.')[0])
+        except Exception as e:
+            values[i] = 0.0
+            errors.setdefault(int(i), str(e))
+    
+    return values
+
+# Live flow state fed by every scoring path
+flow_engine = FlowFeatureEngine(
+    max_flows=int(os.environ.get("CYBERGUARD_MAX_FLOWS", "131072")),
+    ttl=float(os.environ.get("CYBERGUARD_FLOW_TTL", "60")),
+)
+
+def fill_features(out: np.ndarray, ports, protocol_values, packet_sizes, flag_masks, source_octets, dest_octets,
+                  source_keys, dest_keys, flows: FlowFeatureEngine = None, times: np.ndarray = None,
+                  errors: Dict[int, str] = None) -> np.ndarray:
+    """Fill an (N, n_features) matrix from already-decoded numeric columns.
     
-    # Port feature (normalize)
-    features.append(network_data.port / 65535.0)
+    Shared by the JSON path and the pcap replay tool. source_keys/dest_keys
+    identify flows (IP strings, or any hashable such as packed IPv4 ints);
+    rows listed in errors get zeroed flow features and stay out of flows.
+    """
+    n = len(ports)
+    errors = errors or {}
     
-    # Protocol encoding
-    protocol_map = {"TCP": 1.0, "UDP": 0.5, "ICMP": 0.0}
-    features.append(protocol_map.get(network_data.protocol, 0.0))
+    # Port and packet size (normalize)
+    out[:, 0] = np.asarray(ports, dtype=np.float64) / 65535.0
+    out[:, 2] = np.minimum(np.asarray(packet_sizes, dtype=np.float64) / 1500.0, 1.0)
+    out[:, 1] = protocol_values
     
-    # Packet size (normalize)
-    features.append(min(network_data.packetSize / 1500.0, 1.0))
+    # Flags as a bitmask, unpacked into six 0/1 columns
+    out[:, 3:9] = (np.asarray(flag_masks, dtype=np.uint8)[:, None] >> FLAG_SHIFTS) & 1
     
-    # Flags encoding
-    all_flags = ["SYN", "ACK", "FIN", "RST", "PSH", "URG"]
-    for flag in all_flags:
-        features.append(1.0 if flag in network_data.flags else 0.0)
+    # Subnet features from the first octet of each address
+    out[:, 9] = source_octets / 255.0
+    out[:, 10] = dest_octets / 255.0
     
-    # IP-based features (simplified)
-    src_octets = network_data.sourceIp.split('.')
-    dst_octets = network_data.destIp.split('.')
+    # Stateful flow statistics, for rows that parsed cleanly
+    flows = flow_engine if flows is None else flows
+    n_packet = len(PACKET_FEATURE_NAMES)
+    if errors:
+        out[list(errors), n_packet:] = 0.0
+        valid = np.array([row for row in range(n) if row not in errors], dtype=np.int64)
+        if len(valid):
+            out[valid, n_packet:] = flows.observe(
+                [source_keys[i] for i in valid], [dest_keys[i] for i in valid],
+                np.asarray(ports)[valid], np.asarray(packet_sizes)[valid], out[valid, 3] > 0,
+                None if times is None else np.asarray(times)[valid],
+            )
+    else:
+        flows.observe(source_keys, dest_keys, ports, packet_sizes, out[:, 3] > 0, times, out=out[:, n_packet:])
+    
+    return out
+
+def extract_feature_matrix(ports, protocols, packet_sizes, flags, source_ips, dest_ips, out: np.ndarray = None,
+                           dtype=np.float64, flows: FlowFeatureEngine = None, times: np.ndarray = None):
+    """Columnar feature pipeline: fill an (N, n_features) matrix from per-field columns.
+    
+    Returns the matrix and a {row: message} dict of rows that failed to parse.
+    Pass a preallocated out buffer (e.g. float32) to avoid a fresh allocation.
+    Valid rows are also recorded in flows (the live flow_engine by default),
+    with times in epoch seconds defaulting to arrival time.
+    """
+    n = len(ports)
+    if out is None:
+        out = np.empty((n, len(FEATURE_NAMES)), dtype=dtype)
+    errors: Dict[int, str] = {}
+    
+    protocol_values = np.fromiter(map(PROTOCOL_MAP.get, protocols, repeat(0.0)), dtype=np.float64, count=n)
+    flag_masks = np.fromiter(map(encode_flags, flags), dtype=np.uint8, count=n)
+    source_octets = parse_first_octets(source_ips, errors)
+    dest_octets = parse_first_octets(dest_ips, errors)
+    
+    fill_features(out, ports, protocol_values, packet_sizes, flag_masks, source_octets, dest_octets,
+                  source_ips, dest_ips, flows=flows, times=times, errors=errors)
+    return out, errors
+
+def extract_features_batch(records: List[NetworkData], out: np.ndarray = None, flows: FlowFeatureEngine = None,
+                           record_times: bool = False):
+    """Extract an (N, n_features) feature matrix from NetworkData records.
+    
+    Flow windows use arrival time unless record_times is set, in which case
+    the records' own timestamps are used when they all parse.
+    """
+    times = parse_timestamps([r.timestamp for r in records]) if record_times else None
+    return extract_feature_matrix(
+        [r.port for r in records],
+        [r.protocol for r in records],
+        [r.packetSize for r in records],
+        [r.flags for r in records],
+        [r.sourceIp for r in records],
+        [r.destIp for r in records],
+        out=out,
+        flows=flows,
+        times=times,
+    )
+
+def extract_features(network_data: NetworkData) -> np.array:
+    """Extract numerical features from network data"""
+    features, errors = extract_features_batch([network_data])
+    if errors:
+        raise ValueError(errors[0])
+    return features
+
+# Synthetic traffic behind the flow columns of the training data. Background
+# hosts trickle a few packets each over SYNTHETIC_SPAN_SECONDS, like the
+# traffic the live engine sees; floods and SYN sweeps burst past the flow
+# window. Every packet goes through a FlowFeatureEngine in time order, so the
+# flow columns are computed exactly as they are when serving.
+SYNTHETIC_SPAN_SECONDS = 600.0
+SYNTHETIC_FLOOD_FRACTION = 0.05
+SYNTHETIC_SWEEP_FRACTION = 0.05
+SYNTHETIC_ROWS_PER_ATTACKER = 1000
+SYNTHETIC_BURST_SECONDS = 15.0
+
+def synthetic_flow_features(X: np.ndarray, roles: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Flow columns for rows with packet columns X and roles 0 (background), 1 (flood) or 2 (sweep)"""
+    n = len(X)
+    sources = np.empty(n, dtype=np.int64)
+    dests = np.empty(n, dtype=np.int64)
+    times = rng.uniform(0.0, SYNTHETIC_SPAN_SECONDS, n)
+    extra = []  # (sources, dests, ports, sizes, syn, times) of packets that are not rows
     
-    # Add subnet features
-    features.append(int(src_octets[0]) / 255.0 if len(src_octets) > 0 else 0.0)
-    features.append(int(dst_octets[0]) / 255.0 if len(dst_octets) > 0 else 0.0)
+    # Background: about four packets per host, each host talking to one server
+    background = np.flatnonzero(roles == 0)
+    hosts = max(1, len(background) // 4)
+    host = rng.integers(0, hosts, len(background))
+    sources[background] = host
+    dests[background] = host % max(1, hosts // 10)
     
-    return np.array(features).reshape(1, -1)
+    next_id = hosts
+    window = BUCKET_SECONDS * WINDOW_BUCKETS
+    for role, rates, packet_size in ((1, (200.0, 2000.0), None), (2, (20.0, 300.0), 60)):
+        rows = np.flatnonzero(roles == role)
+        if not len(rows):
+            continue
+        attacker = rng.integers(0, max(1, len(rows) // SYNTHETIC_ROWS_PER_ATTACKER), len(rows))
+        for a in np.unique(attacker).tolist():
+            mine = rows[attacker == a]
+            start = rng.uniform(0.0, SYNTHETIC_SPAN_SECONDS - SYNTHETIC_BURST_SECONDS)
+            sources[mine], dests[mine] = next_id, next_id
+            # Rows sit in the end of the burst, once the window has filled
+            times[mine] = rng.uniform(start + SYNTHETIC_BURST_SECONDS - window, start + SYNTHETIC_BURST_SECONDS, len(mine))
+            count = max(0, int(np.exp(rng.uniform(*np.log(rates))) * SYNTHETIC_BURST_SECONDS) - len(mine))
+            extra.append((
+                np.full(count, next_id), np.full(count, next_id),
+                rng.integers(0, 65536, count),
+                np.full(count, packet_size) if packet_size else rng.integers(64, 1500, count),
+                np.ones(count, dtype=bool) if role == 2 else rng.random(count) < 0.5,
+                rng.uniform(start, start + SYNTHETIC_BURST_SECONDS, count),
+            ))
+            next_id += 1
+    
+    own = (sources, dests, (X[:, 0] * 65535).astype(np.int64), (X[:, 2] * 1500).astype(np.int64), X[:, 3] > 0.5, times)
+    columns = [np.concatenate(parts) for parts in zip(own, *extra)]
+    row = np.concatenate([np.arange(n), np.full(len(columns[0]) - n, -1)])
+    order = np.argsort(columns[-1], kind="stable")
+    columns, row = [column[order] for column in columns], row[order]
+    
+    # Feed one flow bucket at a time, so each row sees the window as of its own arrival
+    engine = FlowFeatureEngine(max_flows=max(4096, n // 16), ttl=window)
+    flows = np.empty((n, len(FLOW_FEATURE_NAMES)))
+    bucket = np.floor(columns[-1] / BUCKET_SECONDS)
+    bounds = np.flatnonzero(np.diff(bucket)) + 1
+    for part in np.split(np.arange(len(row)), bounds):
+        src, dst, ports, sizes, syn, t = (column[part] for column in columns)
+        out = engine.observe(src.tolist(), dst.tolist(), ports, sizes, syn, t)
+        mask = row[part] >= 0
+        flows[row[part][mask]] = out[mask]
+    return flows
 
-def generate_training_data(size: int = 1000):
+def generate_training_data(size: int = 1000, seed: int = 42):
     """Generate synthetic training data for demonstration"""
-    np.random.seed(42)
-    X = np.random.rand(size, 11)  # 11 features
+    np.random.seed(seed)
+    X = np.empty((size, len(FEATURE_NAMES)))
+    X[:, :len(PACKET_FEATURE_NAMES)] = np.random.rand(size, len(PACKET_FEATURE_NAMES))
+    noise_mask = np.random.rand(size) > 0.9
+    
+    # Most rows are background traffic; the rest come from floods and port sweeps
+    rng = np.random.default_rng(seed)
+    draw = rng.random(size)
+    roles = np.where(draw < SYNTHETIC_FLOOD_FRACTION, 1, np.where(draw < SYNTHETIC_FLOOD_FRACTION + SYNTHETIC_SWEEP_FRACTION, 2, 0))
+    X[:, len(PACKET_FEATURE_NAMES):] = synthetic_flow_features(X, roles, rng)
     
     # Create patterns for different threat types
     y = np.zeros(size)
@@ -123,32 +409,262 @@ def generate_training_data(size: int = 1000):
     # DDoS pattern: high packet rate, specific ports
     ddos_mask = (X[:, 0] > 0.8) & (X[:, 2] > 0.7)  # High port usage and packet size
     y[ddos_mask] = 1
+    y[roles == 1] = 1  # Packets of a flood
     
     # Port scan pattern: sequential ports, low packet size
     scan_mask = (X[:, 0] < 0.3) & (X[:, 2] < 0.3)  # Low port and small packets
     y[scan_mask] = 1
+    y[roles == 2] = 1  # Probes of a SYN sweep across many ports of one host
     
     # Add some random noise
-    noise_mask = np.random.rand(size) > 0.9
     y[noise_mask] = 1 - y[noise_mask]
     
     return X, y
 
-# Train initial models
-print("Training initial models...")
-X_train, y_train = generate_training_data(2000)
-X_test, y_test = generate_training_data(500)
+@lru_cache(maxsize=1)
+def get_validation_data():
+    """Held-out synthetic set, drawn with a different seed from the training set"""
+    return generate_training_data(500, seed=7)
+
+# Inference backends: "compiled" serves RandomForest/MLP models from flat NumPy
+# arrays (see compiled.py); models without a compiled form fall back to sklearn
+INFERENCE_BACKENDS = ("sklearn", "compiled")
+for model_id in filter(None, (m.strip() for m in os.environ.get("CYBERGUARD_COMPILED_MODELS", "").split(","))):
+    if model_id in models:
+        models[model_id]["backend"] = "compiled"
+    else:
+        print(f"Ignoring unknown model in CYBERGUARD_COMPILED_MODELS: {model_id}")
 
-for model_id, model_info in models.items():
-    if model_id != "anomaly-detector":  # Anomaly detection is unsupervised
-        model_info["model"].fit(X_train, y_train)
-        predictions = model_info["model"].predict(X_test)
-        model_info["accuracy"] = accuracy_score(y_test, predictions)
+def attach_backend(model_info: Dict[str, Any]):
+    """Build (or drop) the compiled form of a model to match its backend setting.
+    
+    The compiled form model_info already holds is passed on, so an online
+    update recompiles only the trees it added.
+    """
+    if model_info["backend"] == "compiled":
+        model_info["compiled"] = compile_model(model_info["model"], previous=model_info["compiled"])
     else:
-        model_info["model"].fit(X_train)
+        model_info["compiled"] = None
+
+# Model registry: fitted estimators are persisted as versioned joblib artifacts
+# so workers load the same weights at startup instead of retraining
+MODEL_DIR = os.environ.get("CYBERGUARD_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_store"))
+MAX_MODEL_VERSIONS = 5
+
+def list_model_versions(model_id: str) -> List[int]:
+    """Versions of a model with complete artifacts on disk, oldest first"""
+    model_dir = os.path.join(MODEL_DIR, model_id)
+    if not os.path.isdir(model_dir):
+        return []
+    versions = []
+    for name in os.listdir(model_dir):
+        # Metadata is written after the estimator, so it marks a complete artifact
+        if name.startswith("v") and name.endswith(".json") and name[1:-5].isdigit():
+            versions.append(int(name[1:-5]))
+    return sorted(versions)
+
+def save_model(model_id: str, model_info: Dict[str, Any]) -> int:
+    """Persist a fitted estimator and its metadata as the next version"""
+    model_dir = os.path.join(MODEL_DIR, model_id)
+    os.makedirs(model_dir, exist_ok=True)
+    versions = list_model_versions(model_id)
+    version = (versions[-1] if versions else 0) + 1
+    # Claim the version number first so workers saving concurrently never share one
+    while True:
+        model_path = os.path.join(model_dir, f"v{version}.joblib")
+        try:
+            os.close(os.open(model_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            version += 1
     
+    metadata = {
+        "modelId": model_id,
+        "version": version,
+        "type": model_info["type"],
+        "accuracy": float(model_info["accuracy"]),
+        "lastTrained": model_info["lastTrained"],
+        "trainTime": model_info["trainTime"],
+        "samples": model_info["samples"],
+        "features": FEATURE_NAMES,
+        "sklearnVersion": sklearn.__version__,
+    }
+    
+    # Write to temp files and rename so readers never see a partial artifact
+    tmp = f".{os.getpid()}.tmp"
+    joblib.dump(model_info["model"], model_path + tmp)
+    os.replace(model_path + tmp, model_path)
+    meta_path = os.path.join(model_dir, f"v{version}.json")
+    with open(meta_path + tmp, "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(meta_path + tmp, meta_path)
+    
+    # Keep only the newest MAX_MODEL_VERSIONS artifacts
+    for old in (versions + [version])[:-MAX_MODEL_VERSIONS]:
+        for ext in (".joblib", ".json"):
+            try:
+                os.remove(os.path.join(model_dir, f"v{old}{ext}"))
+            except FileNotFoundError:
+                pass
+    
+    model_info["version"] = version
+    return version
+
+def load_model(model_id: str, model_info: Dict[str, Any]) -> bool:
+    """Load the newest compatible artifact for a model; False if none is usable"""
+    versions = list_model_versions(model_id)
+    if not versions:
+        return False
+    
+    version = versions[-1]
+    model_dir = os.path.join(MODEL_DIR, model_id)
+    try:
+        with open(os.path.join(model_dir, f"v{version}.json")) as f:
+            metadata = json.load(f)
+        if metadata.get("features") != FEATURE_NAMES or metadata.get("sklearnVersion") != sklearn.__version__:
+            print(f"Ignoring {model_id} v{version}: incompatible feature schema or sklearn version")
+            return False
+        if metadata.get("type") != model_info["type"]:
+            print(f"Ignoring {model_id} v{version}: saved as {metadata.get('type')}, configured as {model_info['type']}")
+            return False
+        # Copy-on-write mapping: pages are shared until written, and libsvm
+        # still gets the writeable buffers it insists on
+        model = joblib.load(os.path.join(model_dir, f"v{version}.joblib"), mmap_mode="c")
+    except Exception as e:
+        print(f"Failed to load {model_id} v{version}: {e}")
+        return False
+    
+    model_info["model"] = model
+    model_info["version"] = version
+    model_info["accuracy"] = metadata["accuracy"]
+    model_info["lastTrained"] = metadata["lastTrained"]
+    model_info["trainTime"] = metadata["trainTime"]
+    model_info["samples"] = metadata["samples"]
+    model_info["trained"] = True
+    return True
+
+def fit_model(model_id: str, model_info: Dict[str, Any], X: np.ndarray, y: np.ndarray = None):
+    """Fit a model in place and record its training metadata"""
+    _, train_time = fit_estimator(model_id, model_info["model"], X, y)
+    model_info["trainTime"] = train_time
+    model_info["samples"] = len(X)
+    model_info["lastTrained"] = datetime.now().isoformat()
     model_info["trained"] = True
-    print(f"Trained {model_info['name']} - Accuracy: {model_info['accuracy']:.3f}")
+
+@contextmanager
+def registry_lock():
+    """Exclusive lock on MODEL_DIR, so workers starting together train each model once"""
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    with open(os.path.join(MODEL_DIR, ".lock"), "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+def load_or_train_models(retrain: bool = False):
+    """Load persisted models, training (and saving) only those without an artifact"""
+    with registry_lock():
+        train_missing_models(retrain)
+    
+    # Seed live metrics with each model's held-out evaluation
+    for model_id, model_info in models.items():
+        model_info["metrics"] = evaluate_holdout(model_id, model_info["model"])
+        attach_backend(model_info)
+
+def train_missing_models(retrain: bool = False):
+    X_train = y_train = None
+    for model_id, model_info in models.items():
+        if not retrain and load_model(model_id, model_info):
+            print(f"Loaded {model_info['name']} v{model_info['version']} - Accuracy: {model_info['accuracy']:.3f}")
+            continue
+        
+        if X_train is None:
+            print("Training initial models...")
+            X_train, y_train = generate_training_data(2000)
+            X_test, y_test = get_validation_data()
+        
+        fit_model(model_id, model_info, X_train, y_train)
+        if model_id != "anomaly-detector":
+            predictions = model_info["model"].predict(X_test)
+            model_info["accuracy"] = accuracy_score(y_test, predictions)
+        save_model(model_id, model_info)
+        print(f"Trained {model_info['name']} v{model_info['version']} - Accuracy: {model_info['accuracy']:.3f}")
+
+def predict_with(model_id: str, model, X: np.ndarray):
+    """Run one vectorized prediction pass over an (N, n_features) feature matrix"""
+    if model_id == "anomaly-detector":
+        # Isolation Forest flags rows whose score falls below offset_ as anomalies,
+        # so a single score_samples call gives both the verdict and the confidence
+        scores = model.score_samples(X)
+        predictions = (scores - model.offset_ < 0).astype(int)
+        confidences = np.abs(scores)
+    else:
+        predictions = model.predict(X)
+        if hasattr(model, "predict_proba"):
+            confidences = model.predict_proba(X).max(axis=1)
+        else:
+            confidences = np.full(len(X), 0.8)  # Default confidence for SVM without probability
+    
+    return predictions, confidences
+
+def timed_predict(model_id: str, model_info: Dict[str, Any], X: np.ndarray):
+    """predict_with, recording the call in the model's latency histogram"""
+    start = time.perf_counter()
+    result = predict_with(model_id, model_info["compiled"] or model_info["model"], X)
+    if model_info["metrics"] is not None:
+        model_info["metrics"].latency.record(time.perf_counter() - start)
+    return result
+
+# Verdict cache: packet features keep full resolution (one cell per port),
+# the continuous flow statistics are bucketed coarsely so repeats still hit
+VERDICT_CACHE_FLOW_STEPS = int(os.environ.get("CYBERGUARD_CACHE_FLOW_STEPS", "32"))
+verdict_cache = VerdictCache(
+    steps=[65535.0] * len(PACKET_FEATURE_NAMES) + [VERDICT_CACHE_FLOW_STEPS] * len(FLOW_FEATURE_NAMES),
+    max_entries=int(os.environ.get("CYBERGUARD_CACHE_SIZE", "65536")),
+    ttl=float(os.environ.get("CYBERGUARD_CACHE_TTL", "300")),
+)
+
+def cached_predict(model_id: str, model_info: Dict[str, Any], X: np.ndarray):
+    """timed_predict behind the verdict cache; only uncached vectors reach the estimator"""
+    if not verdict_cache.enabled:
+        return timed_predict(model_id, model_info, X)
+    version = (model_info["version"], model_info["revision"])
+    return verdict_cache.score(model_id, version, X, partial(timed_predict, model_id, model_info))
+
+def score_features(model_id: str, X: np.ndarray):
+    """Score a feature matrix with the live estimator for model_id"""
+    return cached_predict(model_id, models[model_id], X)
+
+def evaluate_holdout(model_id: str, model) -> ModelMetrics:
+    """Fresh metrics for a model version, seeded from the held-out set"""
+    X_val, y_val = get_validation_data()
+    predictions, confidences = predict_with(model_id, model, X_val)
+    metrics = ModelMetrics()
+    metrics.update(y_val, predictions, confidences, source="holdout")
+    return metrics
+
+def build_responses(model_id: str, X: np.ndarray, predictions, confidences) -> List[PredictionResponse]:
+    """Turn batched model outputs into one PredictionResponse per row"""
+    timestamp = datetime.now().isoformat()
+    return [
+        PredictionResponse(
+            modelId=model_id,
+            prediction=int(prediction),
+            confidence=float(confidence),
+            timestamp=timestamp,
+            features={
+                "port": float(row[0]),
+                "protocol": float(row[1]),
+                "packetSize": float(row[2])
+            }
+        )
+        for row, prediction, confidence in zip(X, predictions, confidences)
+    ]
+
+# Models load when the app starts, not on import: spawned training workers
+# re-import the launching script, and must not load every model again
+@app.on_event("startup")
+def load_models():
+    load_or_train_models(retrain=os.environ.get("CYBERGUARD_RETRAIN") == "1")
 
 @app.get("/")
 def read_root():
@@ -163,13 +679,30 @@ def get_models():
             "type": info["type"],
             "status": info["status"],
             "accuracy": info["accuracy"],
-            "lastTrained": datetime.now().strftime("%Y-%m-%d"),
-            "samples": 2000,
-            "features": 11
+            "lastTrained": (info["lastTrained"] or "")[:10],
+            "samples": info["samples"],
+            "features": len(FEATURE_NAMES),
+            "version": info["version"],
+            "backend": "compiled" if info["compiled"] is not None else "sklearn"
         }
         for model_id, info in models.items()
     ]
 
+@app.put("/api/models/{model_id}/backend")
+def set_backend(model_id: str, backend: str):
+    if model_id not in models:
+        raise HTTPException(status_code=404, detail="Model not found")
+    if backend not in INFERENCE_BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Unknown backend '{backend}', expected one of {', '.join(INFERENCE_BACKENDS)}")
+    
+    model_info = dict(models[model_id], backend=backend)
+    attach_backend(model_info)
+    if backend == "compiled" and model_info["compiled"] is None:
+        raise HTTPException(status_code=400, detail=f"{models[model_id]['type']} models have no compiled backend")
+    models[model_id] = model_info  # Atomic swap, like a retrain
+    
+    return {"success": True, "modelId": model_id, "backend": backend}
+
 @app.post("/api/predict/{model_id}")
 def predict(model_id: str, network_data: NetworkData):
     if model_id not in models:
@@ -183,49 +716,572 @@ def predict(model_id: str, network_data: NetworkData):
     features = extract_features(network_data)
     
     # Make prediction
-    model = model_info["model"]
+    predictions, confidences = score_features(model_id, features)
+    raise_alerts(model_id, [network_data], predictions, confidences)
+    return build_responses(model_id, features, predictions, confidences)[0]
+
+def score_records(model_id: str, records: List[NetworkData]) -> List[Any]:
+    """Vectorized scoring that keeps input order.
     
-    if model_id == "anomaly-detector":
-        # Isolation Forest returns -1 for anomalies, 1 for normal
-        prediction = model.predict(features)[0]
-        prediction = 1 if prediction == -1 else 0  # Convert to binary
-        confidence = abs(model.score_samples(features)[0])
-    else:
-        prediction = model.predict(features)[0]
-        if hasattr(model, "predict_proba"):
-            probabilities = model.predict_proba(features)[0]
-            confidence = max(probabilities)
-        else:
-            confidence = 0.8  # Default confidence for SVM without probability
-    
-    return PredictionResponse(
-        modelId=model_id,
-        prediction=int(prediction),
-        confidence=float(confidence),
-        timestamp=datetime.now().isoformat(),
-        features={
-            "port": float(features[0][0]),
-            "protocol": float(features[0][1]),
-            "packetSize": float(features[0][2])
-        }
-    )
+    Returns one entry per record: a PredictionResponse, or an error message
+    string for records that could not be scored.
+    """
+    results: List[Any] = [None] * len(records)
+    
+    # Extract features in one columnar pass; malformed records only drop themselves
+    X, errors = extract_features_batch(records)
+    for row, message in errors.items():
+        results[row] = message
+    rows = [row for row in range(len(records)) if row not in errors]
+    if errors:
+        X = X[rows]
+    
+    if not rows:
+        return results
+    
+    try:
+        predictions, confidences = score_features(model_id, X)
+        responses = build_responses(model_id, X, predictions, confidences)
+        raise_alerts(model_id, [records[row] for row in rows], predictions, confidences)
+    except Exception as e:
+        # Fall back to scoring rows one at a time to isolate the bad record
+        print(f"Batch prediction failed, scoring records individually: {e}")
+        responses = []
+        for row, features in zip(rows, X):
+            features = features.reshape(1, -1)
+            try:
+                prediction, confidence = score_features(model_id, features)
+                responses.extend(build_responses(model_id, features, prediction, confidence))
+                raise_alerts(model_id, [records[row]], prediction, confidence)
+            except Exception as e:
+                responses.append(str(e))
+    
+    for row, response in zip(rows, responses):
+        results[row] = response
+    return results
 
 @app.post("/api/batch-predict/{model_id}")
 def batch_predict(model_id: str, request: BatchPredictionRequest):
     if model_id not in models:
         raise HTTPException(status_code=404, detail="Model not found")
     
+    if not models[model_id]["trained"]:
+        return []
+    
     results = []
-    for data in request.data:
-        try:
-            result = predict(model_id, data)
-            results.append(result)
-        except Exception as e:
-            print(f"Error predicting for data point: {e}")
+    for result in score_records(model_id, request.data):
+        if isinstance(result, str):
+            print(f"Error predicting for data point: {result}")
             continue
+        results.append(result)
     
     return results
 
+# Ensemble scoring: features are extracted once and fanned out to every
+# trained detector; sklearn releases the GIL in predict, so threads overlap
+ENSEMBLE_RULES = ("majority", "any", "all", "weighted")
+ensemble_pool = ThreadPoolExecutor(max_workers=len(models))
+
+def score_all_models(X: np.ndarray, parallel: bool = True, model_ids: List[str] = None) -> Dict[str, Any]:
+    """Score a feature matrix with every trained model (or just model_ids); returns {model_id: (predictions, confidences)}"""
+    # Snapshot the registry so a concurrent hot swap cannot mix model versions mid-request
+    snapshot = [(model_id, info) for model_id, info in list(models.items())
+                if info["trained"] and (model_ids is None or model_id in model_ids)]
+    
+    def run(item):
+        model_id, info = item
+        try:
+            return model_id, cached_predict(model_id, info, X)
+        except Exception as e:
+            print(f"Ensemble: {model_id} failed, excluding it from the vote: {e}")
+            return model_id, None
+    
+    results = ensemble_pool.map(run, snapshot) if parallel and len(snapshot) > 1 else map(run, snapshot)
+    return {model_id: result for model_id, result in results if result is not None}
+
+def combine_verdicts(results: Dict[str, Any], rule: str, threshold: float = 0.5):
+    """Combine per-model votes into one verdict per row.
+    
+    score is the (accuracy-weighted, for the weighted rule) fraction of
+    detectors flagging the row as a threat.
+    """
+    votes = np.vstack([predictions for predictions, _ in results.values()]).astype(np.float64)
+    if rule == "weighted":
+        weights = np.array([models[model_id]["accuracy"] for model_id in results], dtype=np.float64)
+    else:
+        weights = np.ones(len(results))
+    scores = weights @ votes / weights.sum()
+    
+    if rule == "any":
+        verdicts = votes.any(axis=0)
+    elif rule == "all":
+        verdicts = votes.all(axis=0)
+    elif rule == "majority":
+        verdicts = scores > 0.5
+    else:
+        verdicts = scores >= threshold
+    return verdicts.astype(int), scores
+
+def ensemble_predict(records: List[NetworkData], rule: str, threshold: float, parallel: bool,
+                     strict: bool = False) -> List[EnsemblePredictionResponse]:
+    """Ensemble verdicts for records; malformed records are skipped, or rejected with a 400 when strict"""
+    if rule not in ENSEMBLE_RULES:
+        raise HTTPException(status_code=400, detail=f"Unknown rule '{rule}', expected one of {', '.join(ENSEMBLE_RULES)}")
+    
+    X, errors = extract_features_batch(records)
+    if strict and errors:
+        raise HTTPException(status_code=400, detail=errors[min(errors)])
+    for row in sorted(errors):
+        print(f"Error predicting for data point: {errors[row]}")
+    if errors:
+        X = np.delete(X, list(errors), axis=0)
+    if not len(X):
+        return []
+    
+    results = score_all_models(X, parallel)
+    if not results:
+        raise HTTPException(status_code=400, detail="No trained models available")
+    verdicts, scores = combine_verdicts(results, rule, threshold)
+    raise_alerts("ensemble", [record for row, record in enumerate(records) if row not in errors], verdicts, scores)
+    
+    timestamp = datetime.now().isoformat()
+    return [
+        EnsemblePredictionResponse(
+            prediction=int(verdicts[i]),
+            score=float(scores[i]),
+            rule=rule,
+            timestamp=timestamp,
+            models={
+                model_id: ModelVerdict(prediction=int(predictions[i]), confidence=float(confidences[i]))
+                for model_id, (predictions, confidences) in results.items()
+            },
+            features={
+                "port": float(X[i][0]),
+                "protocol": float(X[i][1]),
+                "packetSize": float(X[i][2])
+            }
+        )
+        for i in range(len(X))
+    ]
+
+@app.post("/api/predict-all")
+def predict_all(network_data: NetworkData, rule: str = "majority", threshold: float = 0.5, parallel: bool = True):
+    return ensemble_predict([network_data], rule, threshold, parallel, strict=True)[0]
+
+@app.post("/api/batch-predict-all")
+def batch_predict_all(request: BatchPredictionRequest, rule: str = "majority", threshold: float = 0.5, parallel: bool = True):
+    return ensemble_predict(request.data, rule, threshold, parallel)
+
+# Streaming ingestion: clients push records over a WebSocket, the server groups
+# them into micro-batches bounded by size and age, and streams verdicts back
+STREAM_MAX_BATCH = int(os.environ.get("CYBERGUARD_STREAM_MAX_BATCH", "1024"))
+STREAM_MAX_LATENCY_MS = float(os.environ.get("CYBERGUARD_STREAM_MAX_LATENCY_MS", "25"))
+STREAM_QUEUE_BATCHES = 4  # Records buffered per connection, in units of max_batch
+STREAM_LATENCY_LIMIT_MS = 1000.0  # Longest a client may ask records to wait for their batch
+
+async def read_stream(websocket: WebSocket, queue: asyncio.Queue):
+    """Parse incoming messages (one record or a list) into (seq, record) items.
+    
+    queue.put blocks once the buffer is full, which stops reads from the
+    socket and pushes backpressure onto the client's TCP window.
+    """
+    seq = 0
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                payload = json.loads(message)
+            except ValueError as e:
+                await queue.put((seq, f"Invalid JSON: {e}"))
+                seq += 1
+                continue
+            for item in payload if isinstance(payload, list) else [payload]:
+                try:
+                    record = NetworkData(**item)
+                except Exception as e:
+                    record = f"Invalid record: {e}"
+                await queue.put((seq, record))
+                seq += 1
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await queue.put(None)
+
+async def next_micro_batch(queue: asyncio.Queue, max_batch: int, max_latency: float):
+    """Wait for one item, then keep collecting until the batch is full or max_latency has passed.
+    
+    Returns the batch and whether the stream has ended.
+    """
+    item = await queue.get()
+    if item is None:
+        return [], True
+    
+    batch = [item]
+    deadline = asyncio.get_running_loop().time() + max_latency
+    while len(batch) < max_batch:
+        timeout = deadline - asyncio.get_running_loop().time()
+        try:
+            item = queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(queue.get(), timeout)
+        except (asyncio.QueueEmpty, asyncio.TimeoutError):
+            break
+        if item is None:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+@app.websocket("/api/stream/{model_id}")
+async def stream_predict(websocket: WebSocket, model_id: str,
+                         max_batch: int = STREAM_MAX_BATCH, max_latency_ms: float = STREAM_MAX_LATENCY_MS):
+    await websocket.accept()
+    if model_id not in models or not models[model_id]["trained"]:
+        await websocket.close(code=1008, reason="Model not found or not trained")
+        return
+    
+    # Clients may ask for smaller, sooner batches but not for a bigger buffer
+    max_batch = min(max(1, max_batch), STREAM_MAX_BATCH)
+    max_latency_ms = float(np.clip(np.nan_to_num(max_latency_ms, nan=STREAM_MAX_LATENCY_MS), 1.0, STREAM_LATENCY_LIMIT_MS))
+    queue = asyncio.Queue(maxsize=max_batch * STREAM_QUEUE_BATCHES)
+    reader = asyncio.create_task(read_stream(websocket, queue))
+    try:
+        done = False
+        while not done:
+            batch, done = await next_micro_batch(queue, max_batch, max_latency_ms / 1000.0)
+            if not batch:
+                continue
+            
+            records = [record for _, record in batch if not isinstance(record, str)]
+            # Score off the event loop so the reader keeps filling the next batch
+            scored = iter(await run_in_threadpool(score_records, model_id, records))
+            
+            verdicts = []
+            for seq, record in batch:
+                result = record if isinstance(record, str) else next(scored)
+                if isinstance(result, str):
+                    verdicts.append({"seq": seq, "error": result})
+                else:
+                    verdicts.append({"seq": seq, **result.model_dump()})
+            await websocket.send_text(json.dumps(verdicts))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+
+# Alerts: positive verdicts from every scoring path (single, batch, ensemble
+# and stream) are aggregated per (source IP, model, time bucket) and pushed to
+# dashboards over SSE or a WebSocket, so they no longer need to poll. Sealed
+# buckets go to an append-only JSON-lines log that backs the history API.
+# With several workers each one aggregates and pushes the traffic it scores;
+# the log is shared.
+ALERT_BUCKET_SECONDS = float(os.environ.get("CYBERGUARD_ALERT_BUCKET_SECONDS", "60"))
+ALERT_RETENTION_SECONDS = float(os.environ.get("CYBERGUARD_ALERT_RETENTION_SECONDS", "3600"))
+ALERT_LOG = os.environ.get("CYBERGUARD_ALERT_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alerts.jsonl"))
+ALERT_HEARTBEAT_SECONDS = 15.0
+alert_store = AlertStore(ALERT_BUCKET_SECONDS, ALERT_RETENTION_SECONDS, ALERT_LOG or None)
+
+def raise_alerts(model_id: str, records: List[NetworkData], predictions, confidences):
+    """Feed the positive verdicts for records into the alert store"""
+    rows = [
+        (record.sourceIp, record.destIp, record.port, confidence)
+        for record, prediction, confidence in zip(records, predictions, confidences)
+        if prediction == 1
+    ]
+    if rows:
+        alert_store.record(model_id, rows)
+
+def seal_alerts():
+    while True:
+        time.sleep(1.0)
+        try:
+            alert_store.seal()
+        except Exception as e:
+            print(f"Sealing alerts failed: {e}")
+
+@app.on_event("startup")
+def start_alert_sealer():
+    threading.Thread(target=seal_alerts, daemon=True).start()
+
+def parse_time(value: str, name: str) -> float:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 timestamp")
+
+async def next_alerts(queue: asyncio.Queue) -> List[Dict[str, Any]]:
+    """Wait for an alert event, then take everything else already queued.
+    
+    Several updates to one alert collapse into its latest state. Returns an
+    empty list if nothing arrived within the heartbeat interval.
+    """
+    try:
+        alerts = [await asyncio.wait_for(queue.get(), ALERT_HEARTBEAT_SECONDS)]
+    except asyncio.TimeoutError:
+        return []
+    while not queue.empty():
+        alerts.append(queue.get_nowait())
+    return list({alert["id"]: alert for alert in alerts}.values())
+
+@app.get("/api/alerts")
+def get_alerts(model_id: str = None, since: str = None):
+    """Alerts within the retention window, newest bucket first"""
+    return alert_store.active(model_id, parse_time(since, "since"))
+
+@app.get("/api/alerts/timeline")
+def get_alert_timeline(model_id: str = None):
+    return alert_store.timeline(model_id)
+
+@app.get("/api/alerts/history")
+def get_alert_history(since: str = None, until: str = None, model_id: str = None, source_ip: str = None,
+                      cursor: int = None, limit: int = 100):
+    """Sealed alerts from the log, oldest first; pass nextCursor back as cursor for the next page"""
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    try:
+        alerts, next_cursor = alert_store.history(parse_time(since, "since"), parse_time(until, "until"),
+                                                  model_id, source_ip, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # A cursor that no page returned
+    return {"alerts": alerts, "nextCursor": next_cursor}
+
+@app.get("/api/alerts/stream")
+async def alert_stream(request: Request):
+    """Server-Sent Events: a snapshot of the active alerts, then batches of new or updated ones"""
+    queue = alert_store.subscribe()
+    
+    async def events():
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(alert_store.active())}\n\n"
+            while not await request.is_disconnected():
+                alerts = await next_alerts(queue)
+                if alerts:
+                    yield f"event: alerts\ndata: {json.dumps(alerts)}\n\n"
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            alert_store.unsubscribe(queue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/api/alerts/ws")
+async def alert_socket(websocket: WebSocket):
+    """WebSocket form of the alert feed: {"type": "snapshot" | "alerts" | "heartbeat", "alerts": [...]}"""
+    await websocket.accept()
+    queue = alert_store.subscribe()
+    try:
+        await websocket.send_text(json.dumps({"type": "snapshot", "alerts": alert_store.active()}))
+        while True:
+            alerts = await next_alerts(queue)
+            # Heartbeats double as the disconnect check for an otherwise quiet socket
+            await websocket.send_text(json.dumps({"type": "alerts" if alerts else "heartbeat", "alerts": alerts}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        alert_store.unsubscribe(queue)
+
+# Background training jobs: estimators are fitted in a process pool and only
+# swapped into the registry once fully fitted and validated. A refit that
+# scores more than TRAINING_ACCURACY_TOLERANCE below the live model on the
+# validation set is rejected unless the request forces it.
+MAX_TRAINING_JOBS = 100
+ACTIVE_JOB_STATES = ("queued", "running", "validating")
+TRAINING_ACCURACY_TOLERANCE = float(os.environ.get("CYBERGUARD_TRAIN_TOLERANCE", "0.02"))
+training_jobs: Dict[str, Dict[str, Any]] = {}
+training_lock = threading.Lock()
+training_pool = None
+training_pool_lock = threading.Lock()
+
+def get_training_pool() -> ProcessPoolExecutor:
+    global training_pool
+    with training_pool_lock:
+        if training_pool is None:
+            training_pool = ProcessPoolExecutor(
+                max_workers=int(os.environ.get("CYBERGUARD_TRAIN_WORKERS", "1")),
+                initializer=lower_priority,
+                # Forking a threaded server copies its locks mid-use; workers start fresh instead
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return training_pool
+
+def discard_training_pool(pool: ProcessPoolExecutor):
+    """Drop a pool that a dead worker (e.g. an OOM kill) has broken, so the next job starts a fresh one"""
+    global training_pool
+    with training_pool_lock:
+        if training_pool is pool:
+            training_pool = None
+    # Never wait: this may run on the broken pool's own management thread
+    pool.shutdown(wait=False, cancel_futures=True)
+
+@contextmanager
+def spawnable_main():
+    """Hide a __main__ that spawned workers could not re-import (e.g. a script read from stdin).
+    
+    Spawn workers start inside submit and re-run the launching script's
+    file; without one they just skip that step.
+    """
+    main_module = sys.modules["__main__"]
+    path = getattr(main_module, "__file__", None)
+    if path is None or os.path.isfile(path):
+        yield
+        return
+    del main_module.__file__
+    try:
+        yield
+    finally:
+        main_module.__file__ = path
+
+def submit_fit(model_id: str, estimator, X: np.ndarray, y: np.ndarray):
+    """Start fit_estimator in the training pool, replacing the pool if a dead worker broke it; returns (pool, future)"""
+    pool = get_training_pool()
+    try:
+        with spawnable_main():
+            return pool, pool.submit(fit_estimator, model_id, estimator, X, y)
+    except BrokenProcessPool:
+        discard_training_pool(pool)
+        pool = get_training_pool()
+        with spawnable_main():
+            return pool, pool.submit(fit_estimator, model_id, estimator, X, y)
+
+def validate_model(model_id: str, model) -> ModelMetrics:
+    """Sanity-check a fitted estimator before it goes live; returns its held-out metrics"""
+    X_val, _ = get_validation_data()
+    if getattr(model, "n_features_in_", None) != len(FEATURE_NAMES):
+        raise ValueError(f"expected {len(FEATURE_NAMES)} features, model has {getattr(model, 'n_features_in_', None)}")
+    
+    predictions, confidences = predict_with(model_id, model, X_val)
+    if predictions.shape != (len(X_val),) or not np.all(np.isfinite(confidences)):
+        raise ValueError("model produced malformed predictions on the validation set")
+    
+    return evaluate_holdout(model_id, model)
+
+def finish_training_job(job_id: str, pool: ProcessPoolExecutor, future):
+    """Validate a finished fit and atomically swap it into the registry"""
+    job = training_jobs[job_id]
+    model_id = job["modelId"]
+    try:
+        try:
+            model, train_time = future.result()
+        except BrokenProcessPool:
+            discard_training_pool(pool)
+            raise RuntimeError("the training worker died (out of memory?); the pool was restarted, submit the job again")
+        job.update(status="validating", progress=0.9)
+        metrics = validate_model(model_id, model)
+        live = models[model_id]
+        if model_id == "anomaly-detector":
+            accuracy = live["accuracy"]  # Unsupervised, keep the reference figure
+        else:
+            accuracy = metrics.summary()["accuracy"]
+            # Compare on the same validation set, not against the live model's running metrics
+            baseline = evaluate_holdout(model_id, live["model"]).summary()["accuracy"] if live["trained"] else None
+            job["baselineAccuracy"] = baseline
+            if baseline is not None and accuracy < baseline - TRAINING_ACCURACY_TOLERANCE and not job["force"]:
+                models[model_id]["status"] = "active"
+                job.update(status="rejected", accuracy=accuracy, finishedAt=datetime.now().isoformat(),
+                           error=f"validation accuracy {accuracy:.3f} is below the live model's {baseline:.3f} "
+                                 f"by more than {TRAINING_ACCURACY_TOLERANCE}; retrain with force to swap it in anyway")
+                return
+        
+        model_info = dict(
+            models[model_id],
+            model=model,
+            metrics=metrics,
+            accuracy=accuracy,
+            trainTime=train_time,
+            samples=job["samples"],
+            lastTrained=datetime.now().isoformat(),
+            trained=True,
+            status="active",
+            revision=0,
+        )
+        attach_backend(model_info)
+        # The refit replaces any online revisions made while it ran
+        with online_state[model_id]["lock"]:
+            version = save_model(model_id, model_info)
+            # Single reference swap: requests see either the old or the new entry, never a mix
+            models[model_id] = model_info
+            verdict_cache.invalidate(model_id, (version, 0))
+        job.update(status="completed", progress=1.0, version=version, accuracy=accuracy, trainTime=train_time)
+    except Exception as e:
+        models[model_id]["status"] = "active"
+        job.update(status="failed", error=str(e))
+    job["finishedAt"] = datetime.now().isoformat()
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    view = {key: value for key, value in job.items() if key != "future"}
+    if view["status"] == "queued" and job["future"] is not None and job["future"].running():
+        view.update(status="running", progress=0.5)
+    return view
+
+# Online learning: a labelled batch updates the live model instead of
+# refitting it (partial_fit on a copy for the MLP and kernel SGD models; for
+# the forests, a few new trees joined to a shallow copy that shares the trees
+# it keeps and drops the oldest past ONLINE_MAX_TREES). Each update also replays rows sampled from a bounded
+# reservoir of past events, and the result is swapped in as a new revision of
+# the served version. Revisions are persisted as a registry version at most
+# every ONLINE_SAVE_SECONDS; until then they live in this worker only.
+ONLINE_RESERVOIR_SIZE = int(os.environ.get("CYBERGUARD_ONLINE_RESERVOIR", "10000"))
+ONLINE_REPLAY = int(os.environ.get("CYBERGUARD_ONLINE_REPLAY", "1000"))
+ONLINE_NEW_TREES = int(os.environ.get("CYBERGUARD_ONLINE_NEW_TREES", "10"))
+ONLINE_MAX_TREES = int(os.environ.get("CYBERGUARD_ONLINE_MAX_TREES", "100"))
+ONLINE_SAVE_SECONDS = float(os.environ.get("CYBERGUARD_ONLINE_SAVE_SECONDS", "60"))
+# The lock orders every swap of a model's entry: online updates, refits and reloads
+online_state = {model_id: {"lock": threading.Lock(), "reservoir": None, "savedAt": time.monotonic()} for model_id in models}
+online_saver = ThreadPoolExecutor(max_workers=1)
+
+def get_reservoir(model_id: str) -> Reservoir:
+    state = online_state[model_id]
+    if state["reservoir"] is None:
+        # Start from the distribution the initial models were trained on
+        reservoir = Reservoir(ONLINE_RESERVOIR_SIZE, len(FEATURE_NAMES))
+        X, y = generate_training_data(min(ONLINE_RESERVOIR_SIZE, 2000))
+        reservoir.add(X, y)
+        state["reservoir"] = reservoir
+    return state["reservoir"]
+
+def learn_online(model_id: str, X: np.ndarray, y: np.ndarray) -> Dict[str, Any]:
+    """Update model_id with one labelled batch and swap the result in as a new revision"""
+    state = online_state[model_id]
+    with state["lock"]:
+        current = models[model_id]
+        if not current["trained"] or not can_learn_online(current["model"]):
+            raise ValueError(f"{current['name']} cannot learn online")
+        # The live estimator keeps serving; the update comes back as a new object
+        estimator, update_time = online_update(model_id, current["model"], X, y, get_reservoir(model_id),
+                                               ONLINE_REPLAY, ONLINE_NEW_TREES, ONLINE_MAX_TREES)
+        model_info = dict(
+            current,
+            model=estimator,
+            revision=current["revision"] + 1,
+            samples=current["samples"] + len(X),
+            lastTrained=datetime.now().isoformat(),
+        )
+        attach_backend(model_info)
+        models[model_id] = model_info
+        verdict_cache.invalidate(model_id, (model_info["version"], model_info["revision"]))
+        if time.monotonic() - state["savedAt"] >= ONLINE_SAVE_SECONDS:
+            state["savedAt"] = time.monotonic()
+            online_saver.submit(persist_online_model, model_id)
+    return {
+        "updateTimeMs": update_time * 1000,
+        "version": model_info["version"],
+        "revision": model_info["revision"],
+        "reservoir": len(state["reservoir"]),
+    }
+
+def persist_online_model(model_id: str):
+    """Save the live online revision as a new registry version so other workers pick it up"""
+    with online_state[model_id]["lock"]:
+        current = models[model_id]
+        if current["revision"] == 0:
+            return
+        try:
+            version = save_model(model_id, dict(current))
+        except Exception as e:
+            print(f"Saving online revision of {model_id} failed: {e}")
+            return
+        models[model_id] = dict(current, version=version, revision=0)
+        verdict_cache.invalidate(model_id, (version, 0))
+
 @app.post("/api/train/{model_id}")
 def train_model(model_id: str, request: TrainingRequest):
     if model_id not in models:
@@ -233,29 +1289,76 @@ def train_model(model_id: str, request: TrainingRequest):
     
     try:
         # Extract features from training data
-        X = []
-        for data in request.data:
-            features = extract_features(data)
-            X.append(features.flatten())
+        # Flow statistics for uploaded samples come from the upload alone, not live traffic
+        X, errors = extract_features_batch(request.data, flows=FlowFeatureEngine(max_flows=2 * max(len(request.data), 1)), record_times=True)
+        if errors:
+            raise ValueError(errors[min(errors)])
         
-        X = np.array(X)
+        if request.labels is not None:
+            if len(request.labels) != len(request.data):
+                raise ValueError("data and labels must have the same length")
+            if any(label not in (0, 1) for label in request.labels):
+                raise ValueError("labels must be 0 (benign) or 1 (threat)")
+            y = np.asarray(request.labels)
+        elif request.incremental and model_id != "anomaly-detector":
+            raise ValueError("online updates need labels")
+        else:
+            # For demonstration, generate labels (in real scenario, you'd have labeled data)
+            y = np.random.choice([0, 1], size=len(X), p=[0.8, 0.2])
         
-        # For demonstration, generate labels (in real scenario, you'd have labeled data)
-        y = np.random.choice([0, 1], size=len(X), p=[0.8, 0.2])
+        if request.incremental:
+            update = learn_online(model_id, X, y)
+            return {
+                "success": True,
+                "message": f"Online update of {model_id} with {len(X)} samples",
+                **update
+            }
         
-        # Retrain model
-        model_info = models[model_id]
-        if model_id != "anomaly-detector":
-            model_info["model"].fit(X, y)
-        else:
-            model_info["model"].fit(X)
+        with training_lock:
+            for job in training_jobs.values():
+                if job["modelId"] == model_id and job["status"] in ACTIVE_JOB_STATES:
+                    return {
+                        "success": False,
+                        "message": f"Model {model_id} is already training",
+                        "jobId": job["id"]
+                    }
+            
+            job_id = uuid.uuid4().hex[:12]
+            job = {
+                "id": job_id,
+                "modelId": model_id,
+                "status": "queued",
+                "progress": 0.0,
+                "samples": len(X),
+                "createdAt": datetime.now().isoformat(),
+                "finishedAt": None,
+                "version": None,
+                "accuracy": None,
+                "trainTime": None,
+                "baselineAccuracy": None,
+                "force": request.force,
+                "error": None,
+                "future": None
+            }
+            training_jobs[job_id] = job
+            
+            finished = [jid for jid, j in training_jobs.items() if j["status"] not in ACTIVE_JOB_STATES]
+            for jid in finished[:max(0, len(training_jobs) - MAX_TRAINING_JOBS)]:
+                del training_jobs[jid]
         
-        model_info["trained"] = True
-        model_info["status"] = "active"
+        # Fit a fresh clone so the live estimator is never touched mid-fit
+        try:
+            pool, job["future"] = submit_fit(model_id, clone(models[model_id]["model"]), X, y)
+        except Exception as e:
+            job.update(status="failed", error=str(e), finishedAt=datetime.now().isoformat())
+            raise
+        models[model_id]["status"] = "training"
+        job["future"].add_done_callback(partial(finish_training_job, job_id, pool))
         
         return {
             "success": True,
-            "message": f"Model {model_id} retrained successfully with {len(X)} samples"
+            "message": f"Training job {job_id} started for {model_id} with {len(X)} samples",
+            "jobId": job_id
         }
         
     except Exception as e:
@@ -264,23 +1367,118 @@ def train_model(model_id: str, request: TrainingRequest):
             "message": f"Training failed: {str(e)}"
         }
 
-@app.get("/api/metrics/{model_id}")
-def get_metrics(model_id: str):
+@app.get("/api/train/jobs")
+def list_training_jobs():
+    return [job_view(job) for job in list(training_jobs.values())]
+
+@app.get("/api/train/jobs/{job_id}")
+def get_training_job(job_id: str):
+    if job_id not in training_jobs:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return job_view(training_jobs[job_id])
+
+@app.post("/api/feedback/{model_id}")
+def submit_feedback(model_id: str, request: FeedbackRequest, learn: bool = False):
+    """Score labelled records and fold the outcomes into the model's live metrics;
+    with learn=true the records then update the model online as well
+    """
     if model_id not in models:
         raise HTTPException(status_code=404, detail="Model not found")
+    if len(request.data) != len(request.labels):
+        raise HTTPException(status_code=400, detail="data and labels must have the same length")
+    if any(label not in (0, 1) for label in request.labels):
+        raise HTTPException(status_code=400, detail="labels must be 0 (benign) or 1 (threat)")
+    
+    # Labelled records replay past traffic, so keep them out of the live flow state
+    X, errors = extract_features_batch(request.data, flows=FlowFeatureEngine(max_flows=2 * max(len(request.data), 1)),
+                                       record_times=True)
+    rows = [row for row in range(len(request.data)) if row not in errors]
+    if rows:
+        model_info = models[model_id]
+        predictions, confidences = timed_predict(model_id, model_info, X[rows])
+        model_info["metrics"].update(np.asarray(request.labels)[rows], predictions, confidences)
+    
+    update = None
+    if learn and rows:
+        try:
+            update = learn_online(model_id, X[rows], np.asarray(request.labels)[rows])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    # Return mock metrics (in real scenario, calculate from test set)
     return {
-        "truePositiveRate": 0.978,
-        "falsePositiveRate": 0.012,
-        "precision": 0.985,
-        "recall": 0.969,
-        "f1Score": 0.977,
-        "accuracy": models[model_id]["accuracy"]
+        "success": True,
+        "accepted": len(rows),
+        "rejected": len(errors),
+        "update": update
     }
 
+@app.get("/api/metrics/{model_id}")
+def get_metrics(model_id: str):
+    if model_id not in models:
+        raise HTTPException(status_code=404, detail="Model not found")
+    
+    model_info = models[model_id]
+    return {**model_info["metrics"].summary(), "version": model_info["version"], "cache": verdict_cache.summary(model_id)}
+
+# Multi-worker serving: every worker process maps the same registry artifacts
+# (mmap_mode="c"), so NumPy-held weights (MLP coefficients, SVC support
+# vectors) live once in the page cache. sklearn trees copy their node arrays
+# on load, so forests still cost their size per worker. A model trained in one
+# worker reaches the others through the registry: each worker polls it and
+# hot-swaps newer versions. Flow state, the verdict cache, metrics, training
+# jobs and online revisions not yet saved stay per worker.
+RELOAD_INTERVAL_SECONDS = float(os.environ.get("CYBERGUARD_RELOAD_SECONDS", "5"))
+
+def reload_models() -> Dict[str, int]:
+    """Swap in registry versions that differ from the ones being served; returns {model_id: version}"""
+    reloaded = {}
+    for model_id in list(models):
+        current = models[model_id]
+        versions = list_model_versions(model_id)
+        if not versions or versions[-1] == current["version"]:
+            continue
+        model_info = dict(current, revision=0)
+        if not load_model(model_id, model_info):
+            continue
+        model_info["metrics"] = evaluate_holdout(model_id, model_info["model"])
+        attach_backend(model_info)
+        with online_state[model_id]["lock"]:
+            if models[model_id]["version"] >= model_info["version"]:
+                continue  # This worker saved that version itself meanwhile
+            models[model_id] = model_info
+            verdict_cache.invalidate(model_id, (model_info["version"], 0))
+        reloaded[model_id] = model_info["version"]
+        print(f"Reloaded {model_info['name']} v{model_info['version']}")
+    return reloaded
+
+def watch_registry(interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            reload_models()
+        except Exception as e:
+            print(f"Registry reload failed: {e}")
+
+@app.on_event("startup")
+def start_registry_watcher():
+    if RELOAD_INTERVAL_SECONDS > 0:
+        threading.Thread(target=watch_registry, args=(RELOAD_INTERVAL_SECONDS,), daemon=True).start()
+
+@app.post("/api/models/reload")
+def reload_registry():
+    """Load newer registry versions in this worker now; the others follow within RELOAD_INTERVAL_SECONDS"""
+    return {"success": True, "reloaded": reload_models()}
+
 if __name__ == "__main__":
     import uvicorn
-    print("Starting CyberGuard ML API server...")
+    workers = int(os.environ.get("CYBERGUARD_WORKERS", "1"))
+    print(f"Starting CyberGuard ML API server with {workers} worker(s)...")
     print("API Documentation: http://localhost:8000/docs")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if workers > 1:
+        # Train (and save) missing models once here; workers only map the artifacts at startup
+        with registry_lock():
+            train_missing_models(retrain=os.environ.get("CYBERGUARD_RETRAIN") == "1")
+        os.environ["CYBERGUARD_RETRAIN"] = "0"
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,113 @@
+"""Incrementally maintained evaluation metrics for the CyberGuard ML API
+
+Every labelled event costs O(1): it bumps a confusion-matrix cell and a
+calibration bin. Inference calls land in a log-bucketed latency histogram,
+so the metrics endpoint only ever reads counters.
+"""
+import math
+import threading
+
+import numpy as np
+
+CALIBRATION_BINS = 10
+LATENCY_MIN_SECONDS = 1e-6
+LATENCY_BUCKETS_PER_DOUBLING = 8
+LATENCY_BUCKETS = LATENCY_BUCKETS_PER_DOUBLING * 28  # 1us up to ~4.5 minutes
+
+
+def ratio(numerator, denominator) -> float:
+    return float(numerator / denominator) if denominator else 0.0
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram of inference times (~9% bucket width)"""
+
+    def __init__(self):
+        self.counts = np.zeros(LATENCY_BUCKETS, dtype=np.int64)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        if seconds <= LATENCY_MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log2(seconds / LATENCY_MIN_SECONDS) * LATENCY_BUCKETS_PER_DOUBLING), LATENCY_BUCKETS - 1)
+        with self.lock:
+            self.counts[bucket] += 1
+
+    def percentile(self, q: float) -> float:
+        """Upper edge of the bucket holding the q-th percentile, in seconds"""
+        cumulative = np.cumsum(self.counts)
+        if not cumulative[-1]:
+            return 0.0
+        bucket = int(np.searchsorted(cumulative, q / 100.0 * cumulative[-1]))
+        return LATENCY_MIN_SECONDS * 2 ** ((bucket + 1) / LATENCY_BUCKETS_PER_DOUBLING)
+
+    def summary(self) -> dict:
+        return {
+            "count": int(self.counts.sum()),
+            "p50Ms": self.percentile(50) * 1000,
+            "p95Ms": self.percentile(95) * 1000,
+            "p99Ms": self.percentile(99) * 1000,
+        }
+
+
+class ModelMetrics:
+    """Confusion matrix, calibration bins and latency histogram for one model version"""
+
+    def __init__(self):
+        self.confusion = np.zeros((2, 2), dtype=np.int64)  # [label, prediction]
+        self.bin_count = np.zeros(CALIBRATION_BINS, dtype=np.int64)
+        self.bin_confidence = np.zeros(CALIBRATION_BINS)
+        self.bin_correct = np.zeros(CALIBRATION_BINS, dtype=np.int64)
+        self.samples = {"holdout": 0, "feedback": 0}
+        self.latency = LatencyHistogram()
+        self.lock = threading.Lock()
+
+    def update(self, labels, predictions, confidences, source: str = "feedback"):
+        """Fold a batch of labelled verdicts into the counters"""
+        labels = np.asarray(labels, dtype=np.int64)
+        predictions = np.asarray(predictions).astype(np.int64)
+        confidences = np.clip(np.asarray(confidences, dtype=np.float64), 0.0, 1.0)
+        bins = np.minimum((confidences * CALIBRATION_BINS).astype(np.int64), CALIBRATION_BINS - 1)
+
+        with self.lock:
+            np.add.at(self.confusion, (labels, predictions), 1)
+            np.add.at(self.bin_count, bins, 1)
+            np.add.at(self.bin_confidence, bins, confidences)
+            np.add.at(self.bin_correct, bins, labels == predictions)
+            self.samples[source] += len(labels)
+
+    def summary(self) -> dict:
+        with self.lock:
+            (tn, fp), (fn, tp) = self.confusion.tolist()
+            bin_count = self.bin_count.copy()
+            bin_confidence = self.bin_confidence.copy()
+            bin_correct = self.bin_correct.copy()
+            samples = dict(self.samples)
+
+        total = tn + fp + fn + tp
+        precision = ratio(tp, tp + fp)
+        recall = ratio(tp, tp + fn)
+        bins = [
+            {
+                "confidence": ratio(bin_confidence[i], bin_count[i]),
+                "accuracy": ratio(bin_correct[i], bin_count[i]),
+                "count": int(bin_count[i]),
+            }
+            for i in range(CALIBRATION_BINS)
+        ]
+        # Expected calibration error: count-weighted gap between confidence and accuracy
+        ece = sum(b["count"] * abs(b["accuracy"] - b["confidence"]) for b in bins)
+
+        return {
+            "truePositiveRate": recall,
+            "falsePositiveRate": ratio(fp, fp + tn),
+            "precision": precision,
+            "recall": recall,
+            "f1Score": ratio(2 * precision * recall, precision + recall),
+            "accuracy": ratio(tp + tn, total),
+            "confusionMatrix": {"tp": tp, "fp": fp, "tn": tn, "fn": fn},
+            "samples": samples,
+            "calibration": {"expectedCalibrationError": ratio(ece, total), "bins": bins},
+            "latency": self.latency.summary(),
+        }
@@ -17,6 +17,25 @@ export interface ModelPrediction {
   features: Record<string, number>;
 }
 
+export interface Alert {
+  id: string;
+  modelId: string;
+  sourceIp: string;
+  bucketStart: string;
+  bucketSeconds: number;
+  firstSeen: string;
+  lastSeen: string;
+  count: number;
+  maxConfidence: number;
+  destIps: string[];
+  ports: number[];
+}
+
+export interface AlertPage {
+  alerts: Alert[];
+  nextCursor: number | null;
+}
+
 export interface NetworkData {
   timestamp: string;
   sourceIp: string;
@@ -125,6 +144,34 @@ class MLService {
     }
   }
 
+  // Subscribe to the server's alert feed; onAlerts receives the initial snapshot,
+  // then each batch of new or updated alerts. Returns an unsubscribe function.
+  subscribeAlerts(onAlerts: (alerts: Alert[]) => void): () => void {
+    const source = new EventSource(`${this.apiUrl}/api/alerts/stream`);
+    const handler = (event: MessageEvent) => onAlerts(JSON.parse(event.data));
+    source.addEventListener('snapshot', handler);
+    source.addEventListener('alerts', handler);
+    return () => source.close();
+  }
+
+  // Page through sealed alerts, oldest first; pass nextCursor back to continue
+  async getAlertHistory(params: { since?: string; until?: string; modelId?: string; sourceIp?: string; cursor?: number; limit?: number } = {}): Promise<AlertPage> {
+    const query = new URLSearchParams();
+    if (params.since) query.set('since', params.since);
+    if (params.until) query.set('until', params.until);
+    if (params.modelId) query.set('model_id', params.modelId);
+    if (params.sourceIp) query.set('source_ip', params.sourceIp);
+    if (params.cursor !== undefined) query.set('cursor', String(params.cursor));
+    if (params.limit !== undefined) query.set('limit', String(params.limit));
+    try {
+      const response = await fetch(`${this.apiUrl}/api/alerts/history?${query}`);
+      return await response.json();
+    } catch (error) {
+      console.log('Alert history not available:', error);
+      return { alerts: [], nextCursor: null };
+    }
+  }
+
   // Mock data for when backend is not available
   private getMockModels(): MLModel[] {
     return [
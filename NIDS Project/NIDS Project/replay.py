@@ -0,0 +1,375 @@
+"""Offline traffic replay for the CyberGuard ML API
+
+Streams a pcap capture or a CSV/NDJSON flow log from disk through the same
+vectorized feature and model path the API serves, writes one verdict row per
+packet and reports sustained packets/sec and peak RSS.
+
+Run from this directory, e.g.:
+    python replay.py capture.pcap
+    python replay.py flows.ndjson --models ddos-detector port-scan-detector --out verdicts.csv
+    python replay.py capture.pcap --chunk 131072 --discard
+"""
+import argparse
+import csv
+import json
+import mmap
+import os
+import re
+import resource
+import struct
+import sys
+import time
+
+import numpy as np
+
+import main
+from flows import FlowFeatureEngine, parse_timestamps
+
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+PCAPNG_MAGIC = b"\x0a\x0d\x0d\x0a"
+PCAP_HEADER_BYTES = 24
+RECORD_HEADER_BYTES = 16
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = (101, 228)  # Raw IP / raw IPv4
+LINKTYPE_LINUX_SLL = 113
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+
+IP_PROTOCOLS = {"ICMP": 1, "TCP": 6, "UDP": 17}
+PROTOCOL_VALUES = np.zeros(256)  # IP protocol number -> protocol feature
+for name, number in IP_PROTOCOLS.items():
+    PROTOCOL_VALUES[number] = main.PROTOCOL_MAP[name]
+
+# TCP header flag bits -> the feature pipeline's ALL_FLAGS bitmask
+TCP_FLAG_BITS = {"FIN": 0x01, "SYN": 0x02, "RST": 0x04, "PSH": 0x08, "ACK": 0x10, "URG": 0x20}
+TCP_FLAG_MASKS = np.zeros(256, dtype=np.uint8)
+for byte in range(256):
+    TCP_FLAG_MASKS[byte] = main.encode_flags([flag for flag, bit in TCP_FLAG_BITS.items() if byte & bit])
+
+
+def be16(data: np.ndarray, at: np.ndarray) -> np.ndarray:
+    return (data[at].astype(np.uint32) << 8) | data[at + 1]
+
+
+def be32(data: np.ndarray, at: np.ndarray) -> np.ndarray:
+    return (be16(data, at) << 16) | be16(data, at + 2)
+
+
+def le32(data: np.ndarray, at: np.ndarray) -> np.ndarray:
+    return ((data[at + 3].astype(np.uint32) << 24) | (data[at + 2].astype(np.uint32) << 16)
+            | (data[at + 1].astype(np.uint32) << 8) | data[at])
+
+
+def decode_packets(data: np.ndarray, records: np.ndarray, endian: str, tick: float, linktype: int):
+    """Vectorized Ethernet/IPv4/TCP/UDP header decode of one chunk of pcap records.
+
+    records holds the byte offset of each record header in data. Returns the
+    positions (into records) of the IPv4 packets and their feature columns.
+    """
+    u32 = le32 if endian == "<" else be32
+    times = u32(data, records) + u32(data, records + 4) * tick
+    captured = u32(data, records + 8).astype(np.int64)
+    sizes = u32(data, records + 12).astype(np.int64)
+    packet = records + RECORD_HEADER_BYTES
+    end = packet + captured
+    last = len(data) - 1
+
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype = be16(data, np.minimum(packet + 12, last - 1))
+        vlan = ethertype == ETHERTYPE_VLAN
+        ethertype = np.where(vlan, be16(data, np.minimum(packet + 16, last - 1)), ethertype)
+        l3 = packet + 14 + 4 * vlan
+        ipv4 = ethertype == ETHERTYPE_IPV4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        l3 = packet + 16
+        ipv4 = be16(data, np.minimum(packet + 14, last - 1)) == ETHERTYPE_IPV4
+    elif linktype in LINKTYPE_RAW:
+        l3 = packet
+        ipv4 = np.ones(len(records), dtype=bool)
+    else:
+        raise ValueError(f"unsupported pcap link type {linktype}")
+
+    ipv4 &= l3 + 20 <= end
+    ipv4 &= data[np.minimum(l3, last)] >> 4 == 4
+    keep = np.flatnonzero(ipv4)
+    l3, end = l3[keep], end[keep]
+
+    protocol = data[l3 + 9]
+    source = be32(data, l3 + 12)
+    dest = be32(data, l3 + 16)
+    # Only the first fragment of a datagram carries the transport header
+    first_fragment = (be16(data, l3 + 6) & 0x1FFF) == 0
+    l4 = l3 + (data[l3] & 0x0F).astype(np.int64) * 4
+    has_ports = first_fragment & ((protocol == IP_PROTOCOLS["TCP"]) | (protocol == IP_PROTOCOLS["UDP"])) & (l4 + 4 <= end)
+    has_flags = first_fragment & (protocol == IP_PROTOCOLS["TCP"]) & (l4 + 14 <= end)
+
+    ports = np.where(has_ports, be16(data, np.where(has_ports, l4 + 2, 0)), 0)
+    flag_masks = np.where(has_flags, TCP_FLAG_MASKS[data[np.where(has_flags, l4 + 13, 0)]], 0).astype(np.uint8)
+
+    return keep, {
+        "ports": ports.astype(np.int64),
+        "protocol_values": PROTOCOL_VALUES[protocol],
+        "packet_sizes": sizes[keep],
+        "flag_masks": flag_masks,
+        "source_octets": (source >> 24).astype(np.float64),
+        "dest_octets": (dest >> 24).astype(np.float64),
+        # Packed IPv4 addresses are cheaper flow keys than dotted strings
+        "source_keys": source.tolist(),
+        "dest_keys": dest.tolist(),
+        "times": times[keep],
+    }
+
+
+def read_pcap(path: str, chunk: int):
+    """Yield (records read, input positions, feature columns) for the IPv4 packets of a classic pcap file.
+
+    The file is memory-mapped and headers are decoded straight from the
+    mapping; packet bytes are never copied.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        magic = buf[:4]
+        if magic == PCAPNG_MAGIC:
+            raise ValueError(f"{path} is pcapng; convert it first, e.g. `editcap -F pcap {path} out.pcap`")
+        if magic not in PCAP_MAGIC or len(buf) < PCAP_HEADER_BYTES:
+            raise ValueError(f"{path} is not a pcap file")
+        endian, tick = PCAP_MAGIC[magic]
+        linktype = struct.unpack_from(endian + "I", buf, 20)[0] & 0x0FFFFFFF
+        data = np.frombuffer(buf, dtype=np.uint8)
+        try:
+            # Records are variable-length, so walking them is inherently sequential
+            read_length = struct.Struct(endian + "I").unpack_from
+            size = len(buf)
+            position = PCAP_HEADER_BYTES
+            first = 0
+            offsets = []
+            while True:
+                if position + RECORD_HEADER_BYTES <= size:
+                    captured = read_length(buf, position + 8)[0]
+                    if position + RECORD_HEADER_BYTES + captured <= size:  # Drop a truncated final record
+                        offsets.append(position)
+                    position += RECORD_HEADER_BYTES + captured
+                else:
+                    position = size
+                if len(offsets) == chunk or (position >= size and offsets):
+                    records = np.array(offsets, dtype=np.int64)
+                    keep, columns = decode_packets(data, records, endian, tick, linktype)
+                    yield len(offsets), first + keep, columns
+                    first += len(offsets)
+                    offsets = []
+                if position >= size:
+                    break
+        finally:
+            del data  # Release the buffer export before the mapping closes
+
+
+def split_flags(value) -> list:
+    if isinstance(value, list):
+        return value
+    return [flag for flag in re.split(r"[|,; ]+", value or "") if flag]
+
+
+def numeric_column(values, errors: dict) -> np.ndarray:
+    """float() over a column; rows that fail or are missing are reported in errors and left as 0"""
+    try:
+        column = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.zeros(len(values))
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except (TypeError, ValueError) as e:
+                errors.setdefault(i, str(e))
+    for i in np.flatnonzero(~np.isfinite(column)).tolist():
+        errors.setdefault(i, f"not a number: {values[i]!r}")
+        column[i] = 0.0
+    return column
+
+
+def row_timestamps(timestamps: list, first: int, rate: float, last: float = None):
+    """Epoch seconds for each row, the rows that failed to parse, and the last valid time.
+
+    A row whose timestamp is missing or malformed keeps the last valid time
+    seen (last carries it across chunks); rows before any valid timestamp
+    replay at a fixed rate instead.
+    """
+    times = parse_timestamps(timestamps)
+    if times is not None:
+        return times, 0, times[-1] if len(times) else last
+    times = np.empty(len(timestamps))
+    failed = 0
+    for i, timestamp in enumerate(timestamps):
+        parsed = parse_timestamps([timestamp]) if timestamp else None
+        if parsed is not None:
+            last = parsed[0]
+        elif timestamp:
+            failed += 1
+        times[i] = (first + i) / rate if last is None else last
+    return times, failed, last
+
+
+def flow_log_columns(rows: list, first: int, rate: float, last: float = None):
+    """Feature columns for a chunk of flow-log rows shaped like NetworkData.
+
+    Returns the columns, per-row parse errors of rows to skip, the number of
+    rows with an unparseable timestamp, and the last valid timestamp.
+    """
+    n = len(rows)
+    errors = {}
+    source_ips = [str(r.get("sourceIp", "")) for r in rows]
+    dest_ips = [str(r.get("destIp", "")) for r in rows]
+    times, bad_times, last = row_timestamps([str(r.get("timestamp") or "") for r in rows], first, rate, last)
+    columns = {
+        "ports": numeric_column([r.get("port") for r in rows], errors),
+        "protocol_values": np.fromiter((main.PROTOCOL_MAP.get(r.get("protocol"), 0.0) for r in rows), dtype=np.float64, count=n),
+        "packet_sizes": numeric_column([r.get("packetSize") for r in rows], errors),
+        "flag_masks": np.fromiter((main.encode_flags(split_flags(r.get("flags"))) for r in rows), dtype=np.uint8, count=n),
+        "source_octets": main.parse_first_octets(source_ips, errors),
+        "dest_octets": main.parse_first_octets(dest_ips, errors),
+        "source_keys": source_ips,
+        "dest_keys": dest_ips,
+        "times": times,
+    }
+    return columns, errors, bad_times, last
+
+
+def read_flow_log(path: str, chunk: int, rate: float, counts: dict = None):
+    """Yield (rows read, input positions, feature columns) for a CSV or NDJSON flow log.
+
+    Rows use NetworkData's field names; CSV flags may be separated by |, comma,
+    semicolon or space. Malformed rows are skipped; rows whose timestamp alone
+    is malformed are kept at the last valid time and tallied in
+    counts["badTimestamps"].
+    """
+    ndjson = path.endswith((".ndjson", ".jsonl", ".json"))
+    with open(path, newline="") as f:
+        rows = (json.loads(line) for line in f if line.strip()) if ndjson else csv.DictReader(f)
+        first = 0
+        last = None
+        while True:
+            batch = [row for _, row in zip(range(chunk), rows)]
+            if not batch:
+                break
+            columns, errors, bad_times, last = flow_log_columns(batch, first, rate, last)
+            if counts is not None:
+                counts["badTimestamps"] = counts.get("badTimestamps", 0) + bad_times
+            keep = np.array([i for i in range(len(batch)) if i not in errors], dtype=np.int64)
+            if errors:
+                columns = {
+                    name: [column[i] for i in keep] if isinstance(column, list) else np.asarray(column)[keep]
+                    for name, column in columns.items()
+                }
+            yield len(batch), first + keep, columns
+            first += len(batch)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def replay(path: str, out_path: str = None, chunk: int = 65_536, model_ids=None, rule: str = "majority",
+           parallel: bool = True, max_flows: int = 131_072, rate: float = 10_000.0) -> dict:
+    """Score every packet in path, appending verdict rows to out_path; returns throughput stats"""
+    counts = {"packets": 0, "scored": 0, "threats": 0, "badTimestamps": 0}
+    if path.endswith((".csv", ".ndjson", ".jsonl", ".json")):
+        source = read_flow_log(path, chunk, rate, counts)
+    else:
+        source = read_pcap(path, chunk)
+    flows = FlowFeatureEngine(max_flows=max_flows)
+    model_ids = [m for m in (model_ids or main.models) if main.models[m]["trained"]]
+    timings = dict.fromkeys(("decode", "features", "scoring", "output"), 0.0)
+
+    header = ["packet", "time"] + [f"{m}_{field}" for m in model_ids for field in ("prediction", "confidence")] + ["verdict", "score"]
+    out = None
+    fmt = ["%d", "%.6f"] + ["%d", "%.4f"] * len(model_ids) + ["%d", "%.4f"]
+
+    rss_before = peak_rss_mb()
+    start = tick = time.perf_counter()
+    try:
+        for read, positions, columns in source:
+            now = time.perf_counter()
+            timings["decode"] += now - tick
+            counts["packets"] += read
+            if not len(positions):
+                tick = now
+                continue
+
+            X = np.empty((len(positions), len(main.FEATURE_NAMES)))
+            main.fill_features(X, flows=flows, **columns)
+            tick, now = now, time.perf_counter()
+            timings["features"] += now - tick
+
+            results = main.score_all_models(X, parallel, model_ids)
+            verdicts, scores = main.combine_verdicts(results, rule)
+            tick, now = now, time.perf_counter()
+            timings["scoring"] += now - tick
+
+            counts["scored"] += len(positions)
+            counts["threats"] += int(verdicts.sum())
+            if out_path:
+                if out is None:  # Opened only once the input has parsed
+                    out = open(out_path, "w")
+                    out.write(",".join(header) + "\n")
+                block = [positions, columns["times"]]
+                for model_id in model_ids:
+                    block.extend(results[model_id])
+                np.savetxt(out, np.column_stack(block + [verdicts, scores]), fmt=fmt, delimiter=",")
+            tick = time.perf_counter()
+            timings["output"] += tick - now
+    finally:
+        if out:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        **counts,
+        "seconds": elapsed,
+        "packetsPerSecond": counts["packets"] / elapsed if elapsed else 0.0,
+        "timings": timings,
+        "peakRssMb": peak_rss_mb(),
+        "peakRssGrowthMb": peak_rss_mb() - rss_before,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="Classic pcap capture, or a .csv/.ndjson flow log")
+    parser.add_argument("--out", help="Verdict CSV (default: <input>.verdicts.csv)")
+    parser.add_argument("--discard", action="store_true", help="Score without writing verdicts")
+    parser.add_argument("--chunk", type=int, default=65_536, help="Packets per vectorized batch")
+    parser.add_argument("--models", nargs="+", choices=list(main.models), help="Detectors to run (default: all trained)")
+    parser.add_argument("--rule", choices=main.ENSEMBLE_RULES, default="majority")
+    parser.add_argument("--sequential", action="store_true", help="Score models one after another")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the verdict cache")
+    parser.add_argument("--max-flows", type=int, default=131_072, help="Rows per flow table")
+    parser.add_argument("--rate", type=float, default=10_000.0, help="Packets/sec clock for flow logs without timestamps")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        main.verdict_cache.max_entries = 0
+    out_path = None if args.discard else args.out or f"{os.path.splitext(args.input)[0]}.verdicts.csv"
+    main.load_models()
+    try:
+        stats = replay(args.input, out_path, args.chunk, args.models, args.rule, not args.sequential, args.max_flows, args.rate)
+    except (OSError, ValueError) as e:
+        sys.exit(f"replay: {e}")
+
+    timings = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stats["timings"].items())
+    print(f"{stats['packets']} records ({stats['scored']} scored, {stats['threats']} flagged) in {stats['seconds']:.2f}s")
+    if stats["badTimestamps"]:
+        print(f"{stats['badTimestamps']} records had unparseable timestamps and kept the previous record's time")
+    print(f"sustained {stats['packetsPerSecond']:.0f} packets/s ({timings})")
+    print(f"peak RSS {stats['peakRssMb']:.0f} MiB (+{stats['peakRssGrowthMb']:.0f} MiB during replay)")
+    if out_path:
+        print(f"verdicts written to {out_path}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,84 @@
+"""Tests that the compiled backends agree with the sklearn estimators they replace"""
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.neural_network import MLPClassifier
+
+from compiled import CompiledForest, CompiledMLP, compile_model
+
+
+def threat_data(size, seed, classes=2):
+    rng = np.random.default_rng(seed)
+    X = rng.random((size, 19))
+    y = np.minimum((X[:, 0] + X[:, 2]) * classes / 2, classes - 1).astype(int)
+    noise = rng.random(size) > 0.9
+    y[noise] = rng.integers(0, classes, noise.sum())
+    return X, y
+
+
+def inputs(seed):
+    """Random rows in the shapes, dtypes and layouts the API hands to models"""
+    X, _ = threat_data(256, seed)
+    return {
+        "single": X[:1],
+        "batch": X[:64],
+        "float32": X[:64].astype(np.float32),
+        "strided": X[:192:3],
+        "fortran": np.asfortranarray(X[:32]),
+        "large": X,
+    }
+
+
+@pytest.fixture(scope="module", params=[2, 3], ids=["binary", "multiclass"])
+def forest(request):
+    return RandomForestClassifier(n_estimators=25, random_state=42).fit(*threat_data(2_000, 0, request.param))
+
+
+@pytest.fixture(scope="module", params=[2, 3], ids=["binary", "multiclass"])
+def mlp(request):
+    return MLPClassifier(hidden_layer_sizes=(32, 16), max_iter=50, random_state=42).fit(*threat_data(2_000, 0, request.param))
+
+
+@pytest.mark.parametrize("name, X", inputs(1).items())
+def test_forest_matches_sklearn(forest, name, X):
+    compiled = compile_model(forest)
+    assert isinstance(compiled, CompiledForest)
+    np.testing.assert_array_equal(compiled.predict(X), forest.predict(X))
+    np.testing.assert_allclose(compiled.predict_proba(X), forest.predict_proba(X), rtol=0, atol=1e-12)
+
+
+def test_forest_hands_large_batches_to_sklearn(forest, monkeypatch):
+    compiled = compile_model(forest)
+    X, _ = threat_data(compiled.max_rows + 1, 2)
+    expected = forest.predict_proba(X)
+    monkeypatch.setattr(compiled, "apply", lambda X: pytest.fail("traversed a batch over max_rows"))
+    np.testing.assert_array_equal(compiled.predict_proba(X), expected)
+    # At exactly max_rows the compiled traversal still runs
+    monkeypatch.undo()
+    np.testing.assert_allclose(compiled.predict_proba(X[:-1]), expected[:-1], rtol=0, atol=1e-12)
+
+
+def test_forest_reuses_shared_trees(forest):
+    previous = compile_model(forest)
+    X, y = threat_data(500, 3, len(forest.classes_))
+    sprout = RandomForestClassifier(n_estimators=5, random_state=7).fit(X, y)
+    grown = RandomForestClassifier(n_estimators=25, random_state=42)
+    grown.__dict__.update(forest.__dict__)
+    grown.estimators_ = forest.estimators_[5:] + sprout.estimators_
+
+    compiled = compile_model(grown, previous=previous)
+    assert all(compiled.blocks[tree] is previous.blocks[tree] for tree in forest.estimators_[5:])
+    fresh = compile_model(grown)
+    for name in ("feature", "threshold", "left", "right", "value", "roots"):
+        np.testing.assert_array_equal(getattr(compiled, name), getattr(fresh, name))
+    X_test = inputs(4)["batch"]
+    np.testing.assert_allclose(compiled.predict_proba(X_test), grown.predict_proba(X_test), rtol=0, atol=1e-12)
+
+
+@pytest.mark.filterwarnings("ignore::sklearn.exceptions.ConvergenceWarning")
+@pytest.mark.parametrize("name, X", inputs(1).items())
+def test_mlp_matches_sklearn(mlp, name, X):
+    compiled = compile_model(mlp)
+    assert isinstance(compiled, CompiledMLP)
+    np.testing.assert_array_equal(compiled.predict(X), mlp.predict(X))
+    np.testing.assert_allclose(compiled.predict_proba(X), mlp.predict_proba(X), rtol=1e-12, atol=1e-12)
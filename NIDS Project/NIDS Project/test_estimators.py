@@ -0,0 +1,39 @@
+"""Tests for the custom estimators"""
+import numpy as np
+from sklearn.svm import SVC
+
+from estimators import KernelSGDClassifier
+
+
+def threat_data(size, seed):
+    """Two axis-aligned threat regions plus 10% label noise, like the API's synthetic data"""
+    rng = np.random.default_rng(seed)
+    X = rng.random((size, 19))
+    y = (((X[:, 0] > 0.8) & (X[:, 2] > 0.7)) | ((X[:, 0] < 0.3) & (X[:, 2] < 0.3))).astype(float)
+    noise = rng.random(size) > 0.9
+    y[noise] = 1 - y[noise]
+    return X, y
+
+
+def test_accuracy_matches_svc():
+    X, y = threat_data(5_000, 0)
+    X_test, y_test = threat_data(5_000, 1)
+    svc = SVC(probability=True, random_state=42).fit(X, y)
+    model = KernelSGDClassifier(random_state=42).fit(X, y)
+    assert model.score(X_test, y_test) >= svc.score(X_test, y_test) - 0.01
+
+
+def test_partial_fit_recalibrates_on_schedule():
+    X, y = threat_data(32_000, 2)
+    model = KernelSGDClassifier(random_state=42, recalibrate_every=500).fit(X[:2_000], y[:2_000])
+    calibrations = []
+    original = model._calibrate
+    model._calibrate = lambda: (calibrations.append(model.held_out_since_), original())
+
+    # 150 calls hold out about 3000 rows at a 0.1 calibration fraction: a refit per 500, not one per call
+    for start in range(2_000, 32_000, 200):
+        model.partial_fit(X[start:start + 200], y[start:start + 200])
+    assert 4 <= len(calibrations) <= 6
+    assert all(count >= 500 for count in calibrations)
+    assert len(model.holdout_X_) == model.calibration_size
+    assert np.allclose(model.predict_proba(X[:10]).sum(axis=1), 1.0)
@@ -0,0 +1,68 @@
+"""Tests for the flow feature engine"""
+import tracemalloc
+
+import numpy as np
+
+from flows import FLOW_FEATURE_NAMES, FlowFeatureEngine
+
+
+def stream(engine, rng, packets, source_pool, dest_pool, chunk=2_000, rate=5_000.0):
+    """Random traffic between the pools, fed to engine in chunks; returns the last chunk's features"""
+    for offset in range(0, packets, chunk):
+        n = min(chunk, packets - offset)
+        features = engine.observe(
+            [source_pool[i] for i in rng.integers(0, len(source_pool), n)],
+            [dest_pool[i] for i in rng.integers(0, len(dest_pool), n)],
+            rng.integers(1, 65536, n),
+            rng.integers(64, 1500, n),
+            rng.random(n) < 0.3,
+            1_700_000_000.0 + (offset + np.arange(n)) / rate,
+        )
+    return features
+
+
+def test_memory_stays_within_ceiling_with_more_flows_than_rows():
+    max_flows = 4_096
+    engine = FlowFeatureEngine(max_flows=max_flows)
+    counters = engine.nbytes
+    rng = np.random.default_rng(0)
+    sources = [f"{a}.{b}.{c}.{d}" for a, b, c, d in rng.integers(1, 255, size=(50_000, 4))]
+    dests = [f"10.0.{c}.{d}" for c, d in rng.integers(1, 255, size=(64, 2))]
+
+    tracemalloc.start()
+    try:
+        # The first pass fills the tables; the second must not hold on to anything more
+        stream(engine, rng, 100_000, sources, dests)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        features = stream(engine, rng, 100_000, sources, dests)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # 10x more sources than rows: tables stay capped and counters never grow
+    assert len(engine.sources) <= max_flows
+    assert len(engine.pairs) <= max_flows
+    assert engine.nbytes == counters
+    # Another 100k packets retain nothing new; the transient peak is chunk-sized temporaries
+    assert current - before < 256 * 2**10
+    assert peak - before < counters
+    assert features.shape == (2_000, len(FLOW_FEATURE_NAMES))
+    assert np.all((features >= 0.0) & (features <= 1.0))
+
+
+def test_rate_and_sweep_features():
+    engine = FlowFeatureEngine(max_flows=64)
+    now = 1_700_000_000.0
+
+    # One packet in the window barely registers
+    quiet = engine.observe(["10.0.0.1"], ["10.0.0.2"], [443], [500], [False], [now])
+    assert quiet[0, FLOW_FEATURE_NAMES.index("srcPacketRate")] < 0.02
+
+    # 5000 SYNs to distinct ports of one host within a second
+    n = 5_000
+    sweep = engine.observe(["10.0.0.9"] * n, ["10.0.0.2"] * n, np.arange(1, n + 1), np.full(n, 60),
+                           np.ones(n, dtype=bool), now + np.linspace(0.0, 0.9, n))
+    assert sweep[-1, FLOW_FEATURE_NAMES.index("srcPacketRate")] > 0.5
+    assert sweep[-1, FLOW_FEATURE_NAMES.index("pairDistinctPorts")] == 1.0
+    assert sweep[-1, FLOW_FEATURE_NAMES.index("pairSynRatio")] == 1.0
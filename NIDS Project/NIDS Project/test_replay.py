@@ -0,0 +1,45 @@
+"""Tests for flow-log replay"""
+import json
+
+import numpy as np
+
+from replay import read_flow_log, row_timestamps
+
+EPOCH = 1_704_067_200.0  # 2024-01-01T00:00:00Z
+
+
+def test_bad_timestamps_carry_the_last_valid_one_forward():
+    timestamps = ["2024-01-01T00:00:00Z", "garbage", "", "2024-01-01T00:00:05", "2024-13-45T00:00:00"]
+    times, failed, last = row_timestamps(timestamps, first=0, rate=10.0)
+    np.testing.assert_array_equal(times, EPOCH + np.array([0.0, 0.0, 0.0, 5.0, 5.0]))
+    assert failed == 2  # A missing timestamp is not a parse failure
+    assert last == EPOCH + 5.0
+
+
+def test_rows_before_any_valid_timestamp_use_the_fixed_rate():
+    times, failed, last = row_timestamps(["", "bad", "2024-01-01T00:00:00Z"], first=100, rate=10.0)
+    np.testing.assert_array_equal(times, [10.0, 10.1, EPOCH])
+    assert failed == 1
+    assert last == EPOCH
+
+
+def test_flow_log_carries_timestamps_across_chunks(tmp_path):
+    rows = [
+        {"sourceIp": f"10.0.0.{i}", "destIp": "10.0.1.1", "port": 443, "protocol": "TCP", "packetSize": 500,
+         "flags": "SYN", "timestamp": f"2024-01-01T00:00:{i:02d}Z" if i % 3 else "not a time"}
+        for i in range(1, 10)
+    ]
+    rows[4]["port"] = "not a port"
+    path = tmp_path / "flows.ndjson"
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+    counts = {}
+    chunks = list(read_flow_log(str(path), chunk=3, rate=1.0, counts=counts))
+    positions = np.concatenate([chunk[1] for chunk in chunks])
+    times = np.concatenate([chunk[2]["times"] for chunk in chunks])
+
+    # Every third row ends a chunk with a bad timestamp and keeps the time before it, even
+    # when that came from a row skipped for its port
+    np.testing.assert_array_equal(positions, [0, 1, 2, 3, 5, 6, 7, 8])
+    np.testing.assert_array_equal(times, EPOCH + np.array([1, 2, 2, 4, 5, 7, 8, 8], dtype=float))
+    assert counts["badTimestamps"] == 3
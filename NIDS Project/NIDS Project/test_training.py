@@ -0,0 +1,55 @@
+"""Tests for online model updates"""
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+
+from training import FOREST_TREE_ATTRIBUTES, Reservoir, online_update
+
+
+def stream_batch(rng, size):
+    X = rng.random((size, 19))
+    return X, (X[:, 0] > 0.5).astype(float)
+
+
+@pytest.mark.parametrize("model_id, forest", [
+    ("ddos-detector", RandomForestClassifier(n_estimators=20, random_state=0)),
+    ("anomaly-detector", IsolationForest(n_estimators=20, contamination=0.1, random_state=0)),
+])
+def test_forest_update_leaves_live_model_alone(model_id, forest):
+    rng = np.random.default_rng(0)
+    X, y = stream_batch(rng, 1_000)
+    live = forest.fit(X) if model_id == "anomaly-detector" else forest.fit(X, y)
+    trees = list(live.estimators_)
+    reservoir = Reservoir(5_000, X.shape[1])
+    reservoir.add(X, y)
+
+    model = live
+    for _ in range(3):
+        model, _ = online_update(model_id, model, *stream_batch(rng, 50), reservoir, replay=500,
+                                 new_trees=5, max_trees=20)
+
+    # The live forest still holds its own trees; the update shares the newest 5 of them
+    assert live.estimators_ == trees
+    assert model is not live
+    assert model.estimators_[:5] == trees[15:]
+    assert model.n_estimators == 20
+    for name in FOREST_TREE_ATTRIBUTES[type(model)]:
+        assert len(getattr(model, name)) == 20
+    assert len(model.estimators_samples_) == 20
+
+    X_test, y_test = stream_batch(rng, 2_000)
+    if model_id == "anomaly-detector":
+        assert abs(np.mean(model.predict(X_test) == -1) - 0.1) < 0.05
+    else:
+        assert model.score(X_test, y_test) > 0.9
+
+
+def test_updates_grow_different_trees():
+    rng = np.random.default_rng(1)
+    X, y = stream_batch(rng, 500)
+    forest = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    reservoir = Reservoir(1_000, X.shape[1])
+    batch = stream_batch(rng, 50)
+    first, _ = online_update("ddos-detector", forest, *batch, reservoir, replay=0, new_trees=2, max_trees=20)
+    second, _ = online_update("ddos-detector", forest, *batch, reservoir, replay=0, new_trees=2, max_trees=20)
+    assert not np.array_equal(first.estimators_[-1].tree_.threshold, second.estimators_[-1].tree_.threshold)
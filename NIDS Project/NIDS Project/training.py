@@ -0,0 +1,128 @@
+"""Model fitting for the CyberGuard ML API
+
+Kept free of app imports so training worker processes can import it without
+re-running the API's startup model loading.
+"""
+import copy
+import os
+import time
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+
+# Per-tree state of each forest type, sliced together when trees are added or dropped
+FOREST_TREE_ATTRIBUTES = {
+    RandomForestClassifier: ("estimators_",),
+    IsolationForest: ("estimators_", "estimators_features_", "_seeds",
+                      "_average_path_length_per_tree", "_decision_path_lengths"),
+}
+
+
+def lower_priority(niceness: int = 10):
+    """Pool initializer: yield CPU to the serving process while fitting"""
+    if hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def fit_estimator(model_id: str, estimator, X, y=None):
+    """Fit an estimator and return it along with the wall time spent"""
+    start = time.perf_counter()
+    if model_id != "anomaly-detector":  # Anomaly detection is unsupervised
+        estimator.fit(X, y)
+    else:
+        estimator.fit(X)
+    return estimator, time.perf_counter() - start
+
+
+class Reservoir:
+    """Uniform sample of at most `capacity` labelled rows from an unbounded stream (Algorithm R)"""
+
+    def __init__(self, capacity: int, n_features: int, seed: int = 0):
+        self.X = np.empty((capacity, n_features))
+        self.y = np.empty(capacity, dtype=np.int64)
+        self.capacity = capacity
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return min(self.seen, self.capacity)
+
+    def add(self, X: np.ndarray, y: np.ndarray):
+        # Row t of the stream lands in slot t while filling, then in a random
+        # slot with probability capacity / (t + 1)
+        t = self.seen + np.arange(len(X))
+        slots = np.where(t < self.capacity, t, self.rng.integers(0, t + 1))
+        keep = slots < self.capacity
+        self.X[slots[keep]] = X[keep]
+        self.y[slots[keep]] = y[keep]
+        self.seen += len(X)
+
+    def sample(self, size: int):
+        rows = self.rng.choice(len(self), size=min(size, len(self)), replace=False)
+        return self.X[rows], self.y[rows]
+
+
+def can_learn_online(estimator) -> bool:
+    return hasattr(estimator, "partial_fit") or type(estimator) in FOREST_TREE_ATTRIBUTES
+
+
+def grow_forest(forest, X, y, new_trees: int, max_trees: int, seed: int = 0):
+    """forest plus new_trees fitted on (X, y), minus its oldest trees beyond max_trees.
+
+    The new trees are fitted as a small forest of their own and joined to a
+    shallow copy of forest, which shares the trees it keeps. forest itself is
+    left as it was, so it can keep serving while the copy is built.
+    """
+    params = {"n_estimators": new_trees, "warm_start": False, "random_state": seed}
+    if isinstance(forest, IsolationForest):
+        params["contamination"] = "auto"  # The threshold is set below, over the whole ensemble
+    sprout = clone(forest).set_params(**params)
+    if y is None:
+        sprout.fit(X)
+    else:
+        sprout.fit(X, y)
+
+    grown = copy.copy(forest)
+    drop = max(0, len(forest.estimators_) + new_trees - max_trees)
+    for name in FOREST_TREE_ATTRIBUTES[type(forest)]:
+        old, new = getattr(forest, name), getattr(sprout, name)
+        setattr(grown, name, np.concatenate([old[drop:], new]) if isinstance(old, np.ndarray) else old[drop:] + new)
+    grown.n_estimators = len(grown.estimators_)
+    if isinstance(forest, IsolationForest) and forest.contamination != "auto":
+        # Threshold at the contamination quantile of the new ensemble's scores, as fit does
+        grown.offset_ = np.percentile(grown.score_samples(X), 100.0 * forest.contamination)
+    return grown
+
+
+def online_update(model_id: str, estimator, X, y, reservoir: Reservoir, replay: int = 1000,
+                  new_trees: int = 10, max_trees: int = 100):
+    """Learn from one batch of labelled events; returns the updated estimator and the wall time spent.
+
+    estimator itself is not modified. Each step also replays up to `replay`
+    rows sampled from the reservoir of past events, so the model keeps its
+    footing instead of drifting towards whatever the latest batch looks like.
+    The new rows then join the reservoir.
+    """
+    start = time.perf_counter()
+    X_fit, y_fit = X, y
+    if len(reservoir):
+        X_past, y_past = reservoir.sample(replay)
+        X_fit, y_fit = np.vstack([X, X_past]), np.concatenate([y, y_past])
+
+    if hasattr(estimator, "partial_fit"):
+        # Small next to a forest (MLP weights, kernel map and calibration window)
+        estimator = copy.deepcopy(estimator)
+        estimator.partial_fit(X_fit, y_fit, classes=estimator.classes_)
+    elif type(estimator) in FOREST_TREE_ATTRIBUTES:
+        # New trees must vote over the same classes as the ones already in the forest
+        if model_id != "anomaly-detector" and not np.array_equal(np.unique(y_fit), estimator.classes_):
+            raise ValueError("an online forest update needs every class in the batch plus replay")
+        # Seeded by the stream position, so successive updates grow different trees
+        estimator = grow_forest(estimator, X_fit, None if model_id == "anomaly-detector" else y_fit,
+                                new_trees, max_trees, seed=reservoir.seen)
+    else:
+        raise ValueError(f"{type(estimator).__name__} models cannot learn online")
+
+    reservoir.add(X, y)
+    return estimator, time.perf_counter() - start
@@ -0,0 +1,260 @@
+# api.py
+#
+# Headless recommendation service. The model is built once at startup and
+# kept warm in memory; title requests are a lookup in its neighbor table.
+# RECOMMENDER_BACKEND=als serves latent factors instead of item-item cosine:
+# user histories are folded in as factors, and titles' neighbors come from
+# the item factors.
+#
+#     uvicorn api:app --port 8001
+#
+# Each uvicorn worker holds its own copy of the model; the rating columns
+# behind it are memory-mapped from the data cache, so workers share those pages.
+# New ratings posted to /api/ratings update that worker's model in place and
+# last until the next reload; append them to Ratings.csv to keep them.
+#
+# Covers are served as local thumbnails (covers.py): /api/cover?title=
+# redirects to /api/covers/<content hash>, which browsers may cache forever.
+
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import FileResponse, RedirectResponse
+from pydantic import BaseModel
+
+import engine
+from covers import CoverCache, fetch_url, fixture_fetcher
+
+app = FastAPI(title="Book Recommender API", version="1.0.0")
+
+COVER_CACHE_DIR = os.environ.get("RECOMMENDER_COVER_CACHE", os.path.join(engine.DATA_DIR, "covers"))
+COVER_CACHE_MB = float(os.environ.get("RECOMMENDER_COVER_CACHE_MB", "100"))
+# A directory of cover files standing in for the remote image host (local runs and benchmarks)
+COVER_FIXTURES = os.environ.get("RECOMMENDER_COVER_FIXTURES")
+# Warmed after every load: the most-read titles and the top neighbors of each
+COVER_PREFETCH_TITLES = int(os.environ.get("RECOMMENDER_COVER_PREFETCH_TITLES", "200"))
+COVER_PREFETCH_NEIGHBORS = 10
+
+cover_cache = CoverCache(COVER_CACHE_DIR, int(COVER_CACHE_MB * 2 ** 20),
+                         fetch=fixture_fetcher(COVER_FIXTURES) if COVER_FIXTURES else fetch_url)
+
+# The serving state is replaced as a whole, so a request never sees a
+# model from one build and cover images from another. Rating updates
+# rewrite neighbor rows in place; a lookup racing one may see a row
+# from just before or just after it.
+state = {"live": None, "model": None, "similarity": None, "images": None, "loadedAt": None, "loadSeconds": None}
+model_lock = threading.Lock()  # One rebuild or rating update at a time
+
+class BatchRequest(BaseModel):
+    titles: List[str]
+    n: int = 5
+
+class Recommendation(BaseModel):
+    title: str
+    image: Optional[str]
+    score: float
+
+class TitleRecommendations(BaseModel):
+    title: str
+    found: bool
+    recommendations: List[Recommendation]
+
+class BatchResponse(BaseModel):
+    results: List[TitleRecommendations]
+
+class UserRequest(BaseModel):
+    history: Dict[str, float]  # Title -> rating
+    n: int = 5
+
+class UserHistory(BaseModel):
+    userId: str
+    history: Dict[str, float]
+
+class UsersRequest(BaseModel):
+    users: List[UserHistory]
+    n: int = 5
+
+class UserRecommendations(BaseModel):
+    userId: Optional[str] = None
+    recommendations: List[Recommendation]
+
+class UsersResponse(BaseModel):
+    results: List[UserRecommendations]
+
+class Rating(BaseModel):
+    userId: str
+    title: str
+    rating: float
+    image: Optional[str] = None
+
+class RatingsRequest(BaseModel):
+    ratings: List[Rating]
+
+def load_model():
+    global state
+    start = time.perf_counter()
+    live, images = engine.load_model(engine.DATA_DIR)
+    state = {
+        "live": live,
+        "model": live.model,
+        "similarity": live.similarity,
+        "images": dict(zip(live.titles, images)),
+        "loadedAt": datetime.now().isoformat(),
+        "loadSeconds": round(time.perf_counter() - start, 2),
+    }
+    threading.Thread(target=prefetch_covers, args=(state,), daemon=True).start()
+
+def prefetch_covers(current):
+    """Fetch covers for the most-read titles and their top neighbors ahead of the first request"""
+    live = current["live"]
+    readers = live.item_user.base.getnnz(axis=1)  # As loaded; later ratings only add a few
+    popular = np.argsort(-readers, kind="stable")[:COVER_PREFETCH_TITLES]
+    rows = np.concatenate([popular, live.neighbors[popular, :COVER_PREFETCH_NEIGHBORS].ravel()])
+    urls = [current["images"].get(title) for title in live.titles[np.unique(rows[rows >= 0])]]
+    urls = [url for url in urls if url]
+    failed = cover_cache.prefetch(urls)
+    if failed:
+        print(f"Cover prefetch: {failed} of {len(urls)} covers could not be fetched")
+
+@app.on_event("startup")
+def startup():
+    load_model()
+
+def check_count(n):
+    if not 1 <= n <= engine.NUM_NEIGHBORS:
+        raise HTTPException(status_code=400, detail=f"n must be between 1 and {engine.NUM_NEIGHBORS}")
+
+def recommendations(current, book_titles, n):
+    titles, images = current["model"][0], current["images"]
+    return [
+        {
+            "title": book_title,
+            "found": book_title in titles,
+            "recommendations": [
+                {"title": name, "image": images.get(name), "score": score}
+                for name, score in zip(names, scores)
+            ],
+        }
+        for book_title, (names, scores) in zip(book_titles, engine.recommend_batch(book_titles, current["model"], n))
+    ]
+
+@app.get("/")
+def root():
+    current = state
+    return {
+        "status": "ok",
+        "titles": len(current["model"][0]),
+        "loadedAt": current["loadedAt"],
+        "loadSeconds": current["loadSeconds"],
+        "covers": cover_cache.summary(),
+    }
+
+@app.get("/api/titles")
+def list_titles():
+    return {"titles": sorted(state["model"][0].tolist())}
+
+@app.get("/api/recommend", response_model=TitleRecommendations)
+def recommend(title: str, n: int = Query(5)):
+    check_count(n)
+    result = recommendations(state, [title], n)[0]
+    if not result["found"]:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return result
+
+@app.post("/api/recommend/batch", response_model=BatchResponse)
+def recommend_batch(request: BatchRequest):
+    check_count(request.n)
+    return {"results": recommendations(state, request.titles, request.n)}
+
+def user_recommendations(current, histories, n):
+    images, live = current["images"], current["live"]
+    if isinstance(live, engine.ALSModel):
+        results = live.recommend_for_users(histories, n)
+    else:
+        results = engine.recommend_for_users(histories, current["model"], n, current["similarity"])
+    return [
+        [{"title": name, "image": images.get(name), "score": score} for name, score in zip(names, scores)]
+        for names, scores in results
+    ]
+
+@app.post("/api/recommend/user", response_model=UserRecommendations)
+def recommend_for_user(request: UserRequest):
+    """Recommendations from a whole reading history, leaving out books already read"""
+    check_count(request.n)
+    return {"recommendations": user_recommendations(state, [request.history], request.n)[0]}
+
+@app.post("/api/recommend/users", response_model=UsersResponse)
+def recommend_for_users(request: UsersRequest):
+    """Many users' recommendations in one call, e.g. for nightly precomputation"""
+    check_count(request.n)
+    results = user_recommendations(state, [user.history for user in request.users], request.n)
+    return {"results": [
+        {"userId": user.userId, "recommendations": recommendations}
+        for user, recommendations in zip(request.users, results)
+    ]}
+
+@app.get("/api/cover")
+def cover(title: str):
+    """The title's cover thumbnail, fetched into the local cache on first use"""
+    url = state["images"].get(title)
+    if not url:
+        raise HTTPException(status_code=404, detail="No cover for this title")
+    try:
+        key = cover_cache.get(url)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=502, detail=f"Could not fetch the cover: {e}")
+    if key is None:
+        raise HTTPException(status_code=404, detail="No cover for this title")
+    return RedirectResponse(f"/api/covers/{key}")
+
+@app.get("/api/covers/{key}")
+def cover_thumbnail(key: str):
+    path = cover_cache.blob_path(key)
+    if not re.fullmatch(r"[0-9a-f]{64}", key) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    # Named by content, so the bytes behind a key never change
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.post("/api/reload")
+def reload():
+    """Rebuild from the data directory (e.g. after the CSVs change) and swap the new model in"""
+    if not model_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="The model is already being rebuilt or updated")
+    try:
+        load_model()
+    finally:
+        model_lock.release()
+    return root()
+
+@app.post("/api/ratings")
+def add_ratings(request: RatingsRequest):
+    """Fold new ratings into the model; only titles whose neighborhoods change are recomputed.
+
+    The ALS backend re-solves the factors of the users and titles rated;
+    ratings of titles outside it are counted as deferredRatings and wait for a reload.
+    """
+    global state
+    if any(not 1 <= r.rating <= 10 for r in request.ratings):
+        raise HTTPException(status_code=400, detail="ratings must be between 1 and 10")
+    with model_lock:
+        current = state
+        start = time.perf_counter()
+        stats = current["live"].update(pd.DataFrame({
+            "User-ID": [r.userId for r in request.ratings],
+            "Book-Title": [r.title for r in request.ratings],
+            "Book-Rating": [r.rating for r in request.ratings],
+        }))
+        # Kept for titles not in the model yet too, for when they join it
+        for r in request.ratings:
+            if r.image:
+                current["images"].setdefault(r.title, r.image)
+        # The similarity matrix is patched in place, and only replaced when titles join the model
+        state = dict(current, model=current["live"].model, similarity=current["live"].similarity)
+    return dict(stats, seconds=round(time.perf_counter() - start, 4))
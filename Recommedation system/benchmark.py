@@ -0,0 +1,552 @@
+"""Benchmarks for the book recommender
+
+Run from this directory, e.g.:
+    python benchmark.py ann
+    python benchmark.py ann --titles 100000 --users 100000 --ratings 10000000 --tables 2 4 8
+    python benchmark.py datacache
+    python benchmark.py incremental --deltas 10 100 1000 10000
+    python benchmark.py incremental --backend als
+    python benchmark.py profiles --scored 5000
+    python benchmark.py evaluate --k 10
+    python benchmark.py api --clients 8 --seconds 10 --batch 100
+    python benchmark.py covers --covers 500 --max-mb 1
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.parse
+import urllib.request
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+
+import engine
+
+
+def synthetic_ratings(n_users: int, n_titles: int, n_ratings: int, n_genres: int = 200, seed: int = 0):
+    """Ratings shaped like load_data's output, with structure for neighbors to find.
+
+    Every title belongs to one genre and every user favours two; 80% of a
+    user's ratings fall in a favourite genre, and popularity within a genre is
+    Zipf-like.
+    """
+    rng = np.random.default_rng(seed)
+    genre_of_title = rng.integers(0, n_genres, n_titles)
+    by_genre = np.argsort(genre_of_title, kind="stable")
+    genre_start = np.searchsorted(genre_of_title[by_genre], np.arange(n_genres))
+    genre_size = np.maximum(np.bincount(genre_of_title, minlength=n_genres), 1)
+    favourites = rng.integers(0, n_genres, (n_users, 2))
+
+    users = rng.integers(0, n_users, n_ratings)
+    genres = np.where(rng.random(n_ratings) < 0.8, favourites[users, rng.integers(0, 2, n_ratings)],
+                      rng.integers(0, n_genres, n_ratings))
+    titles = by_genre[np.minimum(genre_start[genres] + (rng.zipf(1.3, n_ratings) - 1) % genre_size[genres], n_titles - 1)]
+    return pd.DataFrame({
+        "User-ID": users.astype(str),
+        "Book-Title": pd.Categorical.from_codes(titles, [f"Title {i}" for i in range(n_titles)]),
+        "Book-Rating": rng.integers(1, 11, n_ratings).astype(np.float32),
+        "Image-URL-L": "",
+    })
+
+
+def write_source_csvs(data_dir: str, n_books: int, n_users: int, n_ratings: int, seed: int = 0):
+    """Books.csv / Ratings.csv shaped like the Book-Crossing export"""
+    rng = np.random.default_rng(seed)
+    isbns = np.array([f"{i:010d}" for i in rng.choice(10 ** 9, n_books, replace=False)])
+    titles = np.array([f'Title {i}, "Vol. {i % 7}"' for i in range(int(n_books * 0.9))])
+    pd.DataFrame({
+        "ISBN": isbns,
+        "Book-Title": titles[rng.integers(0, len(titles), n_books)],
+        "Book-Author": "Author",
+        "Year-Of-Publication": rng.integers(1950, 2005, n_books),
+        "Publisher": "Publisher",
+        "Image-URL-S": [f"http://images.amazon.com/images/P/{isbn}.01.THUMBZZZ.jpg" for isbn in isbns],
+        "Image-URL-M": [f"http://images.amazon.com/images/P/{isbn}.01.MZZZZZZZ.jpg" for isbn in isbns],
+        "Image-URL-L": [f"http://images.amazon.com/images/P/{isbn}.01.LZZZZZZZ.jpg" for isbn in isbns],
+    }).to_csv(os.path.join(data_dir, "Books.csv"), index=False)
+    # Book popularity and user activity are Zipf-like; most ratings are implicit (0)
+    books = (rng.zipf(1.15, n_ratings) - 1) % n_books
+    pd.DataFrame({
+        "User-ID": (rng.zipf(1.3, n_ratings) - 1) % n_users + 1,
+        "ISBN": isbns[books],
+        "Book-Rating": np.where(rng.random(n_ratings) < 0.62, 0, rng.integers(1, 11, n_ratings)),
+    }).to_csv(os.path.join(data_dir, "Ratings.csv"), index=False)
+
+
+def recall_at(exact, approx, k: int) -> float:
+    """Mean share of each title's exact top-k found in its approximate top-k"""
+    hits, total = 0, 0
+    for truth, found in zip(exact[:, :k], approx[:, :k]):
+        truth = truth[truth >= 0]
+        hits += len(np.intersect1d(truth, found[found >= 0]))
+        total += len(truth)
+    return hits / max(total, 1)
+
+
+def bench_ann(args):
+    """Neighbor search: exact blocked cosine vs. LSH, build time and recall@k per table count"""
+    titles, matrix = engine.rating_matrix(synthetic_ratings(args.users, args.titles, args.ratings))
+    print(f"{matrix.shape[0]} titles x {matrix.shape[1]} users, {matrix.nnz} ratings, "
+          f"exact cost {engine.exact_cost(matrix):.2g} (approximate above {engine.EXACT_MAX_COST:.2g})")
+
+    start = time.perf_counter()
+    exact, _ = engine.top_k_neighbors(matrix, engine.NUM_NEIGHBORS)
+    print(f"{'exact':<12} {'build s':>8} {time.perf_counter() - start:>8.1f}")
+
+    print(f"{'tables':<12} {'bucket':>8} {'build s':>8} {f'recall@{args.k}':>10}")
+    for n_tables in args.tables:
+        start = time.perf_counter()
+        approx, _ = engine.lsh_neighbors(matrix, engine.NUM_NEIGHBORS, n_tables=n_tables, bucket_size=args.bucket_size,
+                                       dims=args.dims, candidates=args.candidates)
+        seconds = time.perf_counter() - start
+        print(f"{n_tables:<12} {args.bucket_size:>8} {seconds:>8.1f} {recall_at(exact, approx, args.k):>10.3f}")
+
+    # Per-query cost: a precomputed table row vs. scoring one title against the catalog on demand
+    model = (titles, exact, None)
+    queries = np.random.default_rng(1).integers(0, matrix.shape[0], args.queries)
+    start = time.perf_counter()
+    for i in queries:
+        engine.recommend_books(titles[i], model, args.k)
+    table_us = (time.perf_counter() - start) / len(queries) * 1e6
+
+    items = normalize(matrix)
+    items_t = items.T.tocsr()
+    start = time.perf_counter()
+    for i in queries:
+        row = (items[i] @ items_t).toarray().ravel()
+        row[i] = 0
+        np.argpartition(-row, args.k)[:args.k]
+    print(f"query latency: table lookup {table_us:.0f} us, on-demand exact cosine "
+          f"{(time.perf_counter() - start) / len(queries) * 1e6:.0f} us")
+
+
+def bench_datacache(args):
+    """Cold data load: parsing the CSVs vs. the columnar cache (build once, then memory-map)"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_source_csvs(data_dir, args.books, args.users, args.ratings)
+        print(f"sources: {sum(os.path.getsize(os.path.join(data_dir, name)) for name in engine.SOURCE_FILES) / 2 ** 20:.0f} MiB CSV")
+
+        start = time.perf_counter()
+        expected = engine.filter_popular(engine.read_sources(data_dir).astype({"User-ID": "category", "Book-Title": "category"}))
+        print(f"{'parse CSVs + filter':<28} {time.perf_counter() - start:>8.2f} s")
+
+        start = time.perf_counter()
+        engine.build_data_cache(data_dir)
+        cache_dir = os.path.join(data_dir, "cache")
+        cache_mb = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir)) / 2 ** 20
+        print(f"{'build cache':<28} {time.perf_counter() - start:>8.2f} s ({cache_mb:.0f} MiB)")
+
+        for label in ("load cache + filter", "load cache + filter (again)"):
+            start = time.perf_counter()
+            ratings_books = engine.filter_popular(engine.read_data_cache(data_dir))
+            print(f"{label:<28} {time.perf_counter() - start:>8.2f} s")
+        assert len(ratings_books) == len(expected), (len(ratings_books), len(expected))
+        print(f"{len(ratings_books)} ratings of {ratings_books['Book-Title'].nunique()} titles after filtering")
+
+
+def bench_incremental(args):
+    """Incremental updates: time per delta of new ratings vs. a full rebuild, and agreement with the rebuild"""
+    ratings = synthetic_ratings(args.users, args.titles, args.ratings, seed=args.seed)
+    ratings = ratings.iloc[np.random.default_rng(args.seed).permutation(len(ratings))].reset_index(drop=True)
+    held_out = sum(args.deltas)
+    if args.backend == "als":
+        return bench_incremental_als(ratings, held_out, args.deltas)
+    start = time.perf_counter()
+    live = engine.IncrementalModel(ratings.iloc[:-held_out])
+    print(f"initial build: {len(live.titles)} titles, {time.perf_counter() - start:.1f} s")
+
+    print(f"{'delta':>8} {'update ms':>10} {'changed':>8} {'patched':>8} {'rebuilt':>8} {'new titles':>11}")
+    offset = len(ratings) - held_out
+    for size in args.deltas:
+        start = time.perf_counter()
+        stats = live.update(ratings.iloc[offset:offset + size])
+        seconds = time.perf_counter() - start
+        offset += size
+        print(f"{size:>8} {seconds * 1000:>10.1f} {stats['changedTitles']:>8} {stats['patchedTitles']:>8} "
+              f"{stats['rebuiltTitles']:>8} {stats['newTitles']:>11}")
+
+    start = time.perf_counter()
+    titles, neighbors, scores = engine.build_model(engine.filter_popular(ratings.astype({"User-ID": "category"})))
+    print(f"full rebuild (filter + build_model): {time.perf_counter() - start:.1f} s")
+
+    # Same titles, and per title the same neighbors up to float rounding
+    # (near-ties may swap places when scores differ in the last bits)
+    rows = titles.get_indexer(live.titles)
+    assert (rows >= 0).all() and len(titles) == len(live.titles), "incremental model has different titles"
+    mapped = np.where(live.neighbors >= 0, rows[live.neighbors], -1)
+    same = (mapped == neighbors[rows]).all(axis=1)
+    close = np.abs(live.scores - scores[rows]).max(axis=1) <= 1e-5
+    print(f"agreement with the rebuild: {same.mean():.2%} identical lists, {close.mean():.2%} within 1e-5 in score")
+    if not close.all():
+        sys.exit("FAIL: incremental model diverged from a full rebuild")
+
+
+def bench_incremental_als(ratings, held_out, deltas):
+    """ALS fold-in updates: time per delta, and neighbor lists against a recompute from the updated factors"""
+    ratings = ratings.astype({"User-ID": "category"})
+    start = time.perf_counter()
+    live = engine.ALSModel(ratings.iloc[:-held_out])
+    print(f"initial build: {len(live.titles)} titles, {time.perf_counter() - start:.1f} s")
+
+    print(f"{'delta':>8} {'update ms':>10} {'users':>8} {'titles':>8} {'refreshed':>10} {'deferred':>9}")
+    offset = len(ratings) - held_out
+    for size in deltas:
+        start = time.perf_counter()
+        stats = live.update(ratings.iloc[offset:offset + size])
+        seconds = time.perf_counter() - start
+        offset += size
+        print(f"{size:>8} {seconds * 1000:>10.1f} {stats['changedUsers']:>8} {stats['changedTitles']:>8} "
+              f"{stats['refreshedTitles']:>10} {stats['deferredRatings']:>9}")
+
+    neighbors, scores = engine.factor_neighbors(live.item_factors, live.k)
+    close = np.abs(live.scores - scores).max(axis=1) <= 1e-5
+    print(f"agreement with lists recomputed from the factors: {(live.neighbors == neighbors).all(axis=1).mean():.2%} "
+          f"identical, {close.mean():.2%} within 1e-5 in score")
+    if not close.all():
+        sys.exit("FAIL: patched neighbor lists diverged from the factors")
+
+
+def bench_profiles(args):
+    """User-profile recommendations: batched vs. one-user-at-a-time throughput, and hit rate on held-out ratings"""
+    ratings = engine.filter_popular(synthetic_ratings(args.users, args.titles, args.ratings).astype({"User-ID": "category"}))
+    # Hold out each user's last rating; the model and the histories see the rest
+    last = ~ratings.duplicated("User-ID", keep="last")
+    model = engine.build_model(ratings[~last])
+    last_title = dict(zip(ratings["User-ID"][last], ratings["Book-Title"][last]))
+    histories, held_out = [], []
+    for user, group in ratings[~last].groupby("User-ID", observed=True):
+        if len(histories) == args.scored:
+            break
+        histories.append(dict(zip(group["Book-Title"], group["Book-Rating"].tolist())))
+        held_out.append(last_title[user])
+    print(f"{len(model[0])} titles; scoring {len(histories)} users with "
+          f"{np.mean([len(h) for h in histories]):.0f} rated books each on average")
+
+    similarity = engine.similarity_matrix(model)
+    start = time.perf_counter()
+    batched = engine.recommend_for_users(histories, model, args.n, similarity)
+    batch_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    single = [engine.recommend_for_user(history, model, args.n, similarity) for history in histories[:args.single]]
+    single_seconds = time.perf_counter() - start
+
+    print(f"{'batched':<16} {len(histories) / batch_seconds:>10.0f} users/s")
+    print(f"{'one at a time':<16} {len(single) / single_seconds:>10.0f} users/s")
+    identical = all(a[0] == b[0] for a, b in zip(batched, single))
+    print(f"identical results: {identical}")
+    hits = np.mean([title in names for title, (names, _) in zip(held_out, batched)])
+    print(f"held-out rating in top {args.n}: {hits:.1%} of users")
+    if not identical:
+        sys.exit("FAIL: batched and single-user recommendations differ")
+
+
+def bench_evaluate(args):
+    """Offline evaluation of the model backends: precision@k on held-out ratings, training time and memory"""
+    ratings = engine.filter_popular(synthetic_ratings(args.users, args.titles, args.ratings).astype({"User-ID": "category"}))
+    # Hold out a random share of every user's ratings
+    test = np.random.default_rng(args.seed).random(len(ratings)) < args.test_fraction
+    train = ratings[~test]
+    train = train.assign(**{column: train[column].cat.remove_unused_categories() for column in ("User-ID", "Book-Title")})
+    users = train["User-ID"].cat.categories[:args.scored]
+    histories = [dict(zip(group["Book-Title"], group["Book-Rating"].tolist()))
+                 for _, group in train[train["User-ID"].isin(users)].groupby("User-ID", observed=True)]
+    held_out = {}
+    for user, title in zip(ratings["User-ID"][test], ratings["Book-Title"][test]):
+        held_out.setdefault(user, set()).add(title)
+    held_out = [held_out.get(user, set()) for user in users]
+    print(f"{len(train['Book-Title'].cat.categories)} titles, {len(train)} training ratings, "
+          f"{sum(map(len, held_out))} held out; scoring {len(users)} users")
+
+    def precision(recommended):
+        scored = [(set(names), truth) for (names, _), truth in zip(recommended, held_out) if truth]
+        return np.mean([len(names & truth) / args.k for names, truth in scored])
+
+    def train_timed(fit):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fit()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, seconds, peak / 2 ** 20
+
+    print(f"{'backend':<18} {f'p@{args.k}':>7} {'train s':>8} {'peak MiB':>9} {'model MiB':>10} {'users/s':>9}")
+
+    def report(name, p, seconds, peak, model_bytes, scoring_seconds):
+        print(f"{name:<18} {p:>7.3f} {seconds:>8.1f} {peak:>9.0f} {model_bytes / 2 ** 20:>10.1f} "
+              f"{len(users) / scoring_seconds:>9.0f}")
+
+    model, seconds, peak = train_timed(lambda: engine.build_model(train, backend="neighbors"))
+    start = time.perf_counter()
+    recommended = engine.recommend_for_users(histories, model, args.k)
+    report("neighbors", precision(recommended), seconds, peak, model[1].nbytes + model[2].nbytes,
+           time.perf_counter() - start)
+
+    titles, matrix = engine.rating_matrix(train)
+    (item_factors, user_factors), seconds, peak = train_timed(
+        lambda: engine.als_factors(matrix, factors=args.factors, iterations=args.iterations, threads=args.threads))
+    factor_bytes = item_factors.nbytes + user_factors.nbytes
+    start = time.perf_counter()
+    read = matrix.T.tocsr()[:len(users)]
+    recommended = engine.recommend_from_factors(user_factors[:len(users)], item_factors, titles, read, args.k)
+    report("als", precision(recommended), seconds, peak, factor_bytes, time.perf_counter() - start)
+
+    # New users: factors solved from their history at request time
+    start = time.perf_counter()
+    profiles = engine.profile_matrix(histories, titles)
+    recommended = engine.recommend_from_factors(engine.fold_in(profiles, item_factors), item_factors, titles, profiles, args.k)
+    report("als (fold-in)", precision(recommended), seconds, peak, item_factors.nbytes, time.perf_counter() - start)
+
+    # Popularity baseline: the most-rated titles each user has not read
+    popular = train["Book-Title"].value_counts().index
+    recommended = [([title for title in popular[:args.k + len(history)] if title not in history][:args.k], None)
+                   for history in histories]
+    print(f"{'most popular':<18} {precision(recommended):>7.3f}")
+
+
+def http_json(url: str, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+@contextlib.contextmanager
+def local_server(port: int, data_dir: str, workers: int = 1):
+    """Run the API under uvicorn in a subprocess, serving data_dir, for the duration of the block"""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning",
+         "--workers", str(workers)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, RECOMMENDER_DATA_DIR=data_dir),
+    )
+    try:
+        start = time.perf_counter()
+        for _ in range(3000):
+            try:
+                status = http_json(f"http://127.0.0.1:{port}/")
+                break
+            except OSError:
+                if server.poll() is not None:
+                    sys.exit("API server exited during startup")
+                time.sleep(0.1)
+        print(f"server up in {time.perf_counter() - start:.1f}s (model build {status['loadSeconds']}s, "
+              f"{status['titles']} titles)")
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def write_fixture_covers(directory: str, n: int, placeholders: int, seed: int = 0):
+    """JPEG covers the size of the dataset's large images, plus 1x1 GIF placeholders; returns their URLs"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:475, 0:300]
+    urls = []
+    for i in range(n):
+        r, g, b = rng.integers(0, 256, 3)
+        pixels = np.stack([(x * r / 300) % 256, (y * g / 475) % 256, ((x + y) * b / 775) % 256], axis=-1)
+        pixels += rng.normal(0, 12, pixels.shape)
+        name = f"{i:07d}.01.LZZZZZZZ.jpg"
+        Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(os.path.join(directory, name), quality=90)
+        urls.append(f"http://images.amazon.com/images/P/{name}")
+    for i in range(placeholders):
+        name = f"{n + i:07d}.01.LZZZZZZZ.gif"
+        Image.new("P", (1, 1)).save(os.path.join(directory, name))
+        urls.append(f"http://images.amazon.com/images/P/{name}")
+    return urls
+
+
+def bench_covers(args):
+    """Cover cache: cold fetch + resize vs. warm lookups, thumbnail size, LRU bound and single-flight misses"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from covers import CoverCache, fixture_fetcher
+
+    with tempfile.TemporaryDirectory() as fixtures, tempfile.TemporaryDirectory() as cache_dir:
+        urls = write_fixture_covers(fixtures, args.covers, args.placeholders, args.seed)
+        fetch = fixture_fetcher(fixtures)
+        original = sum(os.path.getsize(os.path.join(fixtures, name)) for name in os.listdir(fixtures))
+
+        cache = CoverCache(os.path.join(cache_dir, "unbounded"), 2 ** 40, fetch=fetch)
+        start = time.perf_counter()
+        for url in urls:
+            cache.get(url)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        for url in urls:
+            cache.get(url)
+        warm = time.perf_counter() - start
+        summary = cache.summary()
+        print(f"{len(urls)} covers ({args.placeholders} placeholders): "
+              f"cold {cold / len(urls) * 1000:.2f} ms/cover, warm {warm / len(urls) * 1000:.3f} ms/cover")
+        print(f"originals {original / 2 ** 20:.1f} MB -> thumbnails {summary['bytes'] / 2 ** 20:.2f} MB "
+              f"({summary['thumbnails']} files, {summary['bytes'] / max(1, summary['thumbnails']) / 1024:.1f} KB each)")
+        assert summary["thumbnails"] == args.covers, "placeholders should not be stored"
+
+        # A restart picks the cache up from disk
+        reopened = CoverCache(os.path.join(cache_dir, "unbounded"), 2 ** 40, fetch=fetch)
+        assert all(reopened.lookup(url) is not None for url in urls), "cache lost entries across a restart"
+
+        max_bytes = int(args.max_mb * 2 ** 20)
+        bounded = CoverCache(os.path.join(cache_dir, "bounded"), max_bytes, fetch=fetch)
+        start = time.perf_counter()
+        failed = bounded.prefetch(urls, threads=args.threads)
+        prefetch = time.perf_counter() - start
+        summary = bounded.summary()
+        print(f"prefetch with {args.threads} threads: {len(urls) / prefetch:.0f} covers/s, {failed} failed")
+        print(f"bounded to {args.max_mb} MB: {summary['thumbnails']} kept, {summary['evictions']} evicted, "
+              f"{summary['bytes'] / 2 ** 20:.2f} MB")
+        on_disk = sum(os.path.getsize(os.path.join(bounded.blob_dir, name)) for name in os.listdir(bounded.blob_dir))
+        assert summary["bytes"] <= max_bytes and on_disk == summary["bytes"], "cache outgrew its bound"
+        refs = len(os.listdir(bounded.ref_dir))
+        assert refs == summary["thumbnails"] + args.placeholders, "evicted thumbnails left refs behind"
+
+        # Concurrent misses on one cover fetch it once
+        fetches = []
+        lock = threading.Lock()
+
+        def counting_fetch(url):
+            with lock:
+                fetches.append(url)
+            time.sleep(0.05)
+            return fetch(url)
+
+        shared = CoverCache(os.path.join(cache_dir, "shared"), 2 ** 40, fetch=counting_fetch)
+        with ThreadPoolExecutor(16) as pool:
+            keys = set(pool.map(shared.get, [urls[0]] * 16))
+        print(f"16 concurrent misses on one cover: {len(fetches)} fetch(es), {len(keys)} key(s)")
+        if len(fetches) != 1 or len(keys) != 1:
+            sys.exit("FAIL: concurrent misses were not coalesced")
+
+
+def bench_api(args):
+    """Load test: requests/sec and latency of single and batch recommendation queries over HTTP"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def drive(send, seconds):
+        def client(seed):
+            rng = np.random.default_rng(seed)
+            latencies = []
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                send(rng)
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            latencies = [t for part in pool.map(client, range(args.clients)) for t in part]
+        return np.array(latencies) * 1000, time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_source_csvs(data_dir, args.books, args.users, args.ratings)
+        with local_server(args.port, data_dir, args.workers) as url:
+            titles = http_json(f"{url}/api/titles")["titles"]
+
+            def single(rng):
+                title = titles[rng.integers(len(titles))]
+                http_json(f"{url}/api/recommend?" + urllib.parse.urlencode({"title": title, "n": args.n}))
+
+            def batch(rng):
+                query = [titles[i] for i in rng.integers(0, len(titles), args.batch)]
+                http_json(f"{url}/api/recommend/batch", {"titles": query, "n": args.n})
+
+            print(f"{args.clients} clients x {args.seconds}s, {args.workers} worker(s), n={args.n}")
+            print(f"{'query':<12} {'req/s':>8} {'titles/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+            for label, send, per_request in (("single", single, 1), (f"batch {args.batch}", batch, args.batch)):
+                latencies, elapsed = drive(send, args.seconds)
+                rate = len(latencies) / elapsed
+                print(f"{label:<12} {rate:>8.0f} {rate * per_request:>10.0f} "
+                      f"{np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 99):>8.1f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ann = subparsers.add_parser("ann", help=bench_ann.__doc__)
+    ann.add_argument("--titles", type=int, default=20_000)
+    ann.add_argument("--users", type=int, default=20_000)
+    ann.add_argument("--ratings", type=int, default=3_000_000)
+    ann.add_argument("--tables", type=int, nargs="+", default=[2, 4, 8])
+    ann.add_argument("--bucket-size", type=int, default=engine.LSH_BUCKET_SIZE)
+    ann.add_argument("--dims", type=int, default=engine.LSH_DIMS)
+    ann.add_argument("--candidates", type=int, default=engine.LSH_CANDIDATES)
+    ann.add_argument("--k", type=int, default=10)
+    ann.add_argument("--queries", type=int, default=1_000)
+    ann.set_defaults(func=bench_ann)
+
+    datacache = subparsers.add_parser("datacache", help=bench_datacache.__doc__)
+    datacache.add_argument("--books", type=int, default=271_000)
+    datacache.add_argument("--users", type=int, default=105_000)
+    datacache.add_argument("--ratings", type=int, default=1_150_000)
+    datacache.set_defaults(func=bench_datacache)
+
+    incremental = subparsers.add_parser("incremental", help=bench_incremental.__doc__)
+    incremental.add_argument("--titles", type=int, default=20_000)
+    incremental.add_argument("--users", type=int, default=20_000)
+    incremental.add_argument("--ratings", type=int, default=2_000_000)
+    incremental.add_argument("--deltas", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    incremental.add_argument("--seed", type=int, default=0)
+    incremental.add_argument("--backend", choices=["neighbors", "als"], default="neighbors")
+    incremental.set_defaults(func=bench_incremental)
+
+    profiles = subparsers.add_parser("profiles", help=bench_profiles.__doc__)
+    profiles.add_argument("--titles", type=int, default=10_000)
+    profiles.add_argument("--users", type=int, default=10_000)
+    profiles.add_argument("--ratings", type=int, default=1_000_000)
+    profiles.add_argument("--scored", type=int, default=5_000)
+    profiles.add_argument("--single", type=int, default=500)
+    profiles.add_argument("--n", type=int, default=10)
+    profiles.set_defaults(func=bench_profiles)
+
+    evaluate = subparsers.add_parser("evaluate", help=bench_evaluate.__doc__)
+    evaluate.add_argument("--titles", type=int, default=10_000)
+    evaluate.add_argument("--users", type=int, default=10_000)
+    evaluate.add_argument("--ratings", type=int, default=1_000_000)
+    evaluate.add_argument("--test-fraction", type=float, default=0.2)
+    evaluate.add_argument("--scored", type=int, default=5_000)
+    evaluate.add_argument("--k", type=int, default=10)
+    evaluate.add_argument("--factors", type=int, default=engine.ALS_FACTORS)
+    evaluate.add_argument("--iterations", type=int, default=engine.ALS_ITERATIONS)
+    evaluate.add_argument("--threads", type=int, default=engine.ALS_THREADS)
+    evaluate.add_argument("--seed", type=int, default=0)
+    evaluate.set_defaults(func=bench_evaluate)
+
+    api = subparsers.add_parser("api", help=bench_api.__doc__)
+    api.add_argument("--books", type=int, default=271_000)
+    api.add_argument("--users", type=int, default=105_000)
+    api.add_argument("--ratings", type=int, default=1_150_000)
+    api.add_argument("--port", type=int, default=8011)
+    api.add_argument("--workers", type=int, default=1)
+    api.add_argument("--clients", type=int, default=8)
+    api.add_argument("--seconds", type=float, default=10.0)
+    api.add_argument("--batch", type=int, default=100)
+    api.add_argument("--n", type=int, default=5)
+    api.set_defaults(func=bench_api)
+
+    covers = subparsers.add_parser("covers", help=bench_covers.__doc__)
+    covers.add_argument("--covers", type=int, default=500)
+    covers.add_argument("--placeholders", type=int, default=50)
+    covers.add_argument("--max-mb", type=float, default=1.0)
+    covers.add_argument("--threads", type=int, default=8)
+    covers.add_argument("--seed", type=int, default=0)
+    covers.set_defaults(func=bench_covers)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,266 @@
+# covers.py
+#
+# Local cache of book cover thumbnails. Each cover URL is fetched once,
+# scaled down to THUMBNAIL_WIDTH pixels wide and stored as a JPEG named by
+# the SHA-256 of its bytes, so editions sharing a cover share one file. A
+# small ref file per URL records which thumbnail it resolved to. Thumbnails
+# are evicted least recently used first once they pass max_bytes, taking
+# their refs with them; their order survives restarts through the files'
+# modification times. Refs of URLs without a cover are kept for at most
+# NO_COVER_TTL seconds, and only the newest NO_COVER_MAX_REFS of them.
+
+import hashlib
+import io
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image
+
+THUMBNAIL_WIDTH = 150
+# Ref contents for URLs without a usable image (Amazon answers those with a 1x1 GIF)
+NO_COVER = '-'
+# A missing cover may be uploaded later, and every book without one would
+# otherwise leave a ref behind for good
+NO_COVER_TTL = 7 * 24 * 3600
+NO_COVER_MAX_REFS = 10_000
+
+def fetch_url(url, timeout=10):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+def fixture_fetcher(directory):
+    """A fetch function serving covers from a local directory by the URL's file
+    name, standing in for the remote image host
+    """
+    def fetch(url):
+        with open(os.path.join(directory, os.path.basename(urllib.parse.urlparse(url).path)), 'rb') as f:
+            return f.read()
+    return fetch
+
+def make_thumbnail(data, width=THUMBNAIL_WIDTH):
+    """JPEG bytes of the image scaled to `width` pixels wide (never enlarged),
+    or None for a placeholder image
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width <= 1 or image.height <= 1:
+            return None
+        width = min(width, image.width)
+        size = (width, max(1, round(image.height * width / image.width)))
+        image.draft('RGB', size)  # JPEGs decode straight at a reduced scale
+        thumbnail = image.convert('RGB').resize(size, Image.LANCZOS)
+    out = io.BytesIO()
+    thumbnail.save(out, 'JPEG', quality=85, optimize=True)
+    return out.getvalue()
+
+def write_atomic(path, data):
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class CoverCache:
+    """Thumbnails on disk keyed by content, with LRU eviction past max_bytes"""
+
+    def __init__(self, cache_dir, max_bytes, fetch=fetch_url, width=THUMBNAIL_WIDTH,
+                 no_cover_ttl=NO_COVER_TTL, max_no_cover=NO_COVER_MAX_REFS):
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.ref_dir = os.path.join(cache_dir, 'refs')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.ref_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self.width = width
+        self.no_cover_ttl = no_cover_ttl
+        self.max_no_cover = max_no_cover
+        self.lock = threading.Lock()
+        self.in_flight = {}  # URL -> Future of its key, so concurrent misses fetch once
+        self.hits = self.misses = self.evictions = 0
+
+        # key -> size, least recently used first
+        self.blobs = OrderedDict()
+        entries = []
+        for name in os.listdir(self.blob_dir):
+            if name.endswith('.jpg'):
+                info = os.stat(os.path.join(self.blob_dir, name))
+                entries.append((info.st_mtime_ns, name[:-4], info.st_size))
+        for _, key, size in sorted(entries):
+            self.blobs[key] = size
+        self.total_bytes = sum(self.blobs.values())
+
+        # ref name -> key or NO_COVER, the refs resolving to each key, and
+        # NO_COVER refs oldest first; refs whose thumbnail is gone are dropped
+        self.refs = {}
+        self.blob_refs = {}
+        self.no_cover = OrderedDict()
+        entries = []
+        for name in os.listdir(self.ref_dir):
+            path = os.path.join(self.ref_dir, name)
+            try:
+                with open(path) as f:
+                    entries.append((os.fstat(f.fileno()).st_mtime_ns, name, f.read()))
+            except FileNotFoundError:
+                continue
+        for _, name, key in sorted(entries):
+            if key == NO_COVER or key in self.blobs:
+                self.link(name, key)
+            else:
+                self.unlink(name)
+
+    def ref_name(self, url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def ref_path(self, url):
+        return os.path.join(self.ref_dir, self.ref_name(url))
+
+    def link(self, name, key):
+        """Record that ref `name` resolves to key; the caller holds the lock
+        (or is the constructor) and has written the ref file
+        """
+        old = self.refs.get(name)
+        if old == NO_COVER:
+            self.no_cover.pop(name)
+        elif old is not None:
+            self.blob_refs[old].discard(name)
+        self.refs[name] = key
+        if key != NO_COVER:
+            self.blob_refs.setdefault(key, set()).add(name)
+            return
+        self.no_cover[name] = None
+        while len(self.no_cover) > self.max_no_cover:
+            self.unlink(next(iter(self.no_cover)))
+
+    def unlink(self, name):
+        """Forget ref `name` and delete its file; the caller holds the lock"""
+        key = self.refs.pop(name, None)
+        if key == NO_COVER:
+            self.no_cover.pop(name)
+        elif key is not None:
+            self.blob_refs[key].discard(name)
+        try:
+            os.remove(os.path.join(self.ref_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def blob_path(self, key):
+        return os.path.join(self.blob_dir, f'{key}.jpg')
+
+    def lookup(self, url):
+        """Key of url's cached thumbnail, NO_COVER, or None when it is not cached"""
+        name = self.ref_name(url)
+        try:
+            with open(self.ref_path(url)) as f:
+                key = f.read()
+                expired = key == NO_COVER and time.time() - os.fstat(f.fileno()).st_mtime > self.no_cover_ttl
+        except FileNotFoundError:
+            return None
+        if key == NO_COVER and not expired:
+            return key
+        with self.lock:
+            if expired or key not in self.blobs:
+                self.unlink(name)  # Expired, or a thumbnail this process does not hold: fetch again
+                return None
+            self.blobs.move_to_end(key)
+        try:
+            os.utime(self.blob_path(key))
+        except FileNotFoundError:
+            return None
+        return key
+
+    def get(self, url):
+        """Key of url's thumbnail, fetching and storing it on a miss; None if the book has no cover"""
+        key = self.lookup(url)
+        if key is not None:
+            with self.lock:
+                self.hits += 1
+            return None if key == NO_COVER else key
+
+        with self.lock:
+            future = self.in_flight.get(url)
+            owner = future is None
+            if owner:
+                future = self.in_flight[url] = Future()
+                self.misses += 1
+        if not owner:
+            return future.result()
+        try:
+            key = self.store(url, make_thumbnail(self.fetch(url), self.width))
+            future.set_result(key)
+            return key
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(url, None)
+
+    def store(self, url, thumbnail):
+        name = self.ref_name(url)
+        if thumbnail is None:
+            write_atomic(self.ref_path(url), NO_COVER.encode())
+            with self.lock:
+                self.link(name, NO_COVER)
+            return None
+        key = hashlib.sha256(thumbnail).hexdigest()
+        with self.lock:
+            stored = key in self.blobs
+        if not stored:
+            write_atomic(self.blob_path(key), thumbnail)
+            with self.lock:
+                if key not in self.blobs:
+                    self.blobs[key] = len(thumbnail)
+                    self.total_bytes += len(thumbnail)
+                self.evict()
+        write_atomic(self.ref_path(url), key.encode())
+        with self.lock:
+            if key in self.blobs:
+                self.link(name, key)
+            else:
+                self.unlink(name)  # Evicted by a concurrent store before its ref was written
+        return key
+
+    def evict(self):
+        """Drop least recently used thumbnails and their refs until under max_bytes (always keeping the newest)"""
+        while self.total_bytes > self.max_bytes and len(self.blobs) > 1:
+            key, size = self.blobs.popitem(last=False)
+            try:
+                os.remove(self.blob_path(key))
+            except FileNotFoundError:
+                pass
+            for name in self.blob_refs.pop(key, ()):
+                self.refs.pop(name)
+                try:
+                    os.remove(os.path.join(self.ref_dir, name))
+                except FileNotFoundError:
+                    pass
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def prefetch(self, urls, threads=8):
+        """Fetch any of urls not cached yet; returns how many could not be fetched"""
+        def fetch(url):
+            try:
+                self.get(url)
+                return 0
+            except (OSError, ValueError):
+                return 1
+
+        with ThreadPoolExecutor(threads) as pool:
+            return sum(pool.map(fetch, dict.fromkeys(urls)))
+
+    def summary(self):
+        with self.lock:
+            return {
+                'thumbnails': len(self.blobs),
+                'refs': len(self.refs),
+                'noCoverRefs': len(self.no_cover),
+                'bytes': self.total_bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
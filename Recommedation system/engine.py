@@ -0,0 +1,1037 @@
+# engine.py
+#
+# Data loading, the neighbor model and recommendation lookups, free of any UI
+# so the API service, the Streamlit page and the benchmarks share one copy.
+
+import hashlib
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+# ------------------------------------------
+# Load and Filter Data
+# ------------------------------------------
+
+DATA_DIR = os.environ.get('RECOMMENDER_DATA_DIR', 'data')
+SOURCE_FILES = ('Books.csv', 'Ratings.csv')
+# Parsed ratings as integer-coded .npy columns plus the string dictionaries;
+# rebuilt whenever a source CSV changes
+CACHE_COLUMNS = ('user_codes', 'title_codes', 'image_codes', 'ratings')
+
+def read_sources(data_dir=DATA_DIR):
+    """Parse and merge the source CSVs into one row per rating (before the popularity filters)"""
+    books = pd.read_csv(os.path.join(data_dir, 'Books.csv'), dtype=str, encoding='latin-1', on_bad_lines='skip')
+    ratings = pd.read_csv(os.path.join(data_dir, 'Ratings.csv'), dtype=str, encoding='latin-1', on_bad_lines='skip')
+
+    # Clean ratings
+    ratings['Book-Rating'] = pd.to_numeric(ratings['Book-Rating'], errors='coerce')
+    ratings.dropna(subset=['User-ID', 'ISBN', 'Book-Rating'], inplace=True)
+    ratings = ratings[ratings['Book-Rating'] > 0]
+
+    # Merge with books (include image URLs)
+    ratings_books = ratings.merge(books[['ISBN', 'Book-Title', 'Image-URL-L']], on='ISBN')
+    ratings_books = ratings_books[['User-ID', 'Book-Title', 'Book-Rating', 'Image-URL-L']]
+    return ratings_books.dropna(subset=['Book-Title'])
+
+def source_state(data_dir=DATA_DIR, digests=None):
+    """Size, mtime and SHA-256 of each source file; digests from a previous
+    state are reused for files whose size and mtime have not changed
+    """
+    state = {}
+    for name in SOURCE_FILES:
+        info = os.stat(os.path.join(data_dir, name))
+        previous = (digests or {}).get(name)
+        if previous and previous['size'] == info.st_size and previous['mtime'] == info.st_mtime_ns:
+            digest = previous['sha256']
+        else:
+            with open(os.path.join(data_dir, name), 'rb') as f:
+                digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        state[name] = {'size': info.st_size, 'mtime': info.st_mtime_ns, 'sha256': digest}
+    return state
+
+def cache_path(cache_dir, build, name):
+    return os.path.join(cache_dir, f'{build}.{name}')
+
+def build_data_cache(data_dir=DATA_DIR, sources=None):
+    """Parse the CSVs once and write the columnar cache to data_dir/cache"""
+    cache_dir = os.path.join(data_dir, 'cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    sources = sources or source_state(data_dir)
+    ratings_books = read_sources(data_dir)
+    users = ratings_books['User-ID'].astype('category')
+    titles = ratings_books['Book-Title'].astype('category')
+    images = ratings_books['Image-URL-L'].astype('category')
+
+    # Files are named by build, so a reader never mixes two builds' columns
+    build = uuid.uuid4().hex[:12]
+    columns = {
+        'user_codes': users.cat.codes.to_numpy(dtype=np.int32),
+        'title_codes': titles.cat.codes.to_numpy(dtype=np.int32),
+        'image_codes': images.cat.codes.to_numpy(dtype=np.int32),  # -1 where a book has no image
+        'ratings': ratings_books['Book-Rating'].to_numpy(dtype=np.float32),
+    }
+    for name, column in columns.items():
+        np.save(cache_path(cache_dir, build, f'{name}.npy'), column)
+    with open(cache_path(cache_dir, build, 'dictionary.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'users': users.cat.categories.tolist(),
+            'titles': titles.cat.categories.tolist(),
+            'images': images.cat.categories.tolist(),
+        }, f)
+    write_manifest(cache_dir, {'build': build, 'sources': sources})
+
+    for name in os.listdir(cache_dir):
+        if not name.startswith(build) and name != 'manifest.json':
+            os.remove(os.path.join(cache_dir, name))  # Open memory maps keep their files alive
+    return build
+
+def write_manifest(cache_dir, manifest):
+    tmp = os.path.join(cache_dir, f'manifest.json.{os.getpid()}')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(cache_dir, 'manifest.json'))
+
+def read_data_cache(data_dir=DATA_DIR):
+    """Ratings from the columnar cache, rebuilding it first if the sources changed"""
+    cache_dir = os.path.join(data_dir, 'cache')
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+
+    if manifest is None:
+        build = build_data_cache(data_dir)
+    else:
+        sources = source_state(data_dir, manifest['sources'])
+        build = manifest['build']
+        if sources != manifest['sources']:
+            if any(sources[name]['sha256'] != manifest['sources'][name]['sha256'] for name in SOURCE_FILES):
+                build = build_data_cache(data_dir, sources)
+            else:
+                write_manifest(cache_dir, dict(manifest, sources=sources))  # Touched, not changed
+
+    columns = {name: np.load(cache_path(cache_dir, build, f'{name}.npy'), mmap_mode='r') for name in CACHE_COLUMNS}
+    with open(cache_path(cache_dir, build, 'dictionary.json'), encoding='utf-8') as f:
+        dictionary = json.load(f)
+    return pd.DataFrame({
+        'User-ID': pd.Categorical.from_codes(columns['user_codes'], dictionary['users']),
+        'Book-Title': pd.Categorical.from_codes(columns['title_codes'], dictionary['titles']),
+        'Book-Rating': columns['ratings'],
+        'Image-URL-L': pd.Categorical.from_codes(columns['image_codes'], dictionary['images']),
+    })
+
+def filter_popular(ratings_books, min_book_ratings=50, min_user_ratings=20):
+    """Keep books with more than min_book_ratings ratings, then users with
+    more than min_user_ratings ratings of those books
+    """
+    title_codes = ratings_books['Book-Title'].cat.codes.to_numpy()
+    user_codes = ratings_books['User-ID'].cat.codes.to_numpy()
+    keep = np.bincount(title_codes)[title_codes] > min_book_ratings
+    keep &= np.bincount(user_codes[keep], minlength=len(ratings_books['User-ID'].cat.categories))[user_codes] > min_user_ratings
+    ratings_books = ratings_books[keep]
+    return ratings_books.assign(**{
+        column: ratings_books[column].cat.remove_unused_categories() for column in ('User-ID', 'Book-Title')
+    })
+
+def load_data(data_dir=DATA_DIR):
+    return filter_popular(read_data_cache(data_dir))
+
+def cover_images(ratings_books, titles):
+    """Cover image URL of each title (None where it has none), aligned with titles"""
+    images = ratings_books.drop_duplicates('Book-Title').set_index('Book-Title')['Image-URL-L']
+    images = images.astype(object).reindex(titles)
+    return images.where(images.notna(), None).tolist()
+
+# ------------------------------------------
+# Build Neighbor Table
+# ------------------------------------------
+
+# Neighbors kept per title; the UI asks for at most 10
+NUM_NEIGHBORS = 50
+# Upper bound on similarity entries materialized at once while building
+BLOCK_CELLS = 2 ** 24
+# Exact search multiplies out every pair of titles a user has rated, so its
+# cost is the sum over users of (ratings per user)**2; above this it goes approximate
+EXACT_MAX_COST = 5 * 10 ** 7
+# LSH settings: more tables raise recall, smaller buckets speed up the search;
+# item vectors are reduced to LSH_DIMS dimensions first
+LSH_TABLES = 8
+LSH_BUCKET_SIZE = 500
+LSH_DIMS = 64
+# Closest items in the reduced space that get re-ranked by exact cosine
+LSH_CANDIDATES = 100
+# Candidate pairs re-scored by exact cosine at once
+RERANK_PAIRS = 2 ** 16
+
+def keep_top_k(rows, cols, data, n_rows, k):
+    """The k best (col, score) entries of each row from coordinate lists, as
+    (n_rows, k) int32 / float32 tables sorted best first (ties by column)
+    """
+    order = np.lexsort((cols, -data, rows))
+    rows, cols, data = rows[order], cols[order], data[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    top = rank < k
+    neighbors = np.full((n_rows, k), -1, dtype=np.int32)
+    scores = np.zeros((n_rows, k), dtype=np.float32)
+    neighbors[rows[top], rank[top]] = cols[top]
+    scores[rows[top], rank[top]] = data[top]
+    return neighbors, scores
+
+def dense_top_k(sim, k):
+    """The k best positive entries of each row of a dense score block, in the
+    same (n_rows, k) table format as keep_top_k
+    """
+    neighbors = np.full((sim.shape[0], k), -1, dtype=np.int32)
+    scores = np.zeros((sim.shape[0], k), dtype=np.float32)
+    k = min(k, sim.shape[1])
+    if k == 0:
+        return neighbors, scores
+    # Partial selection of the k best, then only those k are sorted
+    top = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(sim, top, axis=1)
+    order = np.lexsort((top, -top_scores))  # Best first, ties by column
+    top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+    listed = top_scores > 0
+    neighbors[:, :k] = np.where(listed, top, -1)
+    scores[:, :k] = np.where(listed, top_scores, 0)
+    return neighbors, scores
+
+def top_k_neighbors(item_user_matrix, k):
+    """Top-k cosine neighbors of every row, best first, as int32 indices and
+    float32 scores. Rows are processed in blocks so the full N x N similarity
+    is never held; slots without a neighbor hold index -1 and score 0.
+    """
+    items = normalize(item_user_matrix)  # Unit rows: cosine similarity is a dot product
+    items_t = items.T.tocsr()
+    n = items.shape[0]
+    k = max(0, min(k, n - 1))
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    block = max(1, BLOCK_CELLS // max(n, 1))
+
+    for start in range(0, n, block):
+        sim = (items[start:start + block] @ items_t).tocsr()
+        rows = np.repeat(np.arange(sim.shape[0]), np.diff(sim.indptr))
+        keep = (sim.indices != rows + start) & (sim.data > 0)
+        neighbors[start:start + block], scores[start:start + block] = keep_top_k(
+            rows[keep], sim.indices[keep], sim.data[keep], sim.shape[0], k)
+    return neighbors, scores
+
+def merge_candidates(idx, scores, new_idx, new_scores, c):
+    """Row-wise union of two (n, *) candidate tables, keeping the c best-scored
+    distinct candidates per row; empty slots hold -1 and -inf
+    """
+    idx = np.concatenate([idx, new_idx], axis=1)
+    scores = np.concatenate([scores, new_scores], axis=1)
+    order = np.argsort(idx, axis=1, kind='stable')
+    idx, scores = np.take_along_axis(idx, order, axis=1), np.take_along_axis(scores, order, axis=1)
+    scores[:, 1:][idx[:, 1:] == idx[:, :-1]] = -np.inf  # Found by more than one table
+    top = np.argpartition(-scores, c - 1, axis=1)[:, :c]
+    idx, scores = np.take_along_axis(idx, top, axis=1), np.take_along_axis(scores, top, axis=1)
+    idx[np.isneginf(scores)] = -1
+    return idx, scores
+
+def exact_cost(item_user_matrix):
+    """Pairwise products the exact search performs"""
+    ratings_per_user = np.bincount(item_user_matrix.indices, minlength=item_user_matrix.shape[1])
+    return int((ratings_per_user.astype(np.int64) ** 2).sum())
+
+def lsh_neighbors(item_user_matrix, k, n_tables=LSH_TABLES, bucket_size=LSH_BUCKET_SIZE, dims=LSH_DIMS,
+                  candidates=LSH_CANDIDATES, seed=0):
+    """Approximate top-k cosine neighbors via random-hyperplane LSH, in the
+    same table format as top_k_neighbors.
+
+    Items are reduced to `dims`-dimensional unit vectors (truncated SVD) and
+    hashed into buckets of about `bucket_size` items by n_tables independent
+    sets of random hyperplanes. Items are only compared within their buckets, so cost grows
+    with N x bucket size instead of N**2. The `candidates` closest items in
+    the reduced space are then re-ranked by the exact cosine of the full
+    rating vectors.
+    """
+    items = normalize(item_user_matrix)
+    n = items.shape[0]
+    k = max(0, min(k, n - 1))
+    c = max(k, min(candidates, n - 1))
+    dims = max(1, min(dims, items.shape[1] - 1, n - 1))
+    embeddings = normalize(TruncatedSVD(dims, random_state=seed).fit_transform(items)).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    n_bits = max(1, int(np.round(np.log2(max(n / bucket_size, 1)))))
+    weights = 1 << np.arange(n_bits)
+    best = np.full((n, c), -1, dtype=np.int32)
+    best_scores = np.full((n, c), -np.inf, dtype=np.float32)
+
+    for _ in range(n_tables):
+        codes = (embeddings @ rng.standard_normal((embeddings.shape[1], n_bits)).astype(np.float32) > 0) @ weights
+        order = np.argsort(codes, kind='stable')
+        found = np.full((n, c), -1, dtype=np.int32)
+        found_scores = np.full((n, c), -np.inf, dtype=np.float32)
+        for members in np.split(order, np.flatnonzero(np.diff(codes[order])) + 1):
+            if len(members) < 2:
+                continue
+            cc = min(c, len(members) - 1)
+            step = max(1, BLOCK_CELLS // len(members))
+            for start in range(0, len(members), step):
+                chunk = members[start:start + step]
+                sim = embeddings[chunk] @ embeddings[members].T
+                sim[np.arange(len(chunk)), start + np.arange(len(chunk))] = -np.inf  # Not its own neighbor
+                top = np.argpartition(-sim, cc - 1, axis=1)[:, :cc]
+                found[chunk, :cc] = members[top]
+                found_scores[chunk, :cc] = np.take_along_axis(sim, top, axis=1)
+        best, best_scores = merge_candidates(best, best_scores, found, found_scores, c)
+
+    # Re-rank by the exact cosine, dropping pairs with no reader in common
+    rows, slots = np.nonzero(best >= 0)
+    cols = best[rows, slots]
+    exact = np.full((n, c), -np.inf, dtype=np.float32)
+    for start in range(0, len(rows), RERANK_PAIRS):
+        part = slice(start, start + RERANK_PAIRS)
+        exact[rows[part], slots[part]] = np.asarray(items[rows[part]].multiply(items[cols[part]]).sum(axis=1)).ravel()
+    exact[exact <= 0] = -np.inf
+    order = np.lexsort((best, -exact))[:, :k]  # Best first, ties by title order
+    neighbors, scores = np.take_along_axis(best, order, axis=1), np.take_along_axis(exact, order, axis=1)
+    missing = np.isneginf(scores)
+    neighbors[missing], scores[missing] = -1, 0
+    return neighbors, scores
+
+def rating_matrix(ratings_books):
+    """Sparse title x user rating matrix, and the titles its rows stand for"""
+    # A user rating several editions of a title counts once, with their mean rating
+    ratings = ratings_books.groupby(['Book-Title', 'User-ID'], observed=True)['Book-Rating'].mean().reset_index()
+
+    # Categorical codes index the sparse title x user matrix, so memory grows
+    # with the number of ratings rather than titles x users
+    titles = ratings['Book-Title'].astype('category')
+    users = ratings['User-ID'].astype('category')
+    item_user_matrix = csr_matrix(
+        (ratings['Book-Rating'].to_numpy(dtype=np.float32), (titles.cat.codes, users.cat.codes)),
+        shape=(len(titles.cat.categories), len(users.cat.categories)),
+    )
+    return titles.cat.categories, item_user_matrix
+
+def build_model(ratings_books, backend=None):
+    titles, item_user_matrix = rating_matrix(ratings_books)
+    if (backend or MODEL_BACKEND) == 'als':
+        # Item neighbors from the factors; the factors themselves take titles x ALS_FACTORS floats
+        neighbors, scores = factor_neighbors(als_factors(item_user_matrix)[0], NUM_NEIGHBORS)
+        return titles, neighbors, scores
+    search = top_k_neighbors if exact_cost(item_user_matrix) <= EXACT_MAX_COST else lsh_neighbors
+    neighbors, scores = search(item_user_matrix, NUM_NEIGHBORS)
+    return titles, neighbors, scores
+
+# ------------------------------------------
+# Latent Factor Model
+# ------------------------------------------
+
+# build_model and load_model backend: 'neighbors' (item-item cosine,
+# IncrementalModel when served) or 'als' (latent factors, ALSModel)
+MODEL_BACKEND = os.environ.get('RECOMMENDER_BACKEND', 'neighbors')
+# Implicit-feedback ALS: a rating r counts as a read with confidence 1 + ALS_ALPHA * r
+ALS_FACTORS = 64
+ALS_REGULARIZATION = 0.1
+ALS_ALPHA = 1.0
+ALS_ITERATIONS = 10
+# Each least-squares solve takes a few conjugate-gradient steps from the
+# previous iteration's factors; folding in a new user starts from zero
+ALS_CG_STEPS = 3
+ALS_FOLD_IN_STEPS = 10
+# Rows solved per task; NumPy and SciPy release the GIL in their kernels, so tasks run on threads
+ALS_BLOCK_ROWS = 2048
+ALS_THREADS = os.cpu_count() or 1
+
+def als_solve(ratings, fixed, current, gram, alpha, steps):
+    """Conjugate-gradient solve of (gram + F'(C - I)F) x = F'C·1 for each
+    row of a (rows x n_fixed) rating block, starting from current, where F
+    is the fixed side's factors and C the row's confidences
+    """
+    rows = np.repeat(np.arange(ratings.shape[0]), np.diff(ratings.indptr))
+    cols = ratings.indices
+    extra = (alpha * ratings.data).astype(np.float32)  # C - I on the rated entries
+    rated = fixed[cols]
+
+    def weighted(values):
+        return csr_matrix((values, cols, ratings.indptr), shape=ratings.shape)
+
+    def apply(x):
+        return x @ gram + weighted(extra * np.einsum('ij,ij->i', x[rows], rated)) @ fixed
+
+    x = current.copy()
+    residual = weighted(1 + extra) @ fixed - apply(x)
+    direction = residual.copy()
+    rs = np.einsum('ij,ij->i', residual, residual)
+    for _ in range(steps):
+        step_dir = apply(direction)
+        step = rs / np.maximum(np.einsum('ij,ij->i', direction, step_dir), 1e-20)
+        x += step[:, None] * direction
+        residual -= step[:, None] * step_dir
+        rs_next = np.einsum('ij,ij->i', residual, residual)
+        direction = residual + (rs_next / np.maximum(rs, 1e-20))[:, None] * direction
+        rs = rs_next
+    return x
+
+def als_factors(item_user_matrix, factors=ALS_FACTORS, regularization=ALS_REGULARIZATION, alpha=ALS_ALPHA,
+                iterations=ALS_ITERATIONS, threads=ALS_THREADS, seed=0):
+    """Implicit-feedback ALS on the title x user rating matrix; returns
+    float32 (item_factors, user_factors), so a user's predicted preference
+    for a title is the dot product of their rows
+    """
+    items = csr_matrix(item_user_matrix, dtype=np.float32)
+    users = items.T.tocsr()
+    rng = np.random.default_rng(seed)
+    item_factors = (rng.standard_normal((items.shape[0], factors)) * 0.01).astype(np.float32)
+    user_factors = np.zeros((users.shape[0], factors), dtype=np.float32)
+    identity = np.eye(factors, dtype=np.float32)
+
+    with ThreadPoolExecutor(threads) as pool:
+        for _ in range(iterations):
+            for ratings, solved, fixed in ((users, user_factors, item_factors), (items, item_factors, user_factors)):
+                gram = fixed.T @ fixed + regularization * identity
+
+                def solve(start, ratings=ratings, solved=solved, fixed=fixed, gram=gram):
+                    block = slice(start, start + ALS_BLOCK_ROWS)
+                    solved[block] = als_solve(ratings[block], fixed, solved[block], gram, alpha, ALS_CG_STEPS)
+
+                list(pool.map(solve, range(0, ratings.shape[0], ALS_BLOCK_ROWS)))
+    return item_factors, user_factors
+
+def fold_in(profiles, item_factors, regularization=ALS_REGULARIZATION, alpha=ALS_ALPHA, gram=None):
+    """Factors for users the model was not trained on, from a sparse users x
+    titles rating matrix (see profile_matrix); gram is item_factors' Gram
+    matrix plus the regularization, if the caller keeps one up to date
+    """
+    if gram is None:
+        gram = item_factors.T @ item_factors + regularization * np.eye(item_factors.shape[1], dtype=np.float32)
+    current = np.zeros((profiles.shape[0], item_factors.shape[1]), dtype=np.float32)
+    return als_solve(csr_matrix(profiles, dtype=np.float32), item_factors, current, gram, alpha, ALS_FOLD_IN_STEPS)
+
+def factor_neighbors(item_factors, k):
+    """Top-k cosine neighbors of every title in factor space, in the same table format as top_k_neighbors"""
+    unit = normalize(item_factors)
+    n = len(unit)
+    block = max(1, BLOCK_CELLS // max(n, 1))
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    for start in range(0, n, block):
+        sim = unit[start:start + block] @ unit.T
+        sim[np.arange(len(sim)), start + np.arange(len(sim))] = 0  # Not its own neighbor
+        neighbors[start:start + block], scores[start:start + block] = dense_top_k(sim, k)
+    return neighbors, scores
+
+def recommend_from_factors(user_factors, item_factors, titles, read=None, num_recommendations=5):
+    """Top-N titles for each user by dot product with the item factors, as
+    (titles, scores) pairs of lists; titles in the sparse `read` matrix are left out
+    """
+    block = max(1, BLOCK_CELLS // max(len(titles), 1))
+    results = []
+    for start in range(0, len(user_factors), block):
+        scores = user_factors[start:start + block] @ item_factors.T
+        if read is not None:
+            scores[read[start:start + block].nonzero()] = 0  # Already read
+        top, top_scores = dense_top_k(scores, num_recommendations)
+        for row, row_scores in zip(top, top_scores):
+            listed = row >= 0
+            results.append((titles[row[listed]].tolist(), row_scores[listed].tolist()))
+    return results
+
+
+# ------------------------------------------
+# Incremental Updates
+# ------------------------------------------
+
+# A buffered matrix folds its pending additions into the compressed base once
+# they pass this fraction of the base's entries (and at least the minimum),
+# so each rebuild is paid for by that many cheap updates before it
+COMPACT_FRACTION = 0.1
+COMPACT_MIN_ENTRIES = 2 ** 16
+
+def encode(names, ids, vocabulary):
+    """Integer ids of names, giving unseen names the next free id"""
+    codes = np.empty(len(names), dtype=np.int64)
+    for i, name in enumerate(names):
+        code = ids.get(name)
+        if code is None:
+            code = ids[name] = len(vocabulary)
+            vocabulary.append(name)
+        codes[i] = code
+    return codes
+
+def lookup(matrix, rows, cols):
+    """matrix[rows[i], cols[i]] for each i, as a flat array"""
+    if not len(rows):
+        return np.zeros(0, dtype=matrix.dtype)
+    return np.asarray(matrix[rows, cols]).ravel()
+
+def grow(array, n, fill):
+    return np.concatenate([array, np.full(n - len(array), fill, dtype=array.dtype)])
+
+def entries(pending, keys):
+    """(key, other, value) arrays of the pending entries under each of keys"""
+    found = [(key, other, value) for key in keys for other, value in pending.get(key, {}).items()]
+    if not found:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    key, other, value = zip(*found)
+    return np.array(key, dtype=np.int64), np.array(other, dtype=np.int64), np.array(value)
+
+def missing(keys, other):
+    """Mask of the keys not found in the sorted array other"""
+    if not len(other):
+        return np.ones(len(keys), dtype=bool)
+    return other[np.searchsorted(other, keys).clip(max=len(other) - 1)] != keys
+
+class BufferedMatrix:
+    """Sparse matrix that takes additions without being rebuilt.
+
+    A compressed base (CSR, plus a CSC copy when columns are read) holds
+    most entries; additions go to per-row (and per-column) dicts, so an
+    update costs the size of its own entries. Reads add the two together.
+    The dicts are folded into the base once they grow past COMPACT_FRACTION
+    of it.
+    """
+
+    def __init__(self, matrix, by_column=False):
+        self.by_column = by_column
+        self.set_base(csr_matrix(matrix))
+
+    def set_base(self, base):
+        self.base = base
+        self.base_by_column = base.tocsc() if self.by_column else None
+        self.pending = {}  # row -> {col: value}
+        self.pending_by_column = {}  # col -> {row: value}, when by_column
+        self.size = 0
+
+    @property
+    def shape(self):
+        return self.base.shape
+
+    def resize(self, shape):
+        """Grow to shape; only the compressed index of the grown axis is extended"""
+        self.base.resize(shape)
+        if self.by_column:
+            self.base_by_column.resize(shape)
+
+    def add(self, rows, cols, values):
+        """Add values at (rows[i], cols[i]); entries that sum to zero are dropped"""
+        for row, col, value in zip(rows.tolist(), cols.tolist(), values.tolist()):
+            line = self.pending.setdefault(row, {})
+            total = line.get(col, 0.0) + value
+            self.size += (col not in line) - (total == 0)
+            if total:
+                line[col] = total
+            else:
+                line.pop(col, None)
+            if self.by_column:
+                column = self.pending_by_column.setdefault(col, {})
+                if total:
+                    column[row] = total
+                else:
+                    column.pop(row, None)
+        if self.size > max(COMPACT_MIN_ENTRIES, COMPACT_FRACTION * self.base.nnz):
+            self.compact()
+
+    def compact(self):
+        rows, cols, values = entries(self.pending, list(self.pending))
+        self.set_base(self.base + csr_matrix((values.astype(self.base.dtype), (rows, cols)), shape=self.shape))
+
+    def get(self, rows, cols):
+        """self[rows[i], cols[i]] for each i, as a flat array"""
+        values = lookup(self.base, rows, cols).astype(np.float64)
+        for i, (row, col) in enumerate(zip(rows.tolist(), cols.tolist())):
+            values[i] += self.pending.get(row, {}).get(col, 0.0)
+        return values
+
+    def rows(self, rows):
+        """Rows of the matrix as a CSR block, in the order given"""
+        keys, cols, values = entries(self.pending, rows.tolist())
+        position = np.searchsorted(np.sort(rows), keys)
+        order = np.argsort(rows, kind='stable')
+        added = csr_matrix((values.astype(self.base.dtype), (order[position], cols)), shape=(len(rows), self.shape[1]))
+        return self.base[rows] + added
+
+    def columns(self, cols):
+        """Columns of the matrix as a CSC block, in the order given"""
+        keys, rows, values = entries(self.pending_by_column, cols.tolist())
+        position = np.searchsorted(np.sort(cols), keys)
+        order = np.argsort(cols, kind='stable')
+        added = csr_matrix((values.astype(self.base.dtype), (rows, order[position])), shape=(self.shape[0], len(cols)))
+        return (self.base_by_column[:, cols] + added).tocsc()
+
+    def times_transpose(self, left):
+        """left @ self.T as a dense array, for a CSR block over the same columns"""
+        result = (left @ self.base_by_column.T).toarray()
+        # Pending entries only meet the columns left actually uses; walk whichever side is smaller
+        used = np.unique(left.indices)
+        columns = used.tolist() if len(used) < len(self.pending_by_column) else list(self.pending_by_column)
+        keys, rows, values = entries(self.pending_by_column, columns)
+        if len(keys):
+            pending = csr_matrix((values.astype(self.base.dtype), (keys, rows)), shape=self.shape[::-1])
+            added = (left @ pending).tocoo()
+            result[added.row, added.col] += added.data
+        return result
+
+class IncrementalModel:
+    """Neighbor model that absorbs new ratings without a rebuild.
+
+    Raw per-(title, user) rating sums and counts are kept for every rating,
+    popular or not, so the popularity filters can be re-applied as counts
+    cross their thresholds. A delta only touches the titles whose rating
+    vectors it changes: their norms and dot products are recomputed and
+    their neighbor lists rebuilt. Another title's list is patched only if it
+    held one of them or one of them now beats its k-th neighbor, and is
+    rebuilt in full only when a neighbor it held has dropped below its cut-off.
+
+    The rating matrices are BufferedMatrix instances and a reverse index
+    records which lists hold each title, so an update costs in proportion to
+    the ratings it adds and the titles they touch, not to the whole model.
+    The neighbor table is also kept as a similarity matrix (see
+    similarity_matrix) whose rows are rewritten in place.
+
+    Titles that enter the model are appended, so table rows keep their
+    positions as the model grows.
+    """
+
+    def __init__(self, ratings_books, k=NUM_NEIGHBORS, min_book_ratings=50, min_user_ratings=20):
+        self.k = k
+        self.min_book_ratings = min_book_ratings
+        self.min_user_ratings = min_user_ratings
+        titles = ratings_books['Book-Title'].astype('category')
+        users = ratings_books['User-ID'].astype('category')
+        self.title_names = titles.cat.categories.tolist()
+        self.user_names = users.cat.categories.tolist()
+        self.title_ids = dict(zip(self.title_names, range(len(self.title_names))))
+        self.user_ids = dict(zip(self.user_names, range(len(self.user_names))))
+        t = titles.cat.codes.to_numpy(dtype=np.int64)
+        u = users.cat.codes.to_numpy(dtype=np.int64)
+        shape = (len(self.title_names), len(self.user_names))
+
+        # Every rating, unfiltered; read by title for titles turning popular, by user for users turning active
+        counts = csr_matrix((np.ones(len(t)), (t, u)), shape=shape)
+        self.sums = BufferedMatrix(
+            csr_matrix((ratings_books['Book-Rating'].to_numpy(dtype=np.float64), (t, u)), shape=shape), by_column=True)
+        self.counts = BufferedMatrix(counts, by_column=True)
+        self.book_counts = np.bincount(t, minlength=shape[0])
+        self.popular = self.book_counts > min_book_ratings
+        self.user_counts = np.bincount(u[self.popular[t]], minlength=shape[1])
+        self.active = self.user_counts > min_user_ratings
+
+        # Model rows: popular titles with at least one active reader, in title order to start with
+        members = np.flatnonzero(self.popular & (counts @ self.active.astype(np.float64) > 0))
+        self.row_of = np.full(shape[0], -1, dtype=np.int64)
+        self.row_of[members] = np.arange(len(members))
+        self.titles = pd.Index([self.title_names[i] for i in members], dtype=object)
+        coo = counts[members].tocoo()
+        keep = self.active[coo.col]
+        item_user = csr_matrix((self.mean_ratings(members[coo.row[keep]], coo.col[keep]),
+                                (coo.row[keep], coo.col[keep])), shape=(len(members), shape[1]))
+        self.item_user = BufferedMatrix(item_user, by_column=True)
+        self.sq_norms = np.asarray(item_user.multiply(item_user).sum(axis=1), dtype=np.float64).ravel()
+
+        search = top_k_neighbors if exact_cost(item_user) <= EXACT_MAX_COST else lsh_neighbors
+        neighbors, scores = search(item_user, k)
+        self.neighbors = np.full((len(members), k), -1, dtype=np.int32)
+        self.scores = np.zeros((len(members), k), dtype=np.float32)
+        self.neighbors[:, :neighbors.shape[1]], self.scores[:, :scores.shape[1]] = neighbors, scores
+        self.similarity = similarity_matrix(self.model)
+        # listed_by[j, i] is 1 while title i lists title j
+        listed = self.neighbors >= 0
+        self.listed_by = BufferedMatrix(csr_matrix(
+            (np.ones(listed.sum()), (self.neighbors[listed], np.nonzero(listed)[0])), shape=(len(members),) * 2))
+
+    @property
+    def model(self):
+        """(titles, neighbors, scores), the same form build_model returns"""
+        return self.titles, self.neighbors, self.scores
+
+    def mean_ratings(self, t, u):
+        """Mean rating of each (title id, user id) pair, as build_model averages editions"""
+        return (self.sums.get(t, u) / self.counts.get(t, u)).astype(np.float32)
+
+    def update(self, new_ratings):
+        """Add ratings (User-ID, Book-Title, Book-Rating rows) and refresh
+        the affected neighbor lists; returns counts of what changed
+        """
+        t = encode(new_ratings['Book-Title'], self.title_ids, self.title_names)
+        u = encode(new_ratings['User-ID'], self.user_ids, self.user_names)
+        n_titles, n_users = len(self.title_names), len(self.user_names)
+        self.book_counts, self.user_counts = grow(self.book_counts, n_titles, 0), grow(self.user_counts, n_users, 0)
+        self.popular, self.active = grow(self.popular, n_titles, False), grow(self.active, n_users, False)
+        self.row_of = grow(self.row_of, n_titles, -1)
+
+        for matrix in (self.sums, self.counts):
+            matrix.resize((n_titles, n_users))
+        self.sums.add(t, u, new_ratings['Book-Rating'].to_numpy(dtype=np.float64))
+        self.counts.add(t, u, np.ones(len(t)))
+
+        # Re-apply the popularity filters; counts only grow, so titles and users only ever join
+        was_popular = self.popular.copy()
+        np.add.at(self.book_counts, t, 1)
+        rated = np.unique(t)
+        new_titles = rated[~self.popular[rated] & (self.book_counts[rated] > self.min_book_ratings)]
+        self.popular[new_titles] = True
+        by_title = self.counts.rows(new_titles).tocoo()
+        np.add.at(self.user_counts, u[was_popular[t]], 1)
+        np.add.at(self.user_counts, by_title.col, by_title.data.astype(np.int64))
+        raters = np.unique(np.concatenate([u, by_title.col]))
+        new_users = raters[~self.active[raters] & (self.user_counts[raters] > self.min_user_ratings)]
+        self.active[new_users] = True
+
+        # Pairs entering or changing in the filtered matrix: the delta's own,
+        # plus everything already rated on newly popular titles or by newly active users
+        by_user = self.counts.columns(new_users).tocoo()
+        pair_t = np.concatenate([t, new_titles[by_title.row], by_user.row])
+        pair_u = np.concatenate([u, by_title.col, new_users[by_user.col]])
+        keep = self.popular[pair_t] & self.active[pair_u]
+        keys = np.unique(pair_t[keep] * n_users + pair_u[keep])
+        pair_t, pair_u = keys // n_users, keys % n_users
+
+        joining = np.unique(pair_t[self.row_of[pair_t] < 0])
+        if len(joining):
+            self.add_rows(joining)
+        self.item_user.resize((len(self.titles), n_users))
+        rows = self.row_of[pair_t]
+        change = self.mean_ratings(pair_t, pair_u) - self.item_user.get(rows, pair_u)
+        changed = change != 0
+        self.item_user.add(rows[changed], pair_u[changed], change[changed])
+
+        changed_rows = np.unique(rows[changed])
+        vectors = self.item_user.rows(changed_rows)
+        self.sq_norms[changed_rows] = np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel()
+        patched, rebuilt = self.refresh(changed_rows)
+        return {
+            'ratings': len(t),
+            'newTitles': len(joining),
+            'newUsers': len(new_users),
+            'changedTitles': len(changed_rows),
+            'patchedTitles': patched,
+            'rebuiltTitles': rebuilt,
+        }
+
+    def add_rows(self, title_ids):
+        start = len(self.titles)
+        self.row_of[title_ids] = start + np.arange(len(title_ids))
+        self.titles = self.titles.append(pd.Index([self.title_names[i] for i in title_ids], dtype=object))
+        self.neighbors = np.concatenate([self.neighbors, np.full((len(title_ids), self.k), -1, dtype=np.int32)])
+        self.scores = np.concatenate([self.scores, np.zeros((len(title_ids), self.k), dtype=np.float32)])
+        self.sq_norms = np.concatenate([self.sq_norms, np.zeros(len(title_ids))])
+        # New titles widen every row of the similarity matrix, so it is the one thing rebuilt here
+        self.similarity = similarity_matrix(self.model)
+        self.listed_by.resize((len(self.titles),) * 2)
+
+    def similarities(self, rows):
+        """Cosine of each of `rows` against every title, in dense blocks of (rows, scores)"""
+        norms = np.sqrt(self.sq_norms).astype(np.float32)
+        block = max(1, BLOCK_CELLS // max(len(self.titles), 1))
+        for start in range(0, len(rows), block):
+            part = rows[start:start + block]
+            sim = self.item_user.times_transpose(self.item_user.rows(part)).astype(np.float32, copy=False)
+            sim /= norms[part][:, None] * norms
+            sim[np.arange(len(part)), part] = 0  # Not its own neighbor
+            yield part, sim
+
+    def set_rows(self, part, sim):
+        """Write the top-k of a dense similarity block into the neighbor table"""
+        self.write_rows(part, *dense_top_k(sim, self.k))
+
+    def write_rows(self, rows, neighbors, scores):
+        """Replace the neighbor lists of rows, keeping the reverse index and similarity matrix in step"""
+        # Each list sorted and offset by its position, so all of them form one sorted
+        # array and a single searchsorted finds the entries that came or went
+        stride = len(self.titles) + 1
+        offsets = np.arange(len(rows))[:, None] * stride + 1  # +1 keeps empty slots (-1) in their row
+        old = (np.sort(self.neighbors[rows], axis=1) + offsets).ravel()
+        new = (np.sort(neighbors, axis=1) + offsets).ravel()
+        dropped, added = old[missing(old, new)], new[missing(new, old)]
+        keys = np.concatenate([dropped, added])
+        listed = keys % stride > 0
+        self.listed_by.add(keys[listed] % stride - 1, rows[keys[listed] // stride],
+                           np.concatenate([-np.ones(len(dropped)), np.ones(len(added))])[listed])
+        self.neighbors[rows], self.scores[rows] = neighbors, scores
+        set_similarity_rows(self.similarity, rows, neighbors, scores)
+
+    def refresh(self, changed_rows):
+        """Rebuild the lists of changed titles and patch their neighbors' lists"""
+        if not len(changed_rows):
+            return 0, 0
+        is_changed = np.zeros(len(self.titles), dtype=bool)
+        is_changed[changed_rows] = True
+        # Another title's list only moves if it held a changed title or a
+        # changed title now beats its k-th neighbor (any positive score, if
+        # the list has free slots)
+        holders = self.listed_by.rows(changed_rows)
+        held_changed = np.unique(holders.indices[holders.data > 0])
+        cutoff = np.where(self.neighbors[:, -1] >= 0, self.scores[:, -1], np.finfo(np.float32).tiny)
+        cutoff[is_changed] = np.inf
+
+        # Cosine is symmetric, so each changed title's row of scores is also
+        # its new entry in every other title's list
+        positions, targets, entries = [], [], []
+        for part, sim in self.similarities(changed_rows):
+            position, target = np.nonzero(sim >= cutoff)
+            positions.append(part[position])
+            targets.append(target)
+            entries.append(sim[position, target])
+            self.set_rows(part, sim)
+        changed_by, targets, entries = (np.concatenate(column) for column in (positions, targets, entries))
+
+        patch = np.union1d(held_changed[~is_changed[held_changed]], targets)
+        slot = np.full(len(self.titles), -1, dtype=np.int64)
+        slot[patch] = np.arange(len(patch))
+        old_neighbors, old_scores = self.neighbors[patch], self.scores[patch]
+        kept = (old_neighbors >= 0) & ~is_changed[old_neighbors]
+        neighbors, scores = keep_top_k(
+            np.concatenate([np.nonzero(kept)[0], slot[targets]]),
+            np.concatenate([old_neighbors[kept], changed_by]).astype(np.int64),
+            np.concatenate([old_scores[kept], entries]),
+            len(patch), self.k,
+        )
+        # A full list whose k-th score fell may now rank below a title it never listed
+        new_kth = np.where(neighbors[:, -1] >= 0, scores[:, -1], -np.inf)
+        stale = (old_neighbors[:, -1] >= 0) & (new_kth < old_scores[:, -1])
+        self.write_rows(patch[~stale], neighbors[~stale], scores[~stale])
+        for part, sim in self.similarities(patch[stale]):
+            self.set_rows(part, sim)
+        return int((~stale).sum()), len(changed_rows) + int(stale.sum())
+
+class ALSModel:
+    """Latent factor model that folds new ratings in without a rebuild.
+
+    A delta re-solves the factors of the users who rated, with the item
+    factors held fixed (new users are folded in the same way), then the
+    factors of the titles they rated, with the user factors held fixed: one
+    ALS half-step each, over just the rows the delta touches. Both Gram
+    matrices are kept current as those rows change, so no update reads the
+    other rows' factors.
+
+    Item neighbors are cosines between item factors. They are rebuilt for the
+    re-solved titles, for the titles that list one of them, and for the
+    titles whose k-th neighbor one of them now beats.
+
+    The titles are those that pass the popularity filters at build time.
+    Ratings of other titles wait for the next rebuild.
+    """
+
+    # User recommendations fold a history in rather than walking the neighbor table
+    similarity = None
+
+    def __init__(self, ratings_books, k=NUM_NEIGHBORS, min_book_ratings=50, min_user_ratings=20,
+                 regularization=ALS_REGULARIZATION, alpha=ALS_ALPHA):
+        self.k = k
+        self.regularization = regularization
+        self.alpha = alpha
+        ratings_books = filter_popular(ratings_books, min_book_ratings, min_user_ratings)
+        titles, users = ratings_books['Book-Title'], ratings_books['User-ID']
+        self.titles = titles.cat.categories
+        self.user_names = users.cat.categories.tolist()
+        self.user_ids = dict(zip(self.user_names, range(len(self.user_names))))
+        t = titles.cat.codes.to_numpy(dtype=np.int64)
+        u = users.cat.codes.to_numpy(dtype=np.int64)
+        shape = (len(self.titles), len(self.user_names))
+
+        # A user rating several editions of a title counts once, with their mean rating, as in build_model
+        self.sums = BufferedMatrix(
+            csr_matrix((ratings_books['Book-Rating'].to_numpy(dtype=np.float64), (t, u)), shape=shape), by_column=True)
+        self.counts = BufferedMatrix(csr_matrix((np.ones(len(t)), (t, u)), shape=shape), by_column=True)
+        counts = self.counts.base
+        item_user = csr_matrix((self.sums.base.data / counts.data, counts.indices, counts.indptr), shape=shape)
+        self.item_user = BufferedMatrix(item_user.astype(np.float32), by_column=True)
+
+        self.item_factors, self.user_factors = als_factors(item_user, regularization=regularization, alpha=alpha)
+        self.item_gram = self.item_factors.T.astype(np.float64) @ self.item_factors
+        self.user_gram = self.user_factors.T.astype(np.float64) @ self.user_factors
+        self.unit = normalize(self.item_factors)
+        self.neighbors, self.scores = factor_neighbors(self.item_factors, k)
+
+    @property
+    def model(self):
+        """(titles, neighbors, scores), the same form build_model returns"""
+        return self.titles, self.neighbors, self.scores
+
+    def mean_ratings(self, t, u):
+        return (self.sums.get(t, u) / self.counts.get(t, u)).astype(np.float32)
+
+    def regularized(self, gram):
+        """One side's Gram matrix plus the regularization, as als_solve takes it"""
+        return (gram + self.regularization * np.eye(len(gram))).astype(np.float32)
+
+    def update(self, new_ratings):
+        """Add ratings (User-ID, Book-Title, Book-Rating rows), re-solve the
+        factors they touch and refresh the affected neighbor lists; returns
+        counts of what changed
+        """
+        t = self.titles.get_indexer(new_ratings['Book-Title'])
+        known = t >= 0
+        t = t[known]
+        u = encode(new_ratings['User-ID'].to_numpy()[known], self.user_ids, self.user_names)
+        n_users = len(self.user_names)
+        new_users = n_users - len(self.user_factors)
+        self.user_factors = np.concatenate([self.user_factors, np.zeros((new_users, self.user_factors.shape[1]),
+                                                                        dtype=np.float32)])
+        for matrix in (self.sums, self.counts, self.item_user):
+            matrix.resize((len(self.titles), n_users))
+        self.sums.add(t, u, new_ratings['Book-Rating'].to_numpy(dtype=np.float64)[known])
+        self.counts.add(t, u, np.ones(len(t)))
+        keys = np.unique(t * n_users + u)
+        pair_t, pair_u = keys // n_users, keys % n_users
+        change = self.mean_ratings(pair_t, pair_u) - self.item_user.get(pair_t, pair_u)
+        changed = change != 0
+        self.item_user.add(pair_t[changed], pair_u[changed], change[changed])
+
+        users, rated = np.unique(u), np.unique(t)
+        solved = als_solve(self.item_user.columns(users).T.tocsr(), self.item_factors, self.user_factors[users],
+                           self.regularized(self.item_gram), self.alpha, ALS_FOLD_IN_STEPS)
+        self.user_gram += solved.T.astype(np.float64) @ solved
+        self.user_gram -= self.user_factors[users].T.astype(np.float64) @ self.user_factors[users]
+        self.user_factors[users] = solved
+        solved = als_solve(self.item_user.rows(rated), self.user_factors, self.item_factors[rated],
+                           self.regularized(self.user_gram), self.alpha, ALS_FOLD_IN_STEPS)
+        self.item_gram += solved.T.astype(np.float64) @ solved
+        self.item_gram -= self.item_factors[rated].T.astype(np.float64) @ self.item_factors[rated]
+        self.item_factors[rated] = solved
+        self.unit[rated] = normalize(solved)
+        return {
+            'ratings': len(t),
+            'deferredRatings': int((~known).sum()),
+            'newUsers': new_users,
+            'changedUsers': len(users),
+            'changedTitles': len(rated),
+            'refreshedTitles': self.refresh(rated),
+        }
+
+    def similarities(self, rows):
+        """Cosine of each of `rows` against every title in factor space, in dense blocks of (rows, scores)"""
+        block = max(1, BLOCK_CELLS // max(len(self.titles), 1))
+        for start in range(0, len(rows), block):
+            part = rows[start:start + block]
+            sim = self.unit[part] @ self.unit.T
+            sim[np.arange(len(part)), part] = 0  # Not its own neighbor
+            yield part, sim
+
+    def refresh(self, changed_rows):
+        """Rebuild the neighbor lists that re-solving changed_rows can move; returns how many"""
+        if not len(changed_rows):
+            return 0
+        is_changed = np.zeros(len(self.titles), dtype=bool)
+        is_changed[changed_rows] = True
+        affected = is_changed.copy()
+        affected |= (is_changed[self.neighbors] & (self.neighbors >= 0)).any(axis=1)
+        cutoff = np.where(self.neighbors[:, -1] >= 0, self.scores[:, -1], np.finfo(np.float32).tiny)
+        # Cosine is symmetric: a changed title's row is also its score in every other title's list
+        for _, sim in self.similarities(changed_rows):
+            affected |= (sim >= cutoff).any(axis=0)
+        rows = np.flatnonzero(affected)
+        for part, sim in self.similarities(rows):
+            self.neighbors[part], self.scores[part] = dense_top_k(sim, self.k)
+        return len(rows)
+
+    def recommend_for_users(self, histories, num_recommendations=5):
+        """Top-N unread titles for each of many user histories ({title: rating}),
+        from factors folded in from the history, as (titles, scores) pairs of lists
+        """
+        profiles = profile_matrix(histories, self.titles)
+        factors = fold_in(profiles, self.item_factors, self.regularization, self.alpha, self.regularized(self.item_gram))
+        return recommend_from_factors(factors, self.item_factors, self.titles, profiles, num_recommendations)
+
+def load_model(data_dir=DATA_DIR, backend=None):
+    """Load the ratings and build everything the API serves: (live model, cover images).
+
+    The live model is an IncrementalModel, or an ALSModel when backend
+    (default MODEL_BACKEND) is 'als'; both take new ratings through update().
+    """
+    ratings_books = read_data_cache(data_dir)
+    live = ALSModel(ratings_books) if (backend or MODEL_BACKEND) == 'als' else IncrementalModel(ratings_books)
+    return live, cover_images(filter_popular(ratings_books), live.titles)
+
+# ------------------------------------------
+# Recommendation Function
+# ------------------------------------------
+
+def recommend_batch(book_titles, model, num_recommendations=5):
+    """Recommendations for many titles in one table lookup: a (titles, scores)
+    pair of lists per query, empty for titles the model does not know
+    """
+    titles, neighbors, scores = model
+    rows = titles.get_indexer(book_titles)
+    table = np.where(rows[:, None] >= 0, neighbors[rows, :num_recommendations], -1)
+    # Rows are sorted best first with empty slots (-1) at the end, so each
+    # query's recommendations are a prefix of its row
+    counts = (table >= 0).sum(axis=1)
+    names = titles[table[table >= 0]].tolist()
+    ends = np.cumsum(counts).tolist()
+    return [
+        (names[end - count:end], row_scores[:count].tolist())
+        for end, count, row_scores in zip(ends, counts.tolist(), scores[rows, :num_recommendations])
+    ]
+
+def recommend_books(book_title, model, num_recommendations=5):
+    return recommend_batch([book_title], model, num_recommendations)[0][0]
+
+# ------------------------------------------
+# User Profile Recommendations
+# ------------------------------------------
+
+def similarity_matrix(model):
+    """The neighbor table as a sparse titles x titles matrix: row i holds
+    the scores of i's neighbors.
+
+    Every row has one slot per table column, empty slots holding a zero, so
+    a row can be rewritten in place (set_similarity_rows) when its list changes.
+    """
+    titles, neighbors, scores = model
+    n, k = neighbors.shape
+    similarity = csr_matrix((np.zeros(n * k, dtype=np.float32), np.zeros(n * k, dtype=np.int32),
+                             np.arange(0, n * k + 1, k)), shape=(len(titles), len(titles)))
+    set_similarity_rows(similarity, np.arange(n), neighbors, scores)
+    return similarity
+
+def set_similarity_rows(similarity, rows, neighbors, scores):
+    """Overwrite rows of a similarity_matrix with new neighbor lists"""
+    k = neighbors.shape[1]
+    slots = (rows[:, None] * k + np.arange(k)).ravel()
+    # Empty slots point at the row's own title, which is never its neighbor
+    similarity.indices[slots] = np.where(neighbors >= 0, neighbors, rows[:, None]).ravel()
+    similarity.data[slots] = scores.ravel()
+    similarity.has_canonical_format = False
+
+def profile_matrix(histories, titles):
+    """Sparse users x titles matrix of ratings from {title: rating} histories;
+    titles the model does not know are left out
+    """
+    names = [title for history in histories for title in history]
+    ratings = np.fromiter((rating for history in histories for rating in history.values()), np.float32, len(names))
+    rows = np.repeat(np.arange(len(histories)), [len(history) for history in histories])
+    cols = titles.get_indexer(names)
+    known = cols >= 0
+    return csr_matrix((ratings[known], (rows[known], cols[known])), shape=(len(histories), len(titles)))
+
+def recommend_for_users(histories, model, num_recommendations=5, similarity=None):
+    """Top-N unread titles for each of many user histories ({title: rating}),
+    as a (titles, scores) pair of lists per user.
+
+    A title scores the sum of rating x similarity over the books the user
+    rated, so a block of users is scored by one sparse product of their
+    profiles with the neighbor table. Pass similarity (from
+    similarity_matrix) to reuse it across calls.
+    """
+    titles = model[0]
+    similarity = similarity_matrix(model) if similarity is None else similarity
+    profiles = profile_matrix(histories, titles)
+    block = max(1, BLOCK_CELLS // max(len(titles), 1))
+    results = []
+    for start in range(0, len(histories), block):
+        part = profiles[start:start + block]
+        scores = (part @ similarity).toarray()
+        scores[part.nonzero()] = 0  # Already read
+        top, top_scores = dense_top_k(scores, num_recommendations)
+        for row, row_scores in zip(top, top_scores):
+            listed = row >= 0
+            results.append((titles[row[listed]].tolist(), row_scores[listed].tolist()))
+    return results
+
+def recommend_for_user(history, model, num_recommendations=5, similarity=None):
+    return recommend_for_users([history], model, num_recommendations, similarity)[0]
@@ -0,0 +1,81 @@
+"""Tests for the cover thumbnail cache"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmark import write_fixture_covers
+from covers import NO_COVER, CoverCache, fixture_fetcher
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    directory = tmp_path / "fixtures"
+    directory.mkdir()
+    return write_fixture_covers(str(directory), n=6, placeholders=4), fixture_fetcher(str(directory))
+
+
+def ref_files(cache):
+    return set(os.listdir(cache.ref_dir))
+
+
+def test_evicting_a_thumbnail_removes_its_refs(tmp_path, fixtures):
+    urls, fetch = fixtures
+    covers = urls[:6]
+    sizes = CoverCache(str(tmp_path / "probe"), 2 ** 40, fetch=fetch)
+    budget = sum(sorted(os.path.getsize(sizes.blob_path(sizes.get(url))) for url in covers)[:2])
+
+    cache = CoverCache(str(tmp_path / "cache"), budget, fetch=fetch)
+    for url in covers:
+        cache.get(url)
+
+    kept = [url for url in covers if cache.lookup(url) is not None]
+    assert 1 <= len(kept) < len(covers)
+    assert cache.summary()["evictions"] == len(covers) - len(kept)
+    # Only the kept thumbnails' refs remain, on disk and in the index
+    assert ref_files(cache) == {cache.ref_name(url) for url in kept} == set(cache.refs)
+    assert len(os.listdir(cache.blob_dir)) == len(kept)
+
+    # A restart rebuilds the same index, dropping refs left dangling by another process
+    os.remove(cache.blob_path(cache.lookup(kept[0])))
+    reopened = CoverCache(str(tmp_path / "cache"), budget, fetch=fetch)
+    assert set(reopened.refs) == {cache.ref_name(url) for url in kept[1:]}
+    assert ref_files(reopened) == set(reopened.refs)
+
+
+def test_no_cover_refs_are_capped_and_expire(tmp_path, fixtures):
+    urls, fetch = fixtures
+    placeholders = urls[6:]
+    cache = CoverCache(str(tmp_path / "cache"), 2 ** 40, fetch=fetch, max_no_cover=3)
+    for url in placeholders:
+        assert cache.get(url) is None
+
+    # The oldest negative ref made room for the newest
+    assert ref_files(cache) == {cache.ref_name(url) for url in placeholders[1:]}
+    assert cache.lookup(placeholders[0]) is None
+    assert cache.lookup(placeholders[-1]) == NO_COVER
+
+    # Past the TTL a negative ref is dropped and the URL fetched again
+    stale = time.time() - cache.no_cover_ttl - 60
+    os.utime(cache.ref_path(placeholders[-1]), (stale, stale))
+    misses = cache.summary()["misses"]
+    assert cache.get(placeholders[-1]) is None
+    assert cache.summary()["misses"] == misses + 1
+    assert cache.lookup(placeholders[-1]) == NO_COVER
+    assert cache.summary()["noCoverRefs"] == 3
+
+
+def test_counters_are_exact_under_concurrency(tmp_path, fixtures):
+    urls, fetch = fixtures
+    cache = CoverCache(str(tmp_path / "cache"), 2 ** 40, fetch=fetch)
+    with ThreadPoolExecutor(16) as pool:
+        # Concurrent misses on one URL fetch it once, so count once
+        list(pool.map(cache.get, urls * 8))
+        assert cache.summary()["misses"] == len(urls)
+        hits = cache.summary()["hits"]
+        list(pool.map(cache.get, urls * 500))
+    summary = cache.summary()
+    assert summary["hits"] - hits == len(urls) * 500
+    assert summary["misses"] == len(urls)
+    assert summary["refs"] == len(urls)